@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserProfile, Team, Activity, Leaderboard, Workout
+from .models import UserProfile, Team, Activity, ActivityRollup, Leaderboard, Workout, Job
 
 
 @admin.register(UserProfile)
@@ -30,10 +30,19 @@ class ActivityAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at', '_id')
 
 
+@admin.register(ActivityRollup)
+class ActivityRollupAdmin(admin.ModelAdmin):
+    """Admin interface for ActivityRollup"""
+    list_display = ('user', 'activity_type', 'day', 'total_activities', 'total_duration_minutes')
+    list_filter = ('activity_type', 'day')
+    search_fields = ('user__username',)
+    readonly_fields = ('updated_at', '_id')
+
+
 @admin.register(Leaderboard)
 class LeaderboardAdmin(admin.ModelAdmin):
     """Admin interface for Leaderboard"""
-    list_display = ('rank', 'user', 'team', 'total_activities', 'points')
+    list_display = ('rank', 'team_rank', 'user', 'team', 'total_activities', 'points')
     list_filter = ('rank', 'team', 'updated_at')
     search_fields = ('user__username', 'team__name')
     readonly_fields = ('updated_at', '_id')
@@ -47,3 +56,12 @@ class WorkoutAdmin(admin.ModelAdmin):
     list_filter = ('fitness_level', 'workout_type', 'is_completed', 'suggested_date')
     search_fields = ('title', 'user__username', 'description')
     readonly_fields = ('created_at', 'updated_at', '_id')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Admin interface for Job"""
+    list_display = ('key', 'kind', 'status', 'attempts', 'run_after', 'locked_by')
+    list_filter = ('kind', 'status')
+    search_fields = ('key', 'last_error')
+    readonly_fields = ('created_at', 'updated_at', '_id')
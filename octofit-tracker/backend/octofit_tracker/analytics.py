@@ -0,0 +1,251 @@
+"""Columnar in-memory copy of the activity table for vectorized analytics
+
+Percentile, histogram and top-K questions across every user ("what percentile
+is my weekly distance?") touch each activity once per query, which row-by-row
+ORM access cannot do quickly. ActivityColumns holds one compact NumPy array
+per field - user index, activity type code, date as epoch seconds, duration,
+distance and calories - so those queries become a mask and a bincount.
+
+Each process loads the columns once, in chunks, then keeps them current by
+appending activities whose _id is past the last one loaded, at most every
+ANALYTICS_SYNC_SECONDS. Appends cannot see edits or deletes: activity updates
+and deletes advance a generation counter in the shared cache, and a row count
+that no longer matches (e.g. after raw deletes) also forces a full reload.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from .caching import bump, current_version
+from .models import Activity
+
+GENERATION_KEY = 'analytics:generation'
+
+ACTIVITY_TYPES = [name for name, _ in Activity._meta.get_field('activity_type').choices]
+TYPE_CODES = {name: code for code, name in enumerate(ACTIVITY_TYPES)}
+COLUMNS = {
+    'user': np.int32,
+    'type': np.int8,
+    'timestamp': np.int64,
+    'duration': np.int32,
+    'distance': np.float32,
+    'calories': np.int32,
+}
+# Query metrics and the column each sums; activities are counted
+METRICS = {'activities': None, 'duration': 'duration', 'distance': 'distance', 'calories': 'calories'}
+LOAD_CHUNK = 50000
+MIN_CAPACITY = 1024
+
+
+def mark_stale():
+    """Make every process reload its columns on the next sync"""
+    bump(GENERATION_KEY)
+
+
+class ActivityColumns:
+    """NumPy column arrays of every activity, grown by appends"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, generation=None):
+        self.arrays = {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+        self.size = 0
+        self.user_ids = []
+        self.user_index = {}
+        self.last_id = None
+        self.generation = generation
+        self.synced_at = None
+
+    def reserve(self, size):
+        """Grow every column to hold `size` rows, doubling capacity to keep appends amortized O(1)"""
+        capacity = len(self.arrays['user'])
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, MIN_CAPACITY)
+        for name, array in self.arrays.items():
+            grown = np.empty(capacity, array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.arrays[name] = grown
+
+    def index_user(self, user_id):
+        index = self.user_index.get(user_id)
+        if index is None:
+            index = self.user_index[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+        return index
+
+    def append(self, rows):
+        """Append (pk, user_id, activity_type, activity_date, duration, distance, calories) rows"""
+        if not rows:
+            return
+        pks, user_ids, types, dates, durations, distances, calories = zip(*rows)
+        other = TYPE_CODES['other']
+        values = {
+            'user': [self.index_user(user_id) for user_id in user_ids],
+            'type': [TYPE_CODES.get(activity_type, other) for activity_type in types],
+            'timestamp': [int(date.timestamp()) for date in dates],
+            'duration': durations,
+            'distance': [distance or 0 for distance in distances],
+            'calories': [value or 0 for value in calories],
+        }
+        end = self.size + len(rows)
+        self.reserve(end)
+        for name, column in values.items():
+            self.arrays[name][self.size:end] = column
+        self.size = end
+        self.last_id = pks[-1]
+
+    def load(self, activities):
+        """Append activities in _id order, LOAD_CHUNK rows at a time"""
+        rows = activities.order_by('_id').values_list(
+            '_id', 'user_id', 'activity_type', 'activity_date', 'duration_minutes', 'distance_km', 'calories_burned'
+        )
+        batch = []
+        for row in rows.iterator(chunk_size=LOAD_CHUNK):
+            batch.append(row)
+            if len(batch) == LOAD_CHUNK:
+                self.append(batch)
+                batch = []
+        self.append(batch)
+
+    def sync(self, force=False):
+        """Bring the columns up to date, at most every ANALYTICS_SYNC_SECONDS unless forced"""
+        with self.lock:
+            now = time.monotonic()
+            if not force and self.synced_at is not None and now - self.synced_at < settings.ANALYTICS_SYNC_SECONDS:
+                return
+            generation = current_version(GENERATION_KEY)
+            if generation != self.generation:
+                self.reset(generation)
+            activities = Activity.objects.all()
+            self.load(activities if self.last_id is None else activities.filter(_id__gt=self.last_id))
+            if activities.count() != self.size:
+                self.reset(generation)
+                self.load(activities)
+            self.synced_at = now
+
+    def snapshot(self):
+        """Synced read-only views of the columns plus the user id of each user index"""
+        self.sync()
+        with self.lock:
+            columns = {name: array[:self.size] for name, array in self.arrays.items()}
+            columns['user_ids'] = np.array(self.user_ids, dtype=np.int64)
+            return columns
+
+    def footprint(self):
+        """Rows held and memory used, with the cost extrapolated per million rows"""
+        self.sync()
+        with self.lock:
+            bytes_per_row = sum(np.dtype(dtype).itemsize for dtype in COLUMNS.values())
+            return {
+                'rows': self.size,
+                'users': len(self.user_ids),
+                'bytes_per_row': bytes_per_row,
+                'bytes_used': self.size * bytes_per_row,
+                'bytes_allocated': sum(array.nbytes for array in self.arrays.values()),
+                'mb_per_million_rows': round(bytes_per_row * 1_000_000 / 2 ** 20, 2),
+                'columns': {name: np.dtype(dtype).name for name, dtype in COLUMNS.items()},
+            }
+
+
+activity_columns = ActivityColumns()
+
+
+def parse_analytics_params(params, default_days=7):
+    """Read `metric`, `days` (0 for all time) and `activity_type` query params"""
+    metric = params.get('metric', 'distance')
+    if metric not in METRICS:
+        raise ValueError(f"Invalid 'metric', expected one of: {', '.join(METRICS)}")
+    try:
+        days = int(params.get('days', default_days))
+    except ValueError:
+        raise ValueError("Invalid 'days', expected an integer")
+    if days < 0:
+        raise ValueError("Invalid 'days', expected 0 or more")
+    activity_type = params.get('activity_type')
+    if activity_type and activity_type not in TYPE_CODES:
+        raise ValueError(f"Invalid 'activity_type', expected one of: {', '.join(ACTIVITY_TYPES)}")
+    return metric, days, activity_type
+
+
+def window_mask(columns, days=0, activity_type=None):
+    """Rows within the last `days` calendar days (all rows for 0), optionally of one type"""
+    mask = np.ones(len(columns['user']), dtype=bool)
+    if days:
+        start = timezone.localdate() - timedelta(days=days - 1)
+        start = datetime(start.year, start.month, start.day)
+        if settings.USE_TZ:
+            start = timezone.make_aware(start)
+        mask &= columns['timestamp'] >= int(start.timestamp())
+    if activity_type:
+        mask &= columns['type'] == TYPE_CODES[activity_type]
+    return mask
+
+
+def user_totals(columns, metric, mask):
+    """Metric total per user index over the masked rows, and which users have any such rows"""
+    users = columns['user'][mask]
+    count = np.bincount(users, minlength=len(columns['user_ids']))
+    if METRICS[metric] is None:
+        return count.astype(np.float64), count > 0
+    weights = columns[METRICS[metric]][mask].astype(np.float64)
+    return np.bincount(users, weights=weights, minlength=len(columns['user_ids'])), count > 0
+
+
+def percentile_rank(columns, user_id, metric, mask):
+    """Where one user's total falls among every user active in the window"""
+    totals, active = user_totals(columns, metric, mask)
+    indexes = np.flatnonzero(columns['user_ids'] == user_id)
+    value = float(totals[indexes[0]]) if len(indexes) else 0.0
+    population = totals[active]
+    if not (len(indexes) and active[indexes[0]]):
+        population = np.append(population, value)
+    below = int(np.count_nonzero(population < value))
+    equal = int(np.count_nonzero(population == value))
+    quantiles = np.percentile(population, [50, 90, 99])
+    return {
+        'user_id': user_id,
+        'value': round(value, 3),
+        'percentile': round(100 * (below + equal / 2) / len(population), 2),
+        'rank': int(np.count_nonzero(population > value)) + 1,
+        'population': len(population),
+        'p50': round(float(quantiles[0]), 3),
+        'p90': round(float(quantiles[1]), 3),
+        'p99': round(float(quantiles[2]), 3),
+    }
+
+
+def histogram(columns, metric, mask, bins=20, per='user'):
+    """Distribution of per-user totals, or of single activity values with per='activity'"""
+    if per == 'user':
+        totals, active = user_totals(columns, metric, mask)
+        values = totals[active]
+    elif METRICS[metric] is None:
+        raise ValueError("Metric 'activities' can only be histogrammed per user")
+    else:
+        values = columns[METRICS[metric]][mask]
+    counts, edges = np.histogram(values, bins=bins)
+    return {
+        'count': int(len(values)),
+        'counts': counts.tolist(),
+        'edges': [round(float(edge), 3) for edge in edges],
+    }
+
+
+def top_users(columns, metric, mask, k=10):
+    """The `k` users with the highest totals, ties broken by user id"""
+    totals, active = user_totals(columns, metric, mask)
+    candidates = np.flatnonzero(active)
+    if len(candidates) > k:
+        # Keep every user tied with the k-th best so the tie-break below is exact
+        threshold = np.partition(totals[candidates], len(candidates) - k)[len(candidates) - k]
+        candidates = candidates[totals[candidates] >= threshold]
+    order = np.lexsort((columns['user_ids'][candidates], -totals[candidates]))[:k]
+    return [
+        {'rank': rank, 'user_id': int(columns['user_ids'][index]), 'value': round(float(totals[index]), 3)}
+        for rank, index in enumerate(candidates[order], 1)
+    ]
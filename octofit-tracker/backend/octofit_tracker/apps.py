@@ -0,0 +1,25 @@
+from django.apps import AppConfig
+
+
+class OctofitTrackerConfig(AppConfig):
+    """App configuration for Octofit Tracker"""
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'octofit_tracker'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.models.signals import post_migrate
+        from pymongo import monitoring
+        from . import signals  # noqa: F401
+        from .mongo import ensure_partial_indexes
+        from .monitoring import command_timer, pool_monitor
+        post_migrate.connect(ensure_partial_indexes, sender=self)
+        # Registered globally so they apply to the MongoClient djongo creates on first connect
+        monitoring.register(pool_monitor)
+        if settings.METRICS_ENABLED:
+            monitoring.register(command_timer)
+        if settings.SLOW_QUERY_THRESHOLD_MS > 0:
+            from django.db.backends.signals import connection_created
+            from .slow_queries import SlowQueryListener, install_sql_capture
+            monitoring.register(SlowQueryListener(settings.SLOW_QUERY_THRESHOLD_MS, settings.SLOW_QUERY_EXPLAIN))
+            connection_created.connect(install_sql_capture)
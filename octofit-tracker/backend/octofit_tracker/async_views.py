@@ -0,0 +1,151 @@
+"""Async read-only versions of the hottest API endpoints, served under /api/async/
+
+These are plain Django async views rather than DRF views (DRF 3.14 has no async
+support). They use the async ORM and the fast serializers. Output matches the
+sync endpoints row for row; list endpoints return one page of up to
+`page_size` results without cursor links.
+
+Django 4.1's async ORM is a wrapper: every query runs through
+sync_to_async(thread_sensitive=True), so each database call still occupies a
+thread, and under ASGI the calls of all requests share that one
+thread-sensitive executor. These views do not keep slow queries off threads;
+that would take an async driver underneath djongo. No load test comparing them
+with the sync endpoints has been run; `manage.py load_test` produces one.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.http import JsonResponse
+from .caching import GLOBAL_SCOPE, acached_response_data, team_scope
+from .conditional import aetag_for, leaderboard_querysets, not_modified
+from .fast_serializers import fast_activity_serializer, fast_leaderboard_serializer, fast_workout_serializer
+from .models import Activity, ActivityRollup, Leaderboard, Team, Workout
+from .mongo import parse_pk
+from .pagination import KeysetCursorPagination
+from .serializers import fieldset_key
+from .stats import (
+    aactivity_totals, agrouped_activity_totals, filter_date_window,
+    parse_date_window, parse_group_by, sum_totals
+)
+
+
+async def request_user(request):
+    """Resolve the session user without touching the database from the event loop"""
+    return await sync_to_async(get_user)(request)
+
+
+def error(message, status):
+    """JSON error body in the same shape the DRF views return"""
+    return JsonResponse({'error': message}, status=status)
+
+
+def not_authenticated():
+    return error('Authentication credentials were not provided.', 403)
+
+
+async def aconditional(request, etag, build):
+    """Async build() tagged with `etag`, or 304 when the client already holds it"""
+    response = not_modified(request, etag)
+    if response is None:
+        response = await build()
+        if response.status_code == 200:
+            response['ETag'] = etag
+    return response
+
+
+def page_size(request):
+    """Requested page size, capped like the cursor paginators"""
+    try:
+        size = int(request.GET.get('page_size', settings.REST_FRAMEWORK['PAGE_SIZE']))
+    except ValueError:
+        size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    return max(1, min(size, KeysetCursorPagination.max_page_size))
+
+
+async def activity_list(request):
+    """Newest activities for the current user, or for `user_id`"""
+    user = await request_user(request)
+    if not user.is_authenticated:
+        return not_authenticated()
+    user_id = request.GET.get('user_id') or user.pk
+    serializer = fast_activity_serializer.for_params(request.GET)
+    activities = Activity.objects.filter(user_id=user_id).order_by('-activity_date', '-_id')
+    rows = serializer.values(activities)[:page_size(request)]
+    return JsonResponse({'results': await serializer.aserialize(rows)})
+
+
+async def activity_statistics(request):
+    """Activity statistics from the daily rollups, optionally grouped and windowed"""
+    user = await request_user(request)
+    if not user.is_authenticated:
+        return not_authenticated()
+    try:
+        start, end = parse_date_window(request.GET)
+        group_by = parse_group_by(request.GET)
+    except ValueError as exc:
+        return error(str(exc), 400)
+
+    user_id = request.GET.get('user_id') or user.pk
+    rollups = filter_date_window(ActivityRollup.objects.filter(user_id=user_id), start, end)
+    if not group_by:
+        return JsonResponse(await aactivity_totals(rollups))
+
+    groups = await agrouped_activity_totals(rollups, group_by)
+    return JsonResponse({**sum_totals(groups), 'group_by': group_by, 'groups': groups})
+
+
+async def leaderboard_list(request):
+    """Best ranked leaderboard entries, optionally for one team, cached like the sync list"""
+    team_id = request.GET.get('team_id')
+    team_pk = parse_pk(Team, team_id) if team_id else None
+    size = page_size(request)
+    serializer = fast_leaderboard_serializer.for_params(request.GET)
+
+    async def build():
+        leaderboard = Leaderboard.objects.order_by('rank', '_id')
+        if team_id:
+            leaderboard = leaderboard.filter(team_id=team_pk)
+        rows = serializer.values(leaderboard)[:size]
+        return {'results': await serializer.aserialize(rows)}
+
+    async def respond():
+        if team_id and team_pk is None:
+            # A malformed team_id matches no entries, so there is nothing to cache
+            return JsonResponse({'results': []})
+        data = await acached_response_data(team_scope(team_pk), 'async-list', request.GET.urlencode(), build)
+        return JsonResponse(data)
+
+    etag = await aetag_for(leaderboard_querysets(team_id), (request.build_absolute_uri(), None, 'application/json'))
+    return await aconditional(request, etag, respond)
+
+
+async def top_performers(request):
+    """Top 10 performers, sharing the sync endpoint's cache entry"""
+    serializer = fast_leaderboard_serializer.for_params(request.GET)
+
+    async def build():
+        leaderboard = Leaderboard.objects.order_by('rank')
+        return await serializer.aserialize(serializer.values(leaderboard)[:10])
+
+    async def respond():
+        data = await acached_response_data(GLOBAL_SCOPE, 'top_performers', fieldset_key(request.GET), build)
+        return JsonResponse(data, safe=False)
+
+    etag = await aetag_for(leaderboard_querysets(), (request.build_absolute_uri(), None, 'application/json'))
+    return await aconditional(request, etag, respond)
+
+
+async def workout_suggestions(request):
+    """The current user's materialized workout suggestions, in order"""
+    user = await request_user(request)
+    if not user.is_authenticated:
+        return not_authenticated()
+    serializer = fast_workout_serializer.for_params(request.GET)
+    workouts = Workout.objects.filter(user_id=user.pk, suggestion_rank__gt=0).order_by('suggestion_rank')
+
+    async def respond():
+        rows = await serializer.aserialize(serializer.values(workouts))
+        return JsonResponse(rows, safe=False)
+
+    etag = await aetag_for([workouts], (request.build_absolute_uri(), user.pk, 'application/json'))
+    return await aconditional(request, etag, respond)
@@ -0,0 +1,160 @@
+"""In-process timing of the API's read endpoints for before/after comparisons
+
+Each endpoint is requested through the Django test client as a logged-in
+user, so numbers cover routing, views, serialization and the database but
+not the network. Results are plain dicts that serialize to a JSON report;
+compare() reads two reports and names the endpoints that got slower.
+"""
+import platform
+import statistics
+import subprocess
+import time
+from pathlib import Path
+import django
+import rest_framework
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from .caching import invalidate_all
+from .leaderboard import recompute_leaderboard
+from .models import Activity, ActivityRollup, Leaderboard, Team, UserProfile, Workout
+from .monitoring import percentile
+from .stats import GROUP_BY_CHOICES
+
+# Endpoint name, path and whether caches are cleared before every run
+ENDPOINTS = [
+    ('users', '/api/users/', False),
+    ('profiles', '/api/profiles/', False),
+    ('teams', '/api/teams/', False),
+    ('activities', '/api/activities/', False),
+    ('statistics', '/api/activities/statistics/', False),
+    *[(f'statistics_by_{group_by}', f'/api/activities/statistics/?group_by={group_by}', False)
+      for group_by in GROUP_BY_CHOICES],
+    ('leaderboard_cold', '/api/leaderboard/', True),
+    ('leaderboard_cached', '/api/leaderboard/', False),
+    ('team_leaderboard', '/api/leaderboard/?team_id={team_id}', False),
+    ('top_performers', '/api/leaderboard/top_performers/', False),
+    ('workouts', '/api/workouts/', False),
+    ('suggestions', '/api/workouts/suggestions/', False),
+]
+
+
+def summarize(timings):
+    """Latency summary in milliseconds of a list of durations in seconds"""
+    ordered = sorted(seconds * 1000 for seconds in timings)
+    return {
+        'runs': len(ordered),
+        'min_ms': round(ordered[0], 3),
+        'median_ms': round(statistics.median(ordered), 3),
+        'p95_ms': round(percentile(ordered, 0.95), 3),
+        'mean_ms': round(statistics.fmean(ordered), 3),
+    }
+
+
+def measure(func, repeat, warmup=1, before=None):
+    """Time `func` `repeat` times after `warmup` untimed calls, counting the queries of the last run
+
+    `before` runs ahead of every call, outside the timing, to reset state such as caches.
+    """
+    for _ in range(warmup):
+        if before:
+            before()
+        func()
+    timings = []
+    for _ in range(repeat):
+        if before:
+            before()
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    with CaptureQueriesContext(connection) as queries:
+        if before:
+            before()
+        func()
+    return result, {**summarize(timings), 'queries': len(queries)}
+
+
+def benchmark_user():
+    """The top-ranked leaderboard entry, whose user has the most data to serve"""
+    return Leaderboard.objects.select_related('user').order_by('rank').first()
+
+
+def benchmark_endpoints(user, team_id=None, repeat=10, warmup=1, names=None):
+    """Time every endpoint as `user`; team-specific ones are skipped without a team"""
+    client = Client(HTTP_HOST='localhost')
+    client.force_login(user)
+    results = {}
+    for name, path, cold in ENDPOINTS:
+        if names and name not in names:
+            continue
+        if '{team_id}' in path:
+            if team_id is None:
+                continue
+            path = path.format(team_id=team_id)
+        response, result = measure(lambda: client.get(path), repeat, warmup, invalidate_all if cold else None)
+        results[name] = {
+            'path': path,
+            'status': response.status_code,
+            'bytes': len(response.content),
+            **result,
+        }
+    return results
+
+
+def benchmark_recompute(repeat=3):
+    """Time a full leaderboard recompute, the write path every ranking depends on"""
+    _, result = measure(recompute_leaderboard, repeat, warmup=0)
+    return result
+
+
+def git_commit():
+    """Current commit of the working tree, or None outside a git checkout"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).resolve().parent,
+            capture_output=True, text=True, check=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    """Code, platform and data volumes a report was produced with"""
+    return {
+        'commit': git_commit(),
+        'timestamp': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'rest_framework': rest_framework.VERSION,
+        'platform': platform.platform(),
+        'volumes': {
+            'users': UserProfile.objects.count(),
+            'teams': Team.objects.count(),
+            'activities': Activity.objects.count(),
+            'rollups': ActivityRollup.objects.count(),
+            'leaderboard': Leaderboard.objects.count(),
+            'workouts': Workout.objects.count(),
+        },
+    }
+
+
+def compare(baseline, current, threshold=0.1, metric='median_ms'):
+    """Endpoints whose `metric` grew by more than `threshold` over the baseline, or issue more queries"""
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        change = (result[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+        if change > threshold or result['queries'] > before['queries']:
+            regressions.append({
+                'name': name,
+                'baseline_ms': before[metric],
+                'current_ms': result[metric],
+                'change': round(change, 3),
+                'baseline_queries': before['queries'],
+                'current_queries': result['queries'],
+            })
+    return regressions
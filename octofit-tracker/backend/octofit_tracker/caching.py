@@ -0,0 +1,139 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from .models import Team
+
+GLOBAL_SCOPE = 'all'
+GENERATION_KEY = 'leaderboard:generation'
+VERSION_KEY = 'leaderboard:version:{scope}'
+RESPONSE_KEY = 'leaderboard:response:{generation}:{scope}:{version}:{name}:{digest}'
+STATS_KEY = 'leaderboard:stats:{outcome}'
+
+
+def team_scope(team_id):
+    """Cache scope for one team's leaderboard, or the global one when no team is given"""
+    return f'team:{team_id}' if team_id else GLOBAL_SCOPE
+
+
+def current_version(key):
+    """Read a version counter, initialising it on first use"""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+async def acurrent_version(key):
+    """Async version of current_version()"""
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, 1, timeout=None)
+        version = await cache.aget(key, 1)
+    return version
+
+
+def bump(key):
+    """Advance a version counter so keys built from the old value are never read again"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 2, timeout=None)
+
+
+def response_key(scope, name, params=''):
+    """Cache key for one response within a scope, e.g. a page of a team's leaderboard"""
+    return RESPONSE_KEY.format(
+        generation=current_version(GENERATION_KEY),
+        scope=scope,
+        version=current_version(VERSION_KEY.format(scope=scope)),
+        name=name,
+        digest=hashlib.md5(params.encode()).hexdigest(),
+    )
+
+
+async def aresponse_key(scope, name, params=''):
+    """Async version of response_key()"""
+    return RESPONSE_KEY.format(
+        generation=await acurrent_version(GENERATION_KEY),
+        scope=scope,
+        version=await acurrent_version(VERSION_KEY.format(scope=scope)),
+        name=name,
+        digest=hashlib.md5(params.encode()).hexdigest(),
+    )
+
+
+def cached_response_data(scope, name, params, build):
+    """Return cached response data for the scope, building and storing it on a miss"""
+    key = response_key(scope, name, params)
+    data = cache.get(key)
+    if data is not None:
+        record('hits')
+        return data
+    record('misses')
+    data = build()
+    cache.set(key, data, timeout=settings.LEADERBOARD_CACHE_TIMEOUT)
+    return data
+
+
+async def acached_response_data(scope, name, params, build):
+    """Async version of cached_response_data(); `build` is a coroutine function"""
+    key = await aresponse_key(scope, name, params)
+    data = await cache.aget(key)
+    if data is not None:
+        await arecord('hits')
+        return data
+    await arecord('misses')
+    data = await build()
+    await cache.aset(key, data, timeout=settings.LEADERBOARD_CACHE_TIMEOUT)
+    return data
+
+
+def invalidate_teams(team_ids):
+    """Drop cached leaderboards for the given teams and the global leaderboard"""
+    for team_id in set(team_ids):
+        bump(VERSION_KEY.format(scope=team_scope(team_id)))
+    bump(VERSION_KEY.format(scope=GLOBAL_SCOPE))
+
+
+def invalidate_user_teams(user_ids):
+    """Drop cached leaderboards for every team the given users belong to"""
+    team_ids = Team.members.through.objects.filter(user_id__in=set(user_ids)).values_list('team_id', flat=True)
+    invalidate_teams(team_ids)
+
+
+def invalidate_all():
+    """Drop every cached leaderboard response"""
+    bump(GENERATION_KEY)
+
+
+def record(outcome):
+    """Count a cache hit or miss"""
+    key = STATS_KEY.format(outcome=outcome)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+async def arecord(outcome):
+    """Async version of record()"""
+    key = STATS_KEY.format(outcome=outcome)
+    await cache.aadd(key, 0, timeout=None)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 1, timeout=None)
+
+
+def cache_stats():
+    """Leaderboard cache hit and miss counters"""
+    hits = cache.get(STATS_KEY.format(outcome='hits'), 0)
+    misses = cache.get(STATS_KEY.format(outcome='misses'), 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+    }
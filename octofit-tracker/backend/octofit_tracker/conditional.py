@@ -0,0 +1,111 @@
+"""Strong ETags for read endpoints, checked before any rows are loaded
+
+A response's ETag hashes the row count and latest `updated_at` of every
+queryset it is built from, together with the URL, user and media type. Those
+come from one aggregate query per queryset, so a client whose If-None-Match
+still matches gets 304 Not Modified without the rows being fetched or
+serialized. Any insert, update or delete in those querysets changes the tag.
+Users are read-only through the API, so nested user fields are not tracked.
+"""
+import hashlib
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from .models import Leaderboard, Team
+from .mongo import parse_pk
+
+
+def state_aggregates(model):
+    """Aggregates summarizing a table's state; count only for tables without updated_at"""
+    aggregates = {'rows': Count('pk')}
+    if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+        aggregates['last_updated'] = Max('updated_at')
+    return aggregates
+
+
+def plain(queryset):
+    """The queryset without eager loading or ordering, which aggregates do not need"""
+    return queryset.select_related(None).prefetch_related(None).order_by()
+
+
+def make_etag(states, extra):
+    """Quoted strong ETag of queryset states and request details"""
+    parts = [*map(str, extra)]
+    for state in states:
+        last_updated = state.get('last_updated')
+        parts += [str(state['rows']), last_updated.isoformat() if last_updated else '']
+    return '"%s"' % hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def etag_for(querysets, extra=()):
+    """ETag of the current state of the querysets"""
+    return make_etag(
+        [plain(queryset).aggregate(**state_aggregates(queryset.model)) for queryset in querysets], extra
+    )
+
+
+async def aetag_for(querysets, extra=()):
+    """Async version of etag_for()"""
+    return make_etag(
+        [await plain(queryset).aaggregate(**state_aggregates(queryset.model)) for queryset in querysets], extra
+    )
+
+
+def leaderboard_querysets(team_id=None):
+    """Leaderboard entries plus the teams and memberships embedded in them"""
+    leaderboard, teams, members = Leaderboard.objects.all(), Team.objects.all(), Team.members.through.objects.all()
+    if team_id:
+        team_pk = parse_pk(Team, team_id)
+        if team_pk is None:
+            return [leaderboard.none(), teams.none(), members.none()]
+        leaderboard, teams, members = (
+            leaderboard.filter(team_id=team_pk), teams.filter(pk=team_pk), members.filter(team_id=team_pk)
+        )
+    return [leaderboard, teams, members]
+
+
+def not_modified(request, etag):
+    """304 response when the client already holds `etag`, else None"""
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+    return response
+
+
+def conditional_response(request, etag, build):
+    """304 when the client holds `etag`, otherwise build() tagged with it"""
+    response = not_modified(request, etag)
+    if response is None:
+        response = build()
+        if response.status_code == 200:
+            response['ETag'] = etag
+    return response
+
+
+class ConditionalGetMixin:
+    """Serve list and retrieve with strong ETags, answering 304 before rows are loaded"""
+
+    def etag_querysets(self):
+        """Querysets the list response is built from"""
+        return [self.filter_queryset(self.get_queryset())]
+
+    def conditional(self, build, querysets=None):
+        """Response from build(), or 304 when the querysets are unchanged since the client's ETag"""
+        request = self.request
+        querysets = self.etag_querysets() if querysets is None else querysets
+        etag = etag_for(querysets, (request.build_absolute_uri(), request.user.pk, request.accepted_media_type))
+        return conditional_response(request, etag, build)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.get_queryset()
+        pk = parse_pk(queryset.model, self.kwargs[lookup_url_kwarg])
+        if pk is None:
+            raise Http404
+        instance = queryset.filter(pk=pk)
+        return self.conditional(
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs), [instance]
+        )
@@ -0,0 +1,55 @@
+import csv
+import json
+from datetime import date, datetime
+
+EXPORT_FIELDS = (
+    '_id', 'user_id', 'activity_type', 'duration_minutes', 'distance_km', 'calories_burned',
+    'description', 'activity_date', 'created_at', 'updated_at',
+)
+EXPORT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    """File-like object whose write() hands back what it was given, for streaming csv rows"""
+
+    def write(self, value):
+        return value
+
+
+def export_value(value):
+    """Render a stored value as plain JSON/CSV text"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def export_rows(queryset):
+    """Iterate projected activity rows with a server-side cursor, in a stable order"""
+    rows = queryset.order_by('activity_date', '_id').values_list(*EXPORT_FIELDS)
+    return rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def ndjson_lines(queryset):
+    """Yield one JSON document per activity"""
+    for row in export_rows(queryset):
+        yield json.dumps(dict(zip(EXPORT_FIELDS, map(export_value, row)))) + '\n'
+
+
+def csv_lines(queryset):
+    """Yield a CSV header followed by one line per activity"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in export_rows(queryset):
+        yield writer.writerow(map(export_value, row))
+
+
+def export_lines(queryset, output):
+    """Line generator for the requested export format"""
+    return csv_lines(queryset) if output == 'csv' else ndjson_lines(queryset)
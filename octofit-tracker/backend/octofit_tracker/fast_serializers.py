@@ -0,0 +1,259 @@
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from functools import lru_cache
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.response import Response
+from .metrics import timed_serialization
+from .pagination import ordering_fields
+from .serializers import ActivitySerializer, LeaderboardSerializer, WorkoutSerializer, field_tree, fieldset_params
+
+VALUE, DATETIME, NESTED, MANY, DETACHED = range(5)
+
+
+def to_iso_datetime(value, current):
+    """Render a datetime the way DRF's DateTimeField does with ISO-8601 output"""
+    if isinstance(value, str):
+        return value
+    if current is not None:
+        value = value.astimezone(current) if timezone.is_aware(value) else timezone.make_aware(value, current)
+    elif timezone.is_aware(value):
+        value = timezone.make_naive(value, dt_timezone.utc)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def to_iso_date(value):
+    """Render a date the way DRF's DateField does with ISO-8601 output"""
+    return value if isinstance(value, str) else value.isoformat()
+
+
+def identity(value):
+    """Pass a value through unchanged"""
+    return value
+
+
+CONVERTERS = {
+    'AutoField': int,
+    'BigAutoField': int,
+    'BigIntegerField': int,
+    'IntegerField': int,
+    'PositiveIntegerField': int,
+    'SmallIntegerField': int,
+    'FloatField': float,
+    'BooleanField': bool,
+    'CharField': str,
+    'TextField': str,
+    'URLField': str,
+    'SlugField': str,
+    'ObjectIdField': str,
+    'DateField': to_iso_date,
+}
+
+
+class FastSerializer:
+    """Build a ModelSerializer's output straight from .values() rows
+
+    The serializer's fields, as narrowed or expanded by its fieldset, are
+    compiled once into a flat list of column lookups and per-field
+    converters, so producing a row is a dict lookup and a cheap conversion
+    per field instead of DRF's per-field to_representation machinery.
+    Many-to-many fields, as ids or nested objects, are filled with one extra
+    query per relation for the whole page. So is a nested object whose table
+    the row query already joins (e.g. a team's owner next to the entry's
+    user): djongo reads a second join of one table from the first.
+    """
+
+    def __init__(self, serializer, prefix='', joined=None):
+        if isinstance(serializer, type):
+            serializer = serializer()
+        self.serializer_class = type(serializer)
+        model = serializer.Meta.model
+        joined = {model} if joined is None else joined
+        self.pk_key = f'{prefix}pk'
+        self.columns = [self.pk_key]
+        self.steps = []
+        self.many = []
+        self.nested = []
+        self.detached = []
+
+        for name, field in serializer.fields.items():
+            if isinstance(field, serializers.ListSerializer):
+                relation = model._meta.get_field(field.source)
+                self.many.append((name, relation, FastSerializer(field.child)))
+                self.steps.append((name, MANY, name, None))
+            elif isinstance(field, serializers.ManyRelatedField):
+                relation = model._meta.get_field(field.source)
+                self.many.append((name, relation, related_pk_converter(field.child_relation, relation)))
+                self.steps.append((name, MANY, name, None))
+            elif isinstance(field, serializers.BaseSerializer) and field.Meta.model in joined:
+                lookup = f'{prefix}{field.source}'
+                self.columns.append(lookup)
+                self.detached.append((name, lookup, FastSerializer(field)))
+                self.steps.append((name, DETACHED, lookup, None))
+            elif isinstance(field, serializers.BaseSerializer):
+                joined.add(field.Meta.model)
+                child = FastSerializer(field, prefix=f'{prefix}{name}__', joined=joined)
+                self.columns.extend(child.columns)
+                self.nested.append(child)
+                self.steps.append((name, NESTED, child, None))
+            else:
+                lookup = f'{prefix}{field.source}'
+                self.columns.append(lookup)
+                model_field = model._meta.get_field(field.source)
+                if isinstance(field, serializers.PrimaryKeyRelatedField):
+                    self.steps.append((name, VALUE, lookup, related_pk_converter(field, model_field)))
+                    continue
+                internal_type = model_field.get_internal_type()
+                if internal_type == 'DateTimeField':
+                    self.steps.append((name, DATETIME, lookup, None))
+                    continue
+                converter = str if isinstance(field, serializers.CharField) else CONVERTERS.get(internal_type, identity)
+                self.steps.append((name, VALUE, lookup, converter))
+
+    def for_params(self, params):
+        """This serializer narrowed and expanded by a request's `fields` and `expand` params"""
+        fields, expand = fieldset_params(params)
+        if not (fields or expand):
+            return self
+        return compile_fast_serializer(self.serializer_class, fields, expand)
+
+    def values(self, queryset, extra_columns=()):
+        """Project a queryset onto exactly the columns this serializer reads, plus any extra ones"""
+        return queryset.prefetch_related(None).values(*self.columns, *extra_columns)
+
+    def serialize(self, rows):
+        """Serialize a list of .values() rows"""
+        rows = list(rows)
+        # Resolved once per call; looking up the active timezone per value is costly
+        current = timezone.get_current_timezone() if settings.USE_TZ else None
+        related = {}
+        self.collect(rows, related, current)
+        return [self.build(row, related, current) for row in rows]
+
+    async def aserialize(self, queryset):
+        """Serialize a .values() queryset using the async ORM"""
+        rows = [row async for row in queryset]
+        current = timezone.get_current_timezone() if settings.USE_TZ else None
+        related = {}
+        await self.acollect(rows, related, current)
+        return [self.build(row, related, current) for row in rows]
+
+    def many_query(self, relation, child, rows):
+        """Through-table rows linking this page to one many-to-many relation's targets"""
+        pks = {row[self.pk_key] for row in rows if row[self.pk_key] is not None}
+        through = relation.remote_field.through
+        source = relation.m2m_field_name()
+        target = relation.m2m_reverse_field_name()
+        if isinstance(child, FastSerializer):
+            lookups = [f'{target}__{column}' for column in child.columns]
+        else:
+            lookups = [f'{target}_id']
+        links = (
+            through.objects.filter(**{f'{source}__in': pks})
+            .order_by('pk')
+            .values(f'{source}_id', *lookups)
+        )
+        return links if pks else through.objects.none(), f'{source}_id', lookups
+
+    def detached_query(self, lookup, child, rows):
+        """Rows of a nested object fetched apart from the row query, for every id on the page"""
+        model = child.serializer_class.Meta.model
+        pks = {row[lookup] for row in rows if row[self.pk_key] is not None and row[lookup] is not None}
+        return child.values(model.objects.filter(pk__in=pks)) if pks else model.objects.none().values()
+
+    def add_link(self, members, link, child, source, lookups, related, current):
+        """Serialize one related row, or convert its id, into its owner's list"""
+        if not isinstance(child, FastSerializer):
+            members[link[source]].append(child(link[lookups[0]]))
+            return
+        item = {column: link[lookup] for column, lookup in zip(child.columns, lookups)}
+        members[link[source]].append(child.build(item, related, current))
+
+    def collect(self, rows, related, current):
+        """Fetch every many-to-many relation for the rows, one query per relation"""
+        for name, relation, child in self.many:
+            links, source, lookups = self.many_query(relation, child, rows)
+            members = defaultdict(list)
+            for link in links:
+                self.add_link(members, link, child, source, lookups, related, current)
+            related[(id(self), name)] = members
+        for name, lookup, child in self.detached:
+            objects = list(self.detached_query(lookup, child, rows))
+            child.collect(objects, related, current)
+            related[(id(self), name)] = {row['pk']: child.build(row, related, current) for row in objects}
+        for child in self.nested:
+            child.collect(rows, related, current)
+
+    async def acollect(self, rows, related, current):
+        """Async version of collect()"""
+        for name, relation, child in self.many:
+            links, source, lookups = self.many_query(relation, child, rows)
+            members = defaultdict(list)
+            async for link in links:
+                self.add_link(members, link, child, source, lookups, related, current)
+            related[(id(self), name)] = members
+        for name, lookup, child in self.detached:
+            objects = [row async for row in self.detached_query(lookup, child, rows)]
+            await child.acollect(objects, related, current)
+            related[(id(self), name)] = {row['pk']: child.build(row, related, current) for row in objects}
+        for child in self.nested:
+            await child.acollect(rows, related, current)
+
+    def build(self, row, related, current):
+        """Serialize one row"""
+        if row[self.pk_key] is None:
+            return None
+        data = {}
+        for name, kind, lookup, converter in self.steps:
+            if kind == VALUE:
+                value = row[lookup]
+                data[name] = value if value is None else converter(value)
+            elif kind == DATETIME:
+                value = row[lookup]
+                data[name] = to_iso_datetime(value, current) if value else None
+            elif kind == NESTED:
+                data[name] = lookup.build(row, related, current)
+            elif kind == DETACHED:
+                data[name] = related[(id(self), name)].get(row[lookup])
+            else:
+                data[name] = related[(id(self), lookup)].get(row[self.pk_key], [])
+        return data
+
+
+def related_pk_converter(field, model_field):
+    """Converter rendering related ids the way a PrimaryKeyRelatedField does"""
+    if isinstance(field.pk_field, serializers.CharField):
+        return str
+    return CONVERTERS.get(model_field.related_model._meta.pk.get_internal_type(), identity)
+
+
+@lru_cache(maxsize=256)
+def compile_fast_serializer(serializer_class, fields, expand):
+    """FastSerializer for one normalized fieldset, compiled once per combination"""
+    return FastSerializer(serializer_class(fields=field_tree(fields), expand=field_tree(expand)))
+
+
+class FastListMixin:
+    """Serve list endpoints through a FastSerializer when FAST_LIST_SERIALIZATION is on"""
+    fast_serializer = None
+
+    def list(self, request, *args, **kwargs):
+        if not (settings.FAST_LIST_SERIALIZATION and self.fast_serializer):
+            return super().list(request, *args, **kwargs)
+        fast_serializer = self.fast_serializer.for_params(request.query_params)
+        rows = fast_serializer.values(self.filter_queryset(self.get_queryset()), ordering_fields(self))
+        page = self.paginate_queryset(rows)
+        with timed_serialization():
+            data = fast_serializer.serialize(rows if page is None else page)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+
+fast_activity_serializer = FastSerializer(ActivitySerializer)
+fast_leaderboard_serializer = FastSerializer(LeaderboardSerializer)
+fast_workout_serializer = FastSerializer(WorkoutSerializer)
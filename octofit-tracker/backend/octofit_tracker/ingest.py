@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.db import DatabaseError
+from rest_framework.exceptions import ValidationError
+from .caching import invalidate_user_teams
+from .models import Activity
+from .mongo import assign_object_ids, is_duplicate_key_error
+from .rollups import record_activities
+from .serializers import ActivitySerializer
+
+
+def chunked(items, size):
+    """Split a list into consecutive chunks of at most `size` items"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def existing_keys(user, keys, chunk_size):
+    """Map already stored idempotency keys to their activity ids"""
+    stored = {}
+    for chunk in chunked(sorted(keys), chunk_size):
+        rows = Activity.objects.filter(user=user, idempotency_key__in=chunk).values_list('idempotency_key', '_id')
+        stored.update((key, str(pk)) for key, pk in rows)
+    return stored
+
+
+def insert_chunk(chunk):
+    """Insert (index, activity) pairs; returns the indexes whose idempotency key another request stored first"""
+    try:
+        Activity.objects.bulk_create([activity for _, activity in chunk])
+        return set()
+    except DatabaseError as exc:
+        if not is_duplicate_key_error(exc):
+            raise
+    # The unordered insert kept every row but the conflicting ones
+    inserted = set(Activity.objects.filter(pk__in=[activity.pk for _, activity in chunk]).values_list('_id', flat=True))
+    return {index for index, activity in chunk if activity.pk not in inserted}
+
+
+def duplicate_result(index, key, activity_id):
+    return {'index': index, 'status': 'duplicate', 'idempotency_key': key, '_id': activity_id}
+
+
+def ingest_activities(user, items):
+    """Validate, deduplicate and bulk insert a batch of activities for a user
+
+    Returns one result per submitted item, in order, with a status of
+    created, duplicate or invalid. The unique activity_idempotency_idx index
+    settles keys that a concurrent request stores between the lookup and the
+    insert; those items are reported as duplicates too.
+    """
+    chunk_size = settings.ACTIVITY_BULK_CHUNK_SIZE
+    validator = ActivitySerializer(many=True).child
+    results = [None] * len(items)
+    pending = []
+    for index, item in enumerate(items):
+        try:
+            pending.append((index, validator.run_validation(item)))
+        except ValidationError as exc:
+            results[index] = {'index': index, 'status': 'invalid', 'errors': exc.detail}
+
+    keys = {data['idempotency_key'] for _, data in pending if data.get('idempotency_key')}
+    stored = existing_keys(user, keys, chunk_size)
+    to_create, repeats, batch_keys = [], [], set()
+    for index, data in pending:
+        key = data.get('idempotency_key')
+        if key and key in stored:
+            results[index] = duplicate_result(index, key, stored[key])
+        elif key and key in batch_keys:
+            # Later copies of the same key within this batch are duplicates of the first
+            repeats.append((index, key))
+        else:
+            if key:
+                batch_keys.add(key)
+            to_create.append((index, Activity(user=user, **data)))
+    assign_object_ids([activity for _, activity in to_create])
+
+    lost = set()
+    for chunk in chunked(to_create, chunk_size):
+        lost |= insert_chunk(chunk)
+    if lost:
+        stored.update(existing_keys(
+            user, {activity.idempotency_key for index, activity in to_create if index in lost}, chunk_size
+        ))
+
+    created = []
+    for index, activity in to_create:
+        key = activity.idempotency_key
+        if index in lost:
+            results[index] = duplicate_result(index, key, stored[key])
+            continue
+        created.append(activity)
+        results[index] = {'index': index, 'status': 'created', 'idempotency_key': key, '_id': str(activity.pk)}
+        if key:
+            stored[key] = str(activity.pk)
+    for index, key in repeats:
+        results[index] = duplicate_result(index, key, stored[key])
+
+    # bulk_create sends no model signals, so update rollups and caches here
+    if created:
+        record_activities(created)
+        invalidate_user_teams([user.pk])
+    return results
@@ -0,0 +1,187 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Count
+from django.utils import timezone
+from pymongo import ReturnDocument
+from .leaderboard import recompute_team, rerank_leaderboard
+from .models import Job, Team, UserProfile
+from .mongo import document_values, get_collection, is_duplicate_key_error
+from .suggestions import refresh_suggestions
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, FAILED = 'pending', 'running', 'failed'
+
+RECOMPUTE_TEAM = 'recompute_team'
+RERANK = 'rerank'
+REFRESH_SUGGESTIONS = 'refresh_suggestions'
+
+
+def enqueue(kind, key, payload=None, delay=0):
+    """Queue a job unless one with the same key is already pending
+
+    A pending job has not started yet, so it will see every write made before
+    it runs; a duplicate would only repeat the same work. The unique
+    job_pending_key_idx index turns away the duplicate, even when two writers
+    enqueue the same key at once.
+    """
+    try:
+        Job.objects.create(
+            kind=kind,
+            key=key,
+            payload=payload or {},
+            run_after=timezone.now() + timedelta(seconds=delay),
+        )
+    except DatabaseError as exc:
+        if not is_duplicate_key_error(exc):
+            raise
+        return False
+    return True
+
+
+def enqueue_team_recomputes(team_ids):
+    """Queue a leaderboard recompute for each team, coalescing with pending ones"""
+    return sum(
+        enqueue(RECOMPUTE_TEAM, f'{RECOMPUTE_TEAM}:{team_id}', {'team_id': str(team_id)},
+                delay=settings.JOB_COALESCE_SECONDS)
+        for team_id in set(team_ids)
+    )
+
+
+def enqueue_user_teams(user_ids):
+    """Queue leaderboard recomputes for every team the given users belong to"""
+    team_ids = Team.members.through.objects.filter(user_id__in=set(user_ids)).values_list('team_id', flat=True)
+    return enqueue_team_recomputes(team_ids)
+
+
+def enqueue_suggestion_refreshes(user_ids):
+    """Queue a suggestion list refresh for each given user with a profile, coalescing with pending ones"""
+    user_ids = UserProfile.objects.filter(user_id__in=set(user_ids)).values_list('user_id', flat=True)
+    return sum(
+        enqueue(REFRESH_SUGGESTIONS, f'{REFRESH_SUGGESTIONS}:{user_id}', {'user_id': user_id},
+                delay=settings.JOB_COALESCE_SECONDS)
+        for user_id in user_ids
+    )
+
+
+def run_recompute_team(payload):
+    """Refresh one team's entries, then queue a global rerank to place them"""
+    recompute_team(Team._meta.pk.to_python(payload['team_id']))
+    enqueue(RERANK, RERANK, delay=settings.JOB_COALESCE_SECONDS)
+
+
+def run_rerank(payload):
+    """Reassign global and team ranks"""
+    rerank_leaderboard()
+
+
+def run_refresh_suggestions(payload):
+    """Rebuild one user's suggestion list after their activity mix changed"""
+    refresh_suggestions([payload['user_id']])
+
+
+HANDLERS = {
+    RECOMPUTE_TEAM: run_recompute_team,
+    RERANK: run_rerank,
+    REFRESH_SUGGESTIONS: run_refresh_suggestions,
+}
+
+# Within a batch, team recomputes run before the rerank that depends on them
+KIND_ORDER = {RECOMPUTE_TEAM: 0, RERANK: 1}
+
+
+def backoff_delay(attempts):
+    """Seconds to wait before retrying a job that has failed `attempts` times"""
+    return min(settings.JOB_BACKOFF_SECONDS * 2 ** (attempts - 1), settings.JOB_BACKOFF_MAX_SECONDS)
+
+
+def claim(worker_id, limit):
+    """Take up to `limit` due jobs, each claimed with find_one_and_update so two workers never share one"""
+    collection = get_collection(Job)
+    lock = document_values(Job, {'status': RUNNING, 'locked_by': worker_id, 'locked_at': timezone.now()})
+    claimed = []
+    for _ in range(limit):
+        document = collection.find_one_and_update(
+            {'status': PENDING, 'run_after': {'$lte': lock['locked_at']}},
+            {'$set': lock, '$inc': {'attempts': 1}},
+            sort=[('run_after', 1), ('_id', 1)],
+            projection={'_id': True},
+            return_document=ReturnDocument.AFTER,
+        )
+        if document is None:
+            break
+        claimed.append(document['_id'])
+    return list(Job.objects.filter(pk__in=claimed).order_by('run_after', '_id')) if claimed else []
+
+
+def requeue(job, **changes):
+    """Set a job back to pending, dropping it instead if a pending job with its key already covers the work"""
+    try:
+        Job.objects.filter(pk=job.pk).update(status=PENDING, locked_by=None, **changes)
+    except DatabaseError as exc:
+        if not is_duplicate_key_error(exc):
+            raise
+        Job.objects.filter(pk=job.pk).delete()
+        return False
+    return True
+
+
+def retry_or_fail(job, error):
+    """Put a failed job back on the queue with backoff, or park it once attempts run out"""
+    if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+        Job.objects.filter(pk=job.pk).update(status=FAILED, locked_by=None, last_error=error)
+        return FAILED
+    requeue(job, last_error=error, run_after=timezone.now() + timedelta(seconds=backoff_delay(job.attempts)))
+    return PENDING
+
+
+def run_batch(worker_id, batch_size=100):
+    """Claim a batch of due jobs and run each distinct key once"""
+    jobs = claim(worker_id, batch_size)
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job.key, []).append(job)
+
+    result = {'claimed': len(jobs), 'ran': 0, 'succeeded': 0, 'retried': 0, 'failed': 0}
+    for key, group in sorted(groups.items(), key=lambda item: KIND_ORDER.get(item[1][0].kind, len(KIND_ORDER))):
+        job = group[0]
+        result['ran'] += 1
+        try:
+            handler = HANDLERS[job.kind]
+            handler(job.payload)
+        except Exception as exc:
+            logger.exception('Job %s failed on attempt %s', key, job.attempts)
+            outcomes = [retry_or_fail(member, f'{type(exc).__name__}: {exc}') for member in group]
+            result['retried'] += outcomes.count(PENDING)
+            result['failed'] += outcomes.count(FAILED)
+        else:
+            Job.objects.filter(pk__in=[member.pk for member in group]).delete()
+            result['succeeded'] += len(group)
+    return result
+
+
+def requeue_stale():
+    """Hand jobs back to the queue when their worker stopped before finishing them"""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    stale = Job.objects.filter(status=RUNNING, locked_at__lt=cutoff).only('pk')
+    return sum(requeue(job) for job in stale)
+
+
+def queue_depth():
+    """Job counts by status and kind, plus how many are due and how long the oldest has waited"""
+    now = timezone.now()
+    depth = {PENDING: 0, RUNNING: 0, FAILED: 0}
+    by_kind = {}
+    rows = Job.objects.values('kind', 'status').annotate(count=Count('pk')).order_by()
+    for row in rows:
+        depth[row['status']] = depth.get(row['status'], 0) + row['count']
+        by_kind.setdefault(row['kind'], {})[row['status']] = row['count']
+    oldest = Job.objects.filter(status=PENDING).order_by('created_at').values_list('created_at', flat=True).first()
+    return {
+        **depth,
+        'due': Job.objects.filter(status=PENDING, run_after__lte=now).count(),
+        'oldest_pending_seconds': round((now - oldest).total_seconds(), 3) if oldest else None,
+        'by_kind': by_kind,
+    }
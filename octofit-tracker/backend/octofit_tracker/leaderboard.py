@@ -0,0 +1,162 @@
+from django.db.models import Sum
+from django.utils import timezone
+from .caching import invalidate_all, invalidate_teams
+from .models import ActivityRollup, Leaderboard, Team
+from .mongo import assign_object_ids, bulk_set
+
+RANKING_METHODS = ('competition', 'dense')
+
+# Points awarded per minute of activity, per kilometre and per calories burned
+POINTS_PER_MINUTE = 1
+POINTS_PER_KM = 10
+CALORIES_PER_POINT = 10
+
+TOTAL_FIELDS = ('total_activities', 'total_calories', 'total_distance', 'total_duration_minutes')
+UPDATE_FIELDS = TOTAL_FIELDS + ('points', 'rank', 'team_rank', 'updated_at')
+TEAM_UPDATE_FIELDS = TOTAL_FIELDS + ('points', 'team_rank', 'updated_at')
+BATCH_SIZE = 1000
+
+
+def score(totals):
+    """Leaderboard points earned for a user's activity totals"""
+    return int(
+        POINTS_PER_MINUTE * totals['total_duration_minutes']
+        + POINTS_PER_KM * totals['total_distance']
+        + totals['total_calories'] // CALORIES_PER_POINT
+    )
+
+
+def user_totals(user_ids=None):
+    """Activity totals per user, aggregated from the daily rollups in one query"""
+    rollups = ActivityRollup.objects.all()
+    if user_ids is not None:
+        rollups = rollups.filter(user_id__in=user_ids)
+    rows = rollups.values('user_id').annotate(
+        **{field: Sum(field) for field in TOTAL_FIELDS}
+    ).order_by()
+    return {row['user_id']: {field: row[field] or 0 for field in TOTAL_FIELDS} for row in rows}
+
+
+class Ranker:
+    """Assign ranks to scores fed in best-first order"""
+
+    def __init__(self, method='competition'):
+        self.method = method
+        self.position = 0
+        self.rank = 0
+        self.previous = None
+
+    def next(self, points):
+        """Rank for the next score in sorted order"""
+        self.position += 1
+        if points != self.previous:
+            self.rank = self.position if self.method == 'competition' else self.rank + 1
+            self.previous = points
+        return self.rank
+
+
+def assign_ranks(entries, method='competition'):
+    """Set global and per-team ranks on leaderboard entries with one sort and one pass"""
+    entries.sort(key=lambda entry: (-entry.points, entry.user_id, str(entry.team_id)))
+    global_ranker = Ranker(method)
+    team_rankers = {}
+    last_user_id = None
+    for entry in entries:
+        # A user on several teams has one entry per team; they share a global rank
+        if entry.user_id != last_user_id:
+            global_rank = global_ranker.next(entry.points)
+            last_user_id = entry.user_id
+        entry.rank = global_rank
+        team_ranker = team_rankers.setdefault(entry.team_id, Ranker(method))
+        entry.team_rank = team_ranker.next(entry.points)
+    return entries
+
+
+def check_method(method):
+    """Reject unknown ranking methods"""
+    if method not in RANKING_METHODS:
+        raise ValueError(f"Unknown ranking method '{method}'")
+
+
+def refresh_entries(memberships, existing, totals):
+    """Fill totals and points on the entry for each (team_id, user_id) membership
+
+    Entries are taken out of `existing` as they are used, so whatever is left
+    there afterwards belongs to users no longer on the team.
+    """
+    empty = dict.fromkeys(TOTAL_FIELDS, 0)
+    now = timezone.now()
+    entries, to_create = [], []
+    for team_id, user_id in memberships:
+        entry = existing.pop((team_id, user_id), None)
+        if entry is None:
+            entry = Leaderboard(team_id=team_id, user_id=user_id, rank=0)
+            to_create.append(entry)
+        user_total = totals.get(user_id, empty)
+        for field in TOTAL_FIELDS:
+            setattr(entry, field, user_total[field])
+        entry.points = score(user_total)
+        entry.updated_at = now
+        entries.append(entry)
+    return entries, to_create
+
+
+def write_entries(entries, to_create, stale, fields):
+    """Save refreshed entries with one bulk write and delete stale ones"""
+    created = set(map(id, to_create))
+    to_update = [entry for entry in entries if id(entry) not in created]
+    bulk_set(Leaderboard, to_update, fields)
+    Leaderboard.objects.bulk_create(assign_object_ids(to_create), batch_size=BATCH_SIZE)
+    stale_ids = [entry.pk for entry in stale]
+    if stale_ids:
+        Leaderboard.objects.filter(pk__in=stale_ids).delete()
+    return {'updated': len(to_update), 'created': len(to_create), 'deleted': len(stale_ids)}
+
+
+def recompute_leaderboard(method='competition'):
+    """Recompute totals, points and ranks for every team member and write them back in bulk"""
+    check_method(method)
+    memberships = Team.members.through.objects.values_list('team_id', 'user_id')
+    existing = {(entry.team_id, entry.user_id): entry for entry in Leaderboard.objects.all()}
+    entries, to_create = refresh_entries(memberships, existing, user_totals())
+    assign_ranks(entries, method)
+    result = write_entries(entries, to_create, existing.values(), UPDATE_FIELDS)
+    invalidate_all()
+    return result
+
+
+def recompute_team(team_id, method='competition'):
+    """Recompute totals, points and team ranks for one team's members
+
+    Global ranks depend on every team, so they are left to rerank_leaderboard();
+    entries created here hold rank 0 until it runs.
+    """
+    check_method(method)
+    member_ids = list(Team.members.through.objects.filter(team_id=team_id).values_list('user_id', flat=True))
+    existing = {(entry.team_id, entry.user_id): entry for entry in Leaderboard.objects.filter(team_id=team_id)}
+    entries, to_create = refresh_entries(
+        [(team_id, user_id) for user_id in member_ids], existing, user_totals(member_ids)
+    )
+    entries.sort(key=lambda entry: (-entry.points, entry.user_id))
+    ranker = Ranker(method)
+    for entry in entries:
+        entry.team_rank = ranker.next(entry.points)
+    result = write_entries(entries, to_create, existing.values(), TEAM_UPDATE_FIELDS)
+    invalidate_teams([team_id])
+    return result
+
+
+def rerank_leaderboard(method='competition'):
+    """Reassign global and team ranks from stored points, writing only entries that moved"""
+    check_method(method)
+    entries = list(Leaderboard.objects.only('_id', 'team_id', 'user_id', 'points', 'rank', 'team_rank'))
+    previous = {id(entry): (entry.rank, entry.team_rank) for entry in entries}
+    assign_ranks(entries, method)
+    moved = [entry for entry in entries if previous[id(entry)] != (entry.rank, entry.team_rank)]
+    # updated_at moves with the ranks so leaderboard ETags change
+    now = timezone.now()
+    for entry in moved:
+        entry.updated_at = now
+    bulk_set(Leaderboard, moved, ('rank', 'team_rank', 'updated_at'))
+    invalidate_all()
+    return {'updated': len(moved)}
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from octofit_tracker.models import Activity, ActivityRollup, Leaderboard, Team, Workout
+from octofit_tracker.mongo import get_database, summarize_explain
+
+
+class Command(BaseCommand):
+    help = 'Explain the queries behind each ViewSet against MongoDB and report collection scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to audit')
+        parser.add_argument('--fail-on-collscan', action='store_true',
+                            help='Exit with an error if any query scans a whole collection')
+
+    def handle(self, *args, **options):
+        try:
+            db = get_database(options['database'])
+        except ImproperlyConfigured as exc:
+            raise CommandError(str(exc))
+
+        scans = 0
+        for name, (collection, query) in self.queries(db).items():
+            if query is None:
+                self.stdout.write(f'{name}: skipped (no sample data in {collection})')
+                continue
+            explain = db.command('explain', {'find': collection, **query}, verbosity='executionStats')
+            summary = summarize_explain(explain)
+            line = (
+                f"{name}: {'/'.join(summary['stages'])} "
+                f"indexes={','.join(summary['indexes']) or '-'} "
+                f"keys={summary['keys_examined']} docs={summary['docs_examined']} "
+                f"returned={summary['returned']}"
+            )
+            if summary['collection_scan']:
+                scans += 1
+                self.stdout.write(self.style.ERROR(f'{line}  <- COLLECTION SCAN'))
+            elif summary['in_memory_sort']:
+                self.stdout.write(self.style.WARNING(f'{line}  <- in-memory sort'))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
+
+        if scans and options['fail_on_collscan']:
+            raise CommandError(f'{scans} queries scan a whole collection')
+
+    def queries(self, db):
+        """Mongo equivalents of the ViewSet queries, filled in with sample values"""
+        activity = self.sample(db, Activity)
+        rollup = self.sample(db, ActivityRollup)
+        entry = self.sample(db, Leaderboard)
+        workout = self.sample(db, Workout)
+        membership = self.sample(db, Team.members.through)
+
+        def when(sample, query):
+            return query if sample else None
+
+        return OrderedDict([
+            ('ActivityViewSet.list', (Activity._meta.db_table, when(activity, {
+                'filter': {'user_id': activity and activity['user_id']},
+                'sort': {'activity_date': -1, '_id': -1},
+                'limit': 51,
+            }))),
+            ('ActivityViewSet.statistics', (ActivityRollup._meta.db_table, when(rollup, {
+                'filter': {'user_id': rollup and rollup['user_id'], 'day': {'$gte': rollup and rollup['day']}},
+            }))),
+            ('LeaderboardViewSet.list', (Leaderboard._meta.db_table, when(entry, {
+                'filter': {},
+                'sort': {'rank': 1, '_id': 1},
+                'limit': 51,
+            }))),
+            ('LeaderboardViewSet.list?team_id', (Leaderboard._meta.db_table, when(entry, {
+                'filter': {'team_id': entry and entry['team_id']},
+                'sort': {'rank': 1, '_id': 1},
+                'limit': 51,
+            }))),
+            ('WorkoutViewSet.list', (Workout._meta.db_table, when(workout, {
+                'filter': {'user_id': workout and workout['user_id']},
+                'sort': {'suggested_date': 1, '_id': 1},
+                'limit': 51,
+            }))),
+            ('WorkoutViewSet.suggestions', (Workout._meta.db_table, when(workout, {
+                'filter': {'user_id': workout and workout['user_id'], 'suggestion_rank': {'$gt': 0}},
+                'sort': {'suggestion_rank': 1},
+            }))),
+            ('Team membership by user', (Team.members.through._meta.db_table, when(membership, {
+                'filter': {'user_id': membership and membership['user_id']},
+            }))),
+        ])
+
+    def sample(self, db, model):
+        """One stored document to take realistic filter values from"""
+        return db[model._meta.db_table].find_one()
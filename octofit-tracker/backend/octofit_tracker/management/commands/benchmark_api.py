@@ -0,0 +1,83 @@
+import json
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from octofit_tracker.benchmarking import (
+    ENDPOINTS, benchmark_endpoints, benchmark_recompute, benchmark_user, compare, environment
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the read endpoints and the leaderboard recompute in-process and write a JSON report; '
+        'with --compare, report endpoints that regressed against a baseline report'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10, help='Timed runs per endpoint')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed runs per endpoint before timing')
+        parser.add_argument('--username', help='User to request as; defaults to the top-ranked user')
+        parser.add_argument('--endpoint', action='append', choices=[name for name, _, _ in ENDPOINTS],
+                            help='Only time this endpoint; may be repeated')
+        parser.add_argument('--no-recompute', action='store_true', help='Skip timing the leaderboard recompute')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', metavar='BASELINE', help='Baseline JSON report to compare against')
+        parser.add_argument('--threshold', type=float, default=0.1,
+                            help='Relative median slowdown counted as a regression (default 0.1 = 10%%)')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error when any endpoint regressed')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Cannot read baseline '{options['compare']}': {exc}")
+
+        entry = benchmark_user()
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+            if user is None:
+                raise CommandError(f"User '{options['username']}' does not exist")
+        elif entry is not None:
+            user = entry.user
+        else:
+            user = User.objects.order_by('id').first()
+            if user is None:
+                raise CommandError('No users to benchmark with; run generate_load_data first')
+        team_id = entry.team_id if entry is not None else None
+
+        results = benchmark_endpoints(user, team_id, options['repeat'], options['warmup'], options['endpoint'])
+        if not options['no_recompute'] and not options['endpoint']:
+            results['recompute_leaderboard'] = benchmark_recompute()
+        report = {'meta': {**environment(), 'user': user.username}, 'results': results}
+
+        self.stdout.write(f"{'endpoint':<28}{'status':>7}{'median':>10}{'p95':>10}{'mean':>10}"
+                          f"{'queries':>9}{'bytes':>10}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<28}{result.get('status', '-'):>7}{result['median_ms']:>9.1f}ms{result['p95_ms']:>8.1f}ms"
+                f"{result['mean_ms']:>8.1f}ms{result['queries']:>9}{result.get('bytes', '-'):>10}"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+        if baseline is None:
+            return
+        regressions = compare(baseline, report, options['threshold'])
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(
+                f"No regressions against {baseline['meta'].get('commit') or options['compare']}"
+            ))
+            return
+        for regression in regressions:
+            self.stdout.write(self.style.WARNING(
+                f"{regression['name']}: {regression['baseline_ms']:.1f}ms -> {regression['current_ms']:.1f}ms "
+                f"({regression['change']:+.0%}), queries {regression['baseline_queries']} -> "
+                f"{regression['current_queries']}"
+            ))
+        if options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} endpoint(s) regressed')
@@ -0,0 +1,57 @@
+import time
+from django.core.management.base import BaseCommand
+from octofit_tracker.fast_serializers import (
+    fast_activity_serializer, fast_leaderboard_serializer, fast_workout_serializer
+)
+from octofit_tracker.models import Activity, Leaderboard, Workout
+from octofit_tracker.serializers import (
+    ActivitySerializer, LeaderboardSerializer, WorkoutSerializer, optimize_queryset
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare per-row cost of the DRF serializers and the fast .values() serializers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000, help='Rows to serialize per model')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per serializer; the best is reported')
+
+    def handle(self, *args, **options):
+        limit, repeat = options['limit'], options['repeat']
+        cases = [
+            ('activities', Activity.objects.order_by('-activity_date', '-_id'),
+             ActivitySerializer, fast_activity_serializer),
+            ('workouts', Workout.objects.order_by('suggested_date', '_id'),
+             WorkoutSerializer, fast_workout_serializer),
+            ('leaderboard', Leaderboard.objects.order_by('rank', '_id'),
+             LeaderboardSerializer, fast_leaderboard_serializer),
+        ]
+        for name, queryset, serializer_class, fast_serializer in cases:
+            # Shaped the way the list views shape it, so the DRF side loads only what it renders
+            queryset = optimize_queryset(queryset, serializer_class())
+
+            def drf():
+                return serializer_class(list(queryset[:limit]), many=True).data
+
+            def fast():
+                return fast_serializer.serialize(fast_serializer.values(queryset)[:limit])
+
+            rows = len(fast())
+            if not rows:
+                self.stdout.write(f'{name}: no rows, skipped')
+                continue
+            drf_time = self.best(drf, repeat)
+            fast_time = self.best(fast, repeat)
+            self.stdout.write(
+                f'{name}: {rows} rows  drf {drf_time / rows * 1e6:.1f}us/row  '
+                f'fast {fast_time / rows * 1e6:.1f}us/row  speedup {drf_time / fast_time:.1f}x'
+            )
+
+    def best(self, func, repeat):
+        """Fastest wall-clock time of several runs, including the database fetch"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
@@ -0,0 +1,34 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from octofit_tracker.suggestions import refresh_all_suggestions
+
+
+class Command(BaseCommand):
+    help = "Batch-build every user's materialized workout suggestion list"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', action='append', help='Only rebuild this user; may be repeated')
+        parser.add_argument('--count', type=int, help='Suggestions per user (default SUGGESTION_COUNT)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users rebuilt per batch')
+
+    def handle(self, *args, **options):
+        if options['count'] is not None and options['count'] < 0:
+            raise CommandError('--count must not be negative')
+        user_ids = None
+        if options['username']:
+            users = dict(User.objects.filter(username__in=options['username']).values_list('username', 'id'))
+            missing = sorted(set(options['username']) - set(users))
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(missing)}")
+            user_ids = list(users.values())
+
+        started = time.perf_counter()
+        result = refresh_all_suggestions(
+            user_ids, batch_size=options['batch_size'], count=options['count'],
+            log=lambda message: self.stdout.write(f'Built {message}')
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt suggestions for {result['users']} users in {time.perf_counter() - started:.1f}s: "
+            f"{result['created']} workouts generated, {result['reranked']} re-ranked"
+        ))
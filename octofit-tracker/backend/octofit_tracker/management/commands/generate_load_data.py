@@ -0,0 +1,50 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from octofit_tracker.leaderboard import recompute_leaderboard
+from octofit_tracker.seeding import Seeder
+from octofit_tracker.suggestions import refresh_all_suggestions
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-generate a synthetic dataset for load testing and benchmarks, '
+        'e.g. --users 100000 --teams 1000 --activities 50000000'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Users to create, each with a profile')
+        parser.add_argument('--teams', type=int, default=50, help='Teams to create')
+        parser.add_argument('--activities', type=int, default=100000,
+                            help='Activities to create in total, spread over users with a heavy tail')
+        parser.add_argument('--workouts-per-user', type=int, default=3, help='Suggested workouts per user')
+        parser.add_argument('--days', type=int, default=365, help='Days of activity history to spread over')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+        parser.add_argument('--seed', type=int, help='Random seed for a reproducible dataset')
+        parser.add_argument('--prefix', default='load', help='Prefix of generated usernames and team names')
+        parser.add_argument('--clear', action='store_true', help='Delete the dataset with this prefix first')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def log(message):
+            self.stdout.write(f'[{time.perf_counter() - started:8.1f}s] {message}')
+
+        seeder = Seeder(prefix=options['prefix'], seed=options['seed'], batch_size=options['batch_size'], log=log)
+        if options['clear']:
+            log(f"Cleared {seeder.clear()} rows from dataset '{options['prefix']}'")
+        elif seeder.user_ids():
+            raise CommandError(f"Dataset '{options['prefix']}' already exists; pass --clear or another --prefix")
+        if options['users'] < 1:
+            raise CommandError('--users must be at least 1')
+
+        user_ids = seeder.create_users(options['users'])
+        if options['teams']:
+            seeder.create_teams(options['teams'], user_ids)
+        seeder.create_activities(user_ids, options['activities'], days=options['days'])
+        seeder.create_workouts(user_ids, per_user=options['workouts_per_user'])
+        refresh_all_suggestions(user_ids, batch_size=options['batch_size'], log=log)
+        result = recompute_leaderboard()
+        log(f"Leaderboard recomputed: {result['created']} entries created")
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated dataset '{options['prefix']}' in {time.perf_counter() - started:.1f}s"
+        ))
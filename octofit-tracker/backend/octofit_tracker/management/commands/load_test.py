@@ -0,0 +1,105 @@
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from octofit_tracker.monitoring import percentile
+
+# Sync DRF endpoint and its async counterpart, compared side by side
+ENDPOINTS = {
+    'activities': ('/api/activities/', '/api/async/activities/'),
+    'statistics': ('/api/activities/statistics/', '/api/async/activities/statistics/'),
+    'leaderboard': ('/api/leaderboard/', '/api/async/leaderboard/'),
+    'top_performers': ('/api/leaderboard/top_performers/', '/api/async/leaderboard/top_performers/'),
+    'suggestions': ('/api/workouts/suggestions/', '/api/async/workouts/suggestions/'),
+}
+
+
+def login_cookie(username):
+    """Session cookie for a user, created directly so no password hashing runs per request"""
+    try:
+        user = User.objects.get(username=username)
+    except User.DoesNotExist:
+        raise CommandError(f"User '{username}' does not exist")
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+
+def run_load(url, cookie, concurrency, duration):
+    """Hit a URL from `concurrency` threads for `duration` seconds and collect latencies"""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            request = urllib.request.Request(url, headers={'Cookie': cookie, 'Accept': 'application/json'})
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+                failure = None
+            except (urllib.error.URLError, OSError) as exc:
+                failure = getattr(exc, 'code', None) or type(exc).__name__
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                if failure is None:
+                    latencies.append(elapsed)
+                else:
+                    errors.append(failure)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare sustained throughput of the sync API and the /api/async/ read path against a running '
+        'server, e.g. one started with `uvicorn octofit_tracker.asgi:application --workers 1`'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000', help='Server to load')
+        parser.add_argument('--username', required=True, help='User whose session the requests use')
+        parser.add_argument('--concurrency', type=int, default=32, help='Requests in flight at once')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run each endpoint')
+        parser.add_argument(
+            '--endpoint', action='append', choices=sorted(ENDPOINTS),
+            help='Endpoint to compare; repeat for several (default: all)'
+        )
+
+    def handle(self, *args, **options):
+        cookie = login_cookie(options['username'])
+        base_url = options['base_url'].rstrip('/')
+        self.stdout.write(f"{'endpoint':<16}{'path':<7}{'requests':>9}{'errors':>8}{'req/s':>9}"
+                          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        for name in options['endpoint'] or sorted(ENDPOINTS):
+            for mode, path in zip(('sync', 'async'), ENDPOINTS[name]):
+                result = run_load(base_url + path, cookie, options['concurrency'], options['duration'])
+                self.stdout.write(
+                    f"{name:<16}{mode:<7}{result['requests']:>9}{result['errors']:>8}{result['rps']:>9}"
+                    + ''.join(f'{value:>9.1f}' if value is not None else f"{'-':>9}"
+                              for value in (result['p50'], result['p95'], result['p99']))
+                )
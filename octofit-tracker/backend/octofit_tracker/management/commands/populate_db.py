@@ -1,70 +1,100 @@
-from django.core.management.base import BaseCommand
+import time
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
-from octofit_tracker.models import UserProfile, Team, Activity, Leaderboard, Workout
-from datetime import datetime, timedelta
+from django.utils import timezone
+from octofit_tracker.models import UserProfile, Team, Activity, ActivityRollup, Leaderboard, Workout, Job
+from octofit_tracker.leaderboard import recompute_leaderboard
+from octofit_tracker.mongo import assign_object_ids
+from octofit_tracker.rollups import collect_deltas, snapshot
+from octofit_tracker.seeding import Seeder, create_rollups, delete_users, raw_delete
+from octofit_tracker.suggestions import refresh_all_suggestions
 
-class Command(BaseCommand):
-    help = 'Populate the octofit_db database with test data'
-
-    def handle(self, *args, **options):
-        # Delete existing data
-        UserProfile.objects.all().delete()
-        Team.objects.all().delete()
-        Activity.objects.all().delete()
-        Leaderboard.objects.all().delete()
-        Workout.objects.all().delete()
-        User.objects.all().exclude(is_superuser=True).delete()
+# Synthetic rows added per unit of --scale, on top of the hero fixtures
+SCALE_UNIT = {'users': 1000, 'teams': 20, 'activities': 50000, 'workouts_per_user': 3}
 
-        # Create users (super heroes)
-        marvel_heroes = [
+HERO_TEAMS = [
+    {
+        'name': 'Team Marvel',
+        'description': 'Marvel Super Heroes',
+        'heroes': [
             {'username': 'ironman', 'email': 'ironman@marvel.com', 'first_name': 'Tony', 'last_name': 'Stark'},
             {'username': 'captainamerica', 'email': 'cap@marvel.com', 'first_name': 'Steve', 'last_name': 'Rogers'},
             {'username': 'blackwidow', 'email': 'widow@marvel.com', 'first_name': 'Natasha', 'last_name': 'Romanoff'},
-        ]
-        dc_heroes = [
+        ],
+        'activity': {'activity_type': 'running', 'duration_minutes': 30, 'distance_km': 5.0,
+                     'calories_burned': 300, 'description': 'Morning run'},
+    },
+    {
+        'name': 'Team DC',
+        'description': 'DC Super Heroes',
+        'heroes': [
             {'username': 'batman', 'email': 'batman@dc.com', 'first_name': 'Bruce', 'last_name': 'Wayne'},
             {'username': 'superman', 'email': 'superman@dc.com', 'first_name': 'Clark', 'last_name': 'Kent'},
             {'username': 'wonderwoman', 'email': 'wonderwoman@dc.com', 'first_name': 'Diana', 'last_name': 'Prince'},
-        ]
+        ],
+        'activity': {'activity_type': 'cycling', 'duration_minutes': 45, 'distance_km': 15.0,
+                     'calories_burned': 500, 'description': 'Evening ride'},
+    },
+]
 
-        marvel_users = [User.objects.create_user(**hero) for hero in marvel_heroes]
-        dc_users = [User.objects.create_user(**hero) for hero in dc_heroes]
 
-        # Create profiles
-        for user in marvel_users + dc_users:
-            UserProfile.objects.create(user=user, fitness_level='beginner')
+class Command(BaseCommand):
+    help = 'Populate the octofit_db database with test data'
 
-        # Create teams
-        marvel_team = Team.objects.create(name='Team Marvel', description='Marvel Super Heroes', owner=marvel_users[0])
-        dc_team = Team.objects.create(name='Team DC', description='DC Super Heroes', owner=dc_users[0])
-        marvel_team.members.set(marvel_users)
-        dc_team.members.set(dc_users)
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=0,
+                            help=f"Add N x {SCALE_UNIT['users']} synthetic users with teams, activities and workouts")
+        parser.add_argument('--seed', type=int, help='Random seed for reproducible synthetic data')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert or delete')
 
-        # Create activities
-        for user in marvel_users:
-            Activity.objects.create(
-                user=user,
-                activity_type='running',
-                duration_minutes=30,
-                distance_km=5.0,
-                calories_burned=300,
-                description='Morning run',
-                activity_date=datetime.now()
-            )
-        for user in dc_users:
-            Activity.objects.create(
-                user=user,
-                activity_type='cycling',
-                duration_minutes=45,
-                distance_km=15.0,
-                calories_burned=500,
-                description='Evening ride',
-                activity_date=datetime.now()
-            )
+    def handle(self, *args, **options):
+        if options['scale'] < 0:
+            raise CommandError('--scale must not be negative')
+        self.started = self.phase_started = time.perf_counter()
+        batch_size = options['batch_size']
+        now = timezone.now()
+
+        # Delete existing data table by table, without loading rows or cascading through the ORM
+        for model in (Activity, ActivityRollup, Leaderboard, Workout, Job, UserProfile, Team.members.through, Team):
+            raw_delete(model.objects.all())
+        # An IN list, as djongo cannot translate the NOT "is_superuser" that is_superuser=False renders to
+        delete_users(list(User.objects.filter(is_superuser__in=[False]).values_list('id', flat=True)), batch_size)
+        self.phase('Cleared existing data')
+
+        # Create users (super heroes), their profiles and teams
+        password = make_password(None)
+        User.objects.bulk_create([
+            User(password=password, date_joined=now, **hero) for team in HERO_TEAMS for hero in team['heroes']
+        ])
+        users = User.objects.in_bulk([hero['username'] for team in HERO_TEAMS for hero in team['heroes']],
+                                     field_name='username')
+        UserProfile.objects.bulk_create([UserProfile(user=user, fitness_level='beginner') for user in users.values()])
+        Team.objects.bulk_create(assign_object_ids([
+            Team(name=team['name'], description=team['description'], owner=users[team['heroes'][0]['username']])
+            for team in HERO_TEAMS
+        ]))
+        teams = {team.name: team for team in Team.objects.filter(name__in=[team['name'] for team in HERO_TEAMS])}
+        memberships = {
+            (teams[team['name']].pk, users[hero['username']].pk) for team in HERO_TEAMS for hero in team['heroes']
+        }
+        Team.members.through.objects.bulk_create([
+            Team.members.through(team_id=team_id, user_id=user_id) for team_id, user_id in memberships
+        ])
+        self.phase(f'Created {len(users)} heroes in {len(teams)} teams')
+
+        # Create activities, with the rollups their save signals would have written
+        activities = [
+            Activity(user=users[hero['username']], activity_date=now, **team['activity'])
+            for team in HERO_TEAMS for hero in team['heroes']
+        ]
+        Activity.objects.bulk_create(assign_object_ids(activities))
+        create_rollups(collect_deltas(map(snapshot, activities)), now)
 
         # Create workouts
-        for user in marvel_users + dc_users:
-            Workout.objects.create(
+        Workout.objects.bulk_create(assign_object_ids([
+            Workout(
                 user=user,
                 fitness_level='beginner',
                 workout_type='cardio',
@@ -73,20 +103,35 @@ class Command(BaseCommand):
                 duration_minutes=40,
                 exercises=['Warm-up', 'Cardio', 'Cool-down'],
                 difficulty_rating=7,
-                suggested_date=datetime.now() + timedelta(days=1)
+                suggested_date=now + timedelta(days=1)
             )
+            for user in users.values()
+        ]))
+        self.phase(f'Created {len(activities)} activities and {len(users)} workouts')
 
-        # Create leaderboard entries
-        for idx, user in enumerate(marvel_users + dc_users, start=1):
-            Leaderboard.objects.create(
-                team=marvel_team if user in marvel_users else dc_team,
-                user=user,
-                total_activities=1,
-                total_calories=300 if user in marvel_users else 500,
-                total_distance=5.0 if user in marvel_users else 15.0,
-                total_duration_minutes=30 if user in marvel_users else 45,
-                rank=idx,
-                points=100 * idx
-            )
+        if options['scale']:
+            scale = options['scale']
+            seeder = Seeder(prefix='scale', seed=options['seed'], batch_size=batch_size, now=now,
+                            log=lambda message: self.phase(f'Created {message}'))
+            user_ids = seeder.create_users(SCALE_UNIT['users'] * scale)
+            seeder.create_teams(SCALE_UNIT['teams'] * scale, user_ids)
+            seeder.create_activities(user_ids, SCALE_UNIT['activities'] * scale)
+            seeder.create_workouts(user_ids, per_user=SCALE_UNIT['workouts_per_user'])
+
+        # Build every user's suggestion list around the workouts above
+        result = refresh_all_suggestions(batch_size=batch_size)
+        self.phase(f"Built suggestions for {result['users']} users ({result['created']} workouts generated)")
+
+        # Compute leaderboard entries from the activities above
+        result = recompute_leaderboard()
+        self.phase(f"Computed {result['created']} leaderboard entries")
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Database populated with test data in {time.perf_counter() - self.started:.1f}s!'
+        ))
 
-        self.stdout.write(self.style.SUCCESS('Database populated with test data!'))
\ No newline at end of file
+    def phase(self, message):
+        """Print a phase with its own duration and the running total"""
+        now = time.perf_counter()
+        self.stdout.write(f'{message} ({now - self.phase_started:.2f}s, total {now - self.started:.2f}s)')
+        self.phase_started = now
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from octofit_tracker.rollups import reconcile_rollups
+
+
+class Command(BaseCommand):
+    help = 'Backfill activity rollups and reconcile them against the activities collection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only reconcile rollups for this user id (repeatable)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report differences without writing them')
+
+    def handle(self, *args, **options):
+        result = reconcile_rollups(user_ids=options['user_ids'], dry_run=options['dry_run'])
+        prefix = 'Would reconcile' if options['dry_run'] else 'Reconciled'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} activity rollups: {result['created']} created, "
+            f"{result['updated']} updated, {result['deleted']} deleted"
+        ))
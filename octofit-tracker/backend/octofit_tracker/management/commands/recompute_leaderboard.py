@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from octofit_tracker.leaderboard import RANKING_METHODS, recompute_leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Recompute leaderboard totals, points and ranks from activity rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--method', choices=RANKING_METHODS, default='competition',
+                            help='Tie handling: competition (1224) or dense (1223) ranking')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = recompute_leaderboard(method=options['method'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Leaderboard recomputed in {elapsed:.2f}s: {result['updated']} updated, "
+            f"{result['created']} created, {result['deleted']} deleted"
+        ))
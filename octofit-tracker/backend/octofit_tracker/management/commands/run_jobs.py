@@ -0,0 +1,45 @@
+import json
+import os
+import socket
+import time
+from django.core.management.base import BaseCommand
+from octofit_tracker.jobs import queue_depth, requeue_stale, run_batch
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (leaderboard recomputes, suggestion refreshes) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Jobs claimed per batch')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when no job is due')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due')
+        parser.add_argument('--stats', action='store_true', help='Print queue depth as JSON and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(queue_depth(), indent=2))
+            return
+
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.stdout.write(f'Worker {worker_id} started')
+        try:
+            while True:
+                requeued = requeue_stale()
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale jobs'))
+                started = time.perf_counter()
+                result = run_batch(worker_id, options['batch_size'])
+                if result['claimed']:
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"Ran {result['ran']} jobs for {result['claimed']} queued in {elapsed:.2f}s: "
+                        f"{result['succeeded']} succeeded, {result['retried']} retried, {result['failed']} failed"
+                    )
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker_id} stopped'))
@@ -0,0 +1,56 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from octofit_tracker.slow_queries import rank_offenders, read_entries
+
+
+class Command(BaseCommand):
+    help = 'Rank the slowest MongoDB query shapes recorded in the slow-query log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=settings.SLOW_QUERY_LOG, help='Slow-query log to read')
+        parser.add_argument('--sort', choices=('total', 'count', 'max', 'mean'), default='total',
+                            help='Rank by total, count, max or mean duration')
+        parser.add_argument('--limit', type=int, default=10, help='Query shapes to show')
+        parser.add_argument('--view', help='Only commands issued by this view')
+        parser.add_argument('--since', help='Only commands logged at or after this ISO timestamp')
+        parser.add_argument('--verbose', action='store_true', help='Show the slowest query, SQL and plan per shape')
+        parser.add_argument('--json', action='store_true', help='Print the ranking as JSON')
+
+    def handle(self, *args, **options):
+        entries = read_entries(options['log'])
+        if options['view']:
+            entries = (entry for entry in entries if entry.get('view') == options['view'])
+        if options['since']:
+            entries = (entry for entry in entries if entry['timestamp'] >= options['since'])
+        ranking = rank_offenders(entries, options['sort'])[:options['limit']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(ranking, indent=2, default=str))
+            return
+        if not ranking:
+            self.stdout.write('No slow queries logged')
+            return
+
+        self.stdout.write(f"{'#':>3} {'count':>7} {'total ms':>11} {'mean ms':>9} {'max ms':>9}  "
+                          f"{'plan':<11} command")
+        for position, group in enumerate(ranking, 1):
+            explain = group['explain'] or {}
+            if 'error' in explain or not explain:
+                plan = '-'
+            elif explain.get('collection_scan'):
+                plan = 'COLLSCAN'
+            else:
+                plan = ','.join(explain.get('indexes', [])) or 'index'
+            views = ', '.join(f'{view} ({count})' for view, count in
+                              sorted(group['views'].items(), key=lambda item: -item[1]))
+            self.stdout.write(
+                f"{position:>3} {group['count']:>7} {group['total_ms']:>11.1f} {group['mean_ms']:>9.1f} "
+                f"{group['max_ms']:>9.1f}  {plan:<11} {group['command']} {group['collection']}  [{views}]"
+            )
+            if options['verbose']:
+                sample = group['sample']
+                self.stdout.write(f"      sql:   {sample.get('sql')}")
+                self.stdout.write(f"      query: {json.dumps(sample['query'], default=str)}")
+                if explain:
+                    self.stdout.write(f"      plan:  {' <- '.join(explain.get('stages', [])) or explain.get('error')}")
@@ -0,0 +1,58 @@
+"""Set-based bulk changes to team membership
+
+Every user id in a request is validated with one query and the team's current
+members are read once; the difference is then applied with at most one bulk
+insert and one delete on the membership (through) table. Writing the through
+table directly bypasses m2m_changed, so cached leaderboards are invalidated
+here, and the team's updated_at is touched so leaderboard ETags change even
+when the member count does not.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from .caching import invalidate_teams
+from .models import Team
+
+Membership = Team.members.through
+
+ADD, REMOVE, SET = 'add', 'remove', 'set'
+
+
+def parse_user_ids(data):
+    """The set of integer user ids in a request body's `user_ids` list"""
+    user_ids = data.get('user_ids') if isinstance(data, dict) else None
+    if not isinstance(user_ids, list):
+        raise ValueError("Expected a list of 'user_ids'")
+    if len(user_ids) > settings.TEAM_BULK_MAX_MEMBERS:
+        raise ValueError(f'At most {settings.TEAM_BULK_MAX_MEMBERS} users per request')
+    invalid = ValueError("Invalid 'user_ids', expected integers")
+    if any(isinstance(user_id, (bool, float)) for user_id in user_ids):
+        raise invalid
+    try:
+        return {int(user_id) for user_id in user_ids}
+    except (TypeError, ValueError):
+        raise invalid
+
+
+def unknown_users(user_ids):
+    """Ids among `user_ids` with no user, in one query"""
+    return sorted(set(user_ids) - set(User.objects.filter(id__in=user_ids).values_list('id', flat=True)))
+
+
+def change_members(team, user_ids, mode):
+    """Add, remove or set exactly the given members; returns the ids added and removed"""
+    current = Membership.objects.filter(team_id=team.pk)
+    if mode != SET:
+        current = current.filter(user_id__in=user_ids)
+    current = set(current.values_list('user_id', flat=True))
+
+    added = user_ids - current if mode in (ADD, SET) else set()
+    removed = current - user_ids if mode == SET else current if mode == REMOVE else set()
+    if added:
+        Membership.objects.bulk_create([Membership(team_id=team.pk, user_id=user_id) for user_id in sorted(added)])
+    if removed:
+        Membership.objects.filter(team_id=team.pk, user_id__in=removed).delete()
+    if added or removed:
+        Team.objects.filter(pk=team.pk).update(updated_at=timezone.now())
+        invalidate_teams([team.pk])
+    return {'added': sorted(added), 'removed': sorted(removed)}
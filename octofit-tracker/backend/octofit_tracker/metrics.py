@@ -0,0 +1,169 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def escape(value):
+    """Escape a Prometheus label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    """Render a label set, e.g. {view="activity-list",method="GET"}"""
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_number(value):
+    """Render a sample value"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Prometheus counter keyed by label values"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels):
+        self.name, self.documentation, self.labels = name, documentation, labels
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            yield f'{self.name}{format_labels(self.labels, labels)} {format_number(value)}'
+
+
+class Histogram:
+    """Prometheus histogram keyed by label values"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels, buckets):
+        self.name, self.documentation, self.labels = name, documentation, labels
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.get(labels, (None, 0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self.values[labels] = (counts, total + value)
+
+    def samples(self):
+        with self.lock:
+            values = {labels: (list(counts), total) for labels, (counts, total) in self.values.items()}
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = format_number(bound if isinstance(bound, float) else float(bound))
+                yield f'{self.name}_bucket{format_labels(self.labels, labels, [("le", le)])} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labels, labels)} {format_number(float(total))}'
+            yield f'{self.name}_count{format_labels(self.labels, labels)} {cumulative}'
+
+
+VIEW_LABELS = ('view', 'method')
+
+requests_total = Counter(
+    'octofit_requests_total', 'Requests handled, by view, method and status', VIEW_LABELS + ('status',)
+)
+request_duration = Histogram(
+    'octofit_request_duration_seconds', 'Request latency by view', VIEW_LABELS, LATENCY_BUCKETS
+)
+db_queries = Histogram(
+    'octofit_db_queries', 'Database commands issued per request', VIEW_LABELS, QUERY_BUCKETS
+)
+db_duration = Histogram(
+    'octofit_db_duration_seconds', 'Database time per request', VIEW_LABELS, LATENCY_BUCKETS
+)
+serializer_duration = Histogram(
+    'octofit_serializer_duration_seconds', 'Serializer time per request', VIEW_LABELS, LATENCY_BUCKETS
+)
+response_size = Histogram(
+    'octofit_response_size_bytes', 'Response body size by view', VIEW_LABELS, SIZE_BUCKETS
+)
+
+REGISTRY = (requests_total, request_duration, db_queries, db_duration, serializer_duration, response_size)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Clear every recorded sample"""
+    for metric in REGISTRY:
+        with metric.lock:
+            metric.values.clear()
+
+
+class RequestMetrics:
+    """Database and serializer work done while handling one request"""
+    __slots__ = ('db_queries', 'db_seconds', 'serializer_seconds')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+
+
+# Set by MetricsMiddleware; None outside a measured request, which makes the hooks no-ops
+current_request = ContextVar('octofit_request_metrics', default=None)
+
+
+def add_db_time(seconds):
+    """Count one database command against the current request"""
+    metrics = current_request.get()
+    if metrics is not None:
+        metrics.db_queries += 1
+        metrics.db_seconds += seconds
+
+
+@contextmanager
+def timed_serialization():
+    """Add the time spent in the block to the current request's serializer time"""
+    metrics = current_request.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_seconds += time.perf_counter() - started
+
+
+def record_request(view, method, status, seconds, metrics, size):
+    """Record one finished request"""
+    labels = (view, method)
+    requests_total.inc(labels + (str(status),))
+    request_duration.observe(labels, seconds)
+    db_queries.observe(labels, metrics.db_queries)
+    db_duration.observe(labels, metrics.db_seconds)
+    serializer_duration.observe(labels, metrics.serializer_seconds)
+    if size is not None:
+        response_size.observe(labels, size)
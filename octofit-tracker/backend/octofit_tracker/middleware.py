@@ -0,0 +1,75 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from .metrics import RequestMetrics, add_db_time, current_request, record_request
+
+
+class MetricsMiddleware:
+    """Record per-view latency, database work, serializer time and response size
+
+    MongoDB command time comes from the pymongo CommandTimer registered in
+    apps.py; on other backends each SQL query of a sync request is timed with
+    an execute wrapper. Raises MiddlewareNotUsed unless METRICS_ENABLED, so
+    disabled metrics cost nothing per request.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.server_timing = settings.METRICS_SERVER_TIMING
+        self.wrap_queries = connection.vendor != 'djongo'
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token, started = self.start()
+        try:
+            if self.wrap_queries:
+                with connection.execute_wrapper(self.time_query):
+                    response = self.get_response(request)
+            else:
+                response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        metrics, token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    def start(self):
+        metrics = RequestMetrics()
+        return metrics, current_request.set(metrics), time.perf_counter()
+
+    def finish(self, request, response, metrics, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        size = None if response.streaming else len(response.content)
+        record_request(view, request.method, response.status_code, elapsed, metrics, size)
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'app;dur={elapsed * 1000:.1f}, '
+                f'db;dur={metrics.db_seconds * 1000:.1f};desc="{metrics.db_queries} queries", '
+                f'serialize;dur={metrics.serializer_seconds * 1000:.1f}'
+            )
+        return response
+
+    @staticmethod
+    def time_query(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            add_db_time(time.perf_counter() - started)
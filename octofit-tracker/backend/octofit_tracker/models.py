@@ -67,6 +67,8 @@ class Activity(djongo_models.Model):
     calories_burned = models.IntegerField(blank=True, null=True)
     description = models.TextField(blank=True, null=True)
     activity_date = models.DateTimeField()
+    # Client-supplied key so retried device uploads are not stored twice
+    idempotency_key = models.CharField(max_length=100, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -75,18 +77,46 @@ class Activity(djongo_models.Model):
 
     class Meta:
         db_table = 'activities'
+        indexes = [
+            models.Index(fields=['user', '-activity_date', '-_id'], name='activity_user_date_idx'),
+        ]
+        # activity_idempotency_idx, unique over non-empty keys, is created by mongo.ensure_partial_indexes
+
+
+class ActivityRollup(djongo_models.Model):
+    """Daily activity totals per user and activity type, maintained incrementally"""
+    _id = djongo_models.ObjectIdField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_rollups')
+    activity_type = models.CharField(max_length=50)
+    day = models.DateField()
+    total_activities = models.IntegerField(default=0)
+    total_calories = models.IntegerField(default=0)
+    total_distance = models.FloatField(default=0.0)
+    total_duration_minutes = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.activity_type} - {self.day}"
+
+    class Meta:
+        db_table = 'activity_rollups'
+        unique_together = ('user', 'activity_type', 'day')
+        indexes = [
+            models.Index(fields=['user', 'day'], name='rollup_user_day_idx'),
+        ]
 
 
 class Leaderboard(djongo_models.Model):
     """Leaderboard model for competitive tracking"""
     _id = djongo_models.ObjectIdField()
-    team = models.OneToOneField(Team, on_delete=models.CASCADE, related_name='leaderboard')
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='leaderboard')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_entries')
     total_activities = models.IntegerField(default=0)
     total_calories = models.IntegerField(default=0)
     total_distance = models.FloatField(default=0.0)
     total_duration_minutes = models.IntegerField(default=0)
     rank = models.IntegerField()
+    team_rank = models.IntegerField(default=0)
     points = models.IntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -96,6 +126,10 @@ class Leaderboard(djongo_models.Model):
     class Meta:
         db_table = 'leaderboard'
         ordering = ['rank']
+        indexes = [
+            models.Index(fields=['rank', '_id'], name='leaderboard_rank_idx'),
+            models.Index(fields=['team', 'rank', '_id'], name='leaderboard_team_rank_idx'),
+        ]
 
 
 class Workout(djongo_models.Model):
@@ -127,6 +161,8 @@ class Workout(djongo_models.Model):
     difficulty_rating = models.IntegerField(default=5)  # 1-10 scale
     suggested_date = models.DateTimeField()
     is_completed = models.BooleanField(default=False)
+    # Position in the user's materialized suggestion list, 0 when not suggested (see suggestions.py)
+    suggestion_rank = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -135,3 +171,43 @@ class Workout(djongo_models.Model):
 
     class Meta:
         db_table = 'workouts'
+        indexes = [
+            models.Index(fields=['user', 'suggested_date', '_id'], name='workout_user_date_idx'),
+            models.Index(fields=['user', 'suggestion_rank'], name='workout_suggestions_idx'),
+        ]
+
+
+class Job(djongo_models.Model):
+    """Background job queued for the run_jobs worker; deleted once it succeeds"""
+    _id = djongo_models.ObjectIdField()
+    kind = models.CharField(max_length=50)
+    # Jobs sharing a key do the same work; pending duplicates are coalesced
+    key = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('pending', 'Pending'),
+            ('running', 'Running'),
+            ('failed', 'Failed'),
+        ],
+        default='pending'
+    )
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, blank=True, null=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
+
+    class Meta:
+        db_table = 'jobs'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_due_idx'),
+            models.Index(fields=['key', 'status'], name='job_key_idx'),
+        ]
+        # job_pending_key_idx, unique over pending jobs, is created by mongo.ensure_partial_indexes
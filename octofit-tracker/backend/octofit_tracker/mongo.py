@@ -0,0 +1,147 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import connections
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+# Unique indexes over only the documents matching a filter, by collection. djongo
+# drops the condition of a conditional UniqueConstraint, which would make these
+# unique over every document, so ensure_partial_indexes() creates them instead.
+PARTIAL_UNIQUE_INDEXES = {
+    'activities': {
+        # An idempotency key is stored once per user; activities without one are not indexed
+        'activity_idempotency_idx': ([('user_id', 1), ('idempotency_key', 1)], {'idempotency_key': {'$gt': ''}}),
+    },
+    'jobs': {
+        # At most one pending job per key, so concurrent enqueues coalesce
+        'job_pending_key_idx': ([('key', 1)], {'status': 'pending'}),
+    },
+}
+
+
+def get_database(alias='default'):
+    """pymongo Database behind a djongo connection"""
+    connection = connections[alias]
+    if connection.vendor != 'djongo':
+        raise ImproperlyConfigured(f"Database '{alias}' does not use the djongo MongoDB backend")
+    connection.ensure_connection()
+    return connection.connection
+
+
+def ensure_partial_indexes(using='default', **kwargs):
+    """Create PARTIAL_UNIQUE_INDEXES on a djongo database; connected to post_migrate"""
+    if connections[using].vendor != 'djongo':
+        return
+    db = get_database(using)
+    for collection, indexes in PARTIAL_UNIQUE_INDEXES.items():
+        for name, (keys, condition) in indexes.items():
+            db[collection].create_index(keys, name=name, unique=True, partialFilterExpression=condition)
+
+
+def is_duplicate_key_error(exc):
+    """Whether a database error was caused by a unique index violation
+
+    djongo raises these as DatabaseError rather than IntegrityError, with the
+    pymongo error at the end of the exception's cause chain.
+    """
+    while exc is not None:
+        if isinstance(exc, DuplicateKeyError):
+            return True
+        if isinstance(exc, BulkWriteError):
+            return all(error.get('code') == 11000 for error in exc.details.get('writeErrors', []))
+        exc = exc.__cause__
+    return False
+
+
+def get_collection(model, alias='default'):
+    """pymongo Collection holding a djongo model's documents"""
+    return get_database(alias)[model._meta.db_table]
+
+
+def document_values(model, values, alias='default'):
+    """Field values as djongo stores them, keyed by column name"""
+    connection = connections[alias]
+    fields = {name: model._meta.get_field(name) for name in values}
+    return {
+        fields[name].column: fields[name].get_db_prep_save(value, connection)
+        for name, value in values.items()
+    }
+
+
+def assign_object_ids(objs):
+    """Give unsaved instances an ObjectId so bulk_create does not insert them with a null _id
+
+    djongo's ObjectIdField is not an AutoField, so bulk_create keeps _id in the
+    insert and a batch of several new rows fails with a duplicate key error.
+    """
+    for obj in objs:
+        if obj.pk is None:
+            obj.pk = ObjectId()
+    return objs
+
+
+def bulk_set(model, objs, fields, alias='default'):
+    """Write `fields` of saved instances with one unordered bulk_write
+
+    Stands in for bulk_update, whose CASE WHEN updates djongo cannot translate.
+    """
+    if not objs:
+        return
+    get_collection(model, alias).bulk_write([
+        UpdateOne(
+            {'_id': obj.pk},
+            {'$set': document_values(model, {field: getattr(obj, field) for field in fields}, alias)},
+        )
+        for obj in objs
+    ], ordered=False)
+
+
+def plan_stages(plan):
+    """Flatten a query plan tree into its list of stages, outermost first"""
+    stages = []
+    while plan:
+        stages.append(plan)
+        children = plan.get('inputStages') or []
+        for child in children[1:]:
+            stages.extend(plan_stages(child))
+        plan = plan.get('inputStage') or (children[0] if children else None)
+    return stages
+
+
+def winning_plan(explain):
+    """Winning plan from find or aggregate explain output"""
+    if 'queryPlanner' in explain:
+        return explain['queryPlanner']['winningPlan']
+    for stage in explain.get('stages', []):
+        if '$cursor' in stage:
+            return stage['$cursor']['queryPlanner']['winningPlan']
+    return {}
+
+
+def summarize_explain(explain):
+    """Condense explain output into the scan type, indexes used and work done"""
+    stages = plan_stages(winning_plan(explain))
+    names = [stage.get('stage') for stage in stages]
+    stats = explain.get('executionStats') or {}
+    return {
+        'collection_scan': 'COLLSCAN' in names,
+        'in_memory_sort': 'SORT' in names,
+        'indexes': sorted({stage['indexName'] for stage in stages if stage.get('indexName')}),
+        'stages': names,
+        'keys_examined': stats.get('totalKeysExamined'),
+        'docs_examined': stats.get('totalDocsExamined'),
+        'returned': stats.get('nReturned'),
+    }
+
+
+def parse_pk(model, value):
+    """An id from the URL or query string as the model's pk type, or None when malformed
+
+    djongo hands lookup values to MongoDB unconverted, so a string id would
+    never match a stored ObjectId.
+    """
+    try:
+        return model._meta.pk.to_python(value)
+    except (TypeError, ValueError, ValidationError, InvalidId):
+        return None
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import deque
+from django.db import connections
+from pymongo import monitoring
+from .metrics import add_db_time
+
+# Recent checkout waits kept for percentiles; older samples fall off the end
+WAIT_SAMPLES = 1000
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a sorted list, or None when it is empty"""
+    if not samples:
+        return None
+    index = min(len(samples) - 1, max(0, int(round(fraction * len(samples))) - 1))
+    return samples[index]
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Track pymongo connection pool usage and checkout wait times per server
+
+    pymongo checks a connection out on the calling thread, so the wait is the
+    time between that thread's checkout-started and checked-out events.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self.reset()
+
+    def reset(self):
+        """Forget all counters and samples"""
+        with self.lock:
+            self.pools = {}
+            self.waits.clear()
+            self.checkouts = 0
+            self.checkout_failures = {}
+
+    def pool(self, address):
+        """Counters for one server's pool"""
+        key = '%s:%s' % address
+        return self.pools.setdefault(key, {'open': 0, 'checked_out': 0, 'max_checked_out': 0})
+
+    def pool_created(self, event):
+        with self.lock:
+            self.pool(event.address)
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self.lock:
+            self.pools.pop('%s:%s' % event.address, None)
+
+    def connection_created(self, event):
+        with self.lock:
+            self.pool(event.address)['open'] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self.lock:
+            pool = self.pool(event.address)
+            pool['open'] = max(0, pool['open'] - 1)
+
+    def connection_check_out_started(self, event):
+        self.local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self.local.started = None
+        with self.lock:
+            self.checkout_failures[event.reason] = self.checkout_failures.get(event.reason, 0) + 1
+
+    def connection_checked_out(self, event):
+        started = getattr(self.local, 'started', None)
+        self.local.started = None
+        with self.lock:
+            self.checkouts += 1
+            if started is not None:
+                self.waits.append((time.perf_counter() - started) * 1000)
+            pool = self.pool(event.address)
+            pool['checked_out'] += 1
+            pool['max_checked_out'] = max(pool['max_checked_out'], pool['checked_out'])
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            pool = self.pool(event.address)
+            pool['checked_out'] = max(0, pool['checked_out'] - 1)
+
+    def snapshot(self, max_pool_size=None):
+        """Current pool utilization and checkout wait statistics"""
+        with self.lock:
+            pools = {address: dict(pool) for address, pool in self.pools.items()}
+            waits = sorted(self.waits)
+            checkouts = self.checkouts
+            failures = dict(self.checkout_failures)
+        if max_pool_size:
+            for pool in pools.values():
+                pool['utilization'] = round(pool['checked_out'] / max_pool_size, 4)
+        return {
+            'pools': pools,
+            'checkouts': checkouts,
+            'checkout_failures': failures,
+            'checkout_wait_ms': {
+                'samples': len(waits),
+                'mean': round(sum(waits) / len(waits), 3) if waits else None,
+                'p50': percentile(waits, 0.5),
+                'p95': percentile(waits, 0.95),
+                'max': waits[-1] if waits else None,
+            },
+        }
+
+
+pool_monitor = PoolMonitor()
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Add every MongoDB command's duration to the current request's database time"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        add_db_time(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        add_db_time(event.duration_micros / 1e6)
+
+
+command_timer = CommandTimer()
+
+
+def round_trip_ms(alias='default'):
+    """Time one round trip to the database: a ping on MongoDB, SELECT 1 elsewhere"""
+    connection = connections[alias]
+    connection.ensure_connection()
+    started = time.perf_counter()
+    if connection.vendor == 'djongo':
+        connection.connection.command('ping')
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    return round((time.perf_counter() - started) * 1000, 3)
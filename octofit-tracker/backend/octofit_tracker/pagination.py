@@ -0,0 +1,127 @@
+import json
+from datetime import date, datetime
+from bson.errors import InvalidId
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+def reverse_ordering(ordering):
+    """Flip the direction of every field in an ordering tuple"""
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+def after_position(ordering, values):
+    """Q selecting rows that sort strictly after `values` in `ordering`"""
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    return condition
+
+
+def ordering_fields(view):
+    """Model fields a view's keyset paginator reads from every row"""
+    pagination_class = getattr(view, 'pagination_class', None)
+    if not (pagination_class and issubclass(pagination_class, KeysetCursorPagination)):
+        return []
+    return [field.lstrip('-') for field in pagination_class.ordering]
+
+
+class KeysetCursorPagination(CursorPagination):
+    """Cursor pagination positioned on every ordering field, not just the first
+
+    DRF's CursorPagination positions on the first ordering field and skips ties
+    with an offset. Filtering on the full compound key (e.g. activity_date, _id)
+    makes every page one range scan on the matching index, however deep.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-_id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        current_position = self.cursor.position if self.cursor else None
+
+        ordering = reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            values = self.decode_position(queryset, current_position)
+            queryset = queryset.filter(after_position(ordering, values))
+
+        # Fetch one extra row to learn whether another page follows
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > len(self.page)
+        if reverse:
+            self.page.reverse()
+
+        first = self._get_position_from_instance(self.page[0], self.ordering) if self.page else current_position
+        last = self._get_position_from_instance(self.page[-1], self.ordering) if self.page else current_position
+        self.has_next = has_following if not reverse else current_position is not None
+        self.has_previous = current_position is not None if not reverse else has_following
+        self.next_position = last
+        self.previous_position = first
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            name = field.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            values.append(value.isoformat() if isinstance(value, (date, datetime)) else str(value))
+        return json.dumps(values)
+
+    def decode_position(self, queryset, position):
+        """Convert an encoded cursor position back into field values"""
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError(position)
+            meta = queryset.model._meta
+            return [
+                meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError, InvalidId):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class ActivityCursorPagination(KeysetCursorPagination):
+    """Newest activities first, keyed on (activity_date, _id)"""
+    ordering = ('-activity_date', '-_id')
+
+
+class WorkoutCursorPagination(KeysetCursorPagination):
+    """Soonest suggested workouts first, keyed on (suggested_date, _id)"""
+    ordering = ('suggested_date', '_id')
+
+
+class LeaderboardCursorPagination(KeysetCursorPagination):
+    """Best ranked entries first, keyed on (rank, _id)"""
+    ordering = ('rank', '_id')
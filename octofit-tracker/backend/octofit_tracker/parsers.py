@@ -0,0 +1,30 @@
+import json
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """Parse newline-delimited JSON into a list, one object per line
+
+    Parsing stops one item past ACTIVITY_BULK_MAX_ITEMS: that is enough for the
+    view to reject the request, so the rest of an oversized body is never decoded.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        limit = settings.ACTIVITY_BULK_MAX_ITEMS + 1
+        items = []
+        for number, line in enumerate(stream, start=1):
+            if len(items) == limit:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line.decode(encoding)))
+            except ValueError as exc:
+                raise ParseError(f'NDJSON parse error on line {number}: {exc}')
+        return items
@@ -0,0 +1,143 @@
+from collections import defaultdict
+from django.utils import timezone
+from pymongo.errors import DuplicateKeyError
+from .models import Activity, ActivityRollup
+from .mongo import assign_object_ids, bulk_set, document_values, get_collection
+
+ROLLUP_FIELDS = ('total_activities', 'total_calories', 'total_distance', 'total_duration_minutes')
+
+
+def activity_day(activity_date):
+    """Calendar day an activity is rolled up under, in the current timezone"""
+    if timezone.is_aware(activity_date):
+        activity_date = timezone.localtime(activity_date)
+    return activity_date.date()
+
+
+def rollup_key(user_id, activity_type, activity_date):
+    """Key identifying the rollup row an activity belongs to"""
+    return (user_id, activity_type, activity_day(activity_date))
+
+
+def activity_deltas(values, sign=1):
+    """Rollup increments contributed by one activity's field values"""
+    return (
+        sign,
+        sign * (values['calories_burned'] or 0),
+        sign * (values['distance_km'] or 0),
+        sign * values['duration_minutes'],
+    )
+
+
+def snapshot(activity):
+    """Capture the rollup-relevant fields of an activity"""
+    return {
+        'user_id': activity.user_id,
+        'activity_type': activity.activity_type,
+        'activity_date': activity.activity_date,
+        'calories_burned': activity.calories_burned,
+        'distance_km': activity.distance_km,
+        'duration_minutes': activity.duration_minutes,
+    }
+
+
+def collect_deltas(snapshots, sign=1, deltas=None):
+    """Merge activity snapshots into per-rollup-key increments"""
+    deltas = deltas if deltas is not None else defaultdict(lambda: [0, 0, 0.0, 0])
+    for values in snapshots:
+        key = rollup_key(values['user_id'], values['activity_type'], values['activity_date'])
+        for index, delta in enumerate(activity_deltas(values, sign)):
+            deltas[key][index] += delta
+    return deltas
+
+
+def apply_deltas(deltas):
+    """Apply increments to rollup rows with atomic $inc upserts"""
+    rollups = get_collection(ActivityRollup)
+    for (user_id, activity_type, day), increments in deltas.items():
+        if not any(increments):
+            continue
+        key = document_values(ActivityRollup, {'user': user_id, 'activity_type': activity_type, 'day': day})
+        update = {
+            '$inc': dict(zip(ROLLUP_FIELDS, increments)),
+            '$set': document_values(ActivityRollup, {'updated_at': timezone.now()}),
+        }
+        # Only additions create rows; the unique (user, activity_type, day) index keeps one per key
+        try:
+            rollups.update_one(key, update, upsert=increments[0] > 0)
+        except DuplicateKeyError:
+            # Another writer created the row first; fold our increment into it
+            rollups.update_one(key, update)
+        if increments[0] < 0:
+            rollups.delete_one({**key, 'total_activities': {'$lte': 0}})
+
+
+def record_activities(activities, sign=1):
+    """Add (or with sign=-1, remove) activities from the rollups"""
+    apply_deltas(collect_deltas((snapshot(activity) for activity in activities), sign))
+
+
+def record_activity_change(previous, activity):
+    """Move an updated activity's contribution from its old values to its new ones"""
+    deltas = collect_deltas([previous], sign=-1)
+    apply_deltas(collect_deltas([snapshot(activity)], deltas=deltas))
+
+
+def computed_rollups(user_ids=None):
+    """Rollup totals computed directly from the Activity collection
+
+    Activities are bucketed by day in Python with the same activity_day() the
+    incremental updates use, as djongo cannot translate TruncDate.
+    """
+    activities = Activity.objects.all()
+    if user_ids:
+        activities = activities.filter(user_id__in=user_ids)
+    rows = activities.values(
+        'user_id', 'activity_type', 'activity_date', 'calories_burned', 'distance_km', 'duration_minutes'
+    ).order_by()
+    return {key: tuple(totals) for key, totals in collect_deltas(rows.iterator(chunk_size=1000)).items()}
+
+
+def reconcile_rollups(user_ids=None, dry_run=False):
+    """Backfill and repair rollups so they match the Activity collection"""
+    expected = computed_rollups(user_ids)
+    existing = ActivityRollup.objects.all()
+    if user_ids:
+        existing = existing.filter(user_id__in=user_ids)
+
+    to_update, stale_ids = [], []
+    for rollup in existing:
+        key = (rollup.user_id, rollup.activity_type, rollup.day)
+        totals = expected.pop(key, None)
+        if totals is None:
+            stale_ids.append(rollup.pk)
+            continue
+        current = tuple(getattr(rollup, field) for field in ROLLUP_FIELDS)
+        if not totals_match(current, totals):
+            for field, value in zip(ROLLUP_FIELDS, totals):
+                setattr(rollup, field, value)
+            rollup.updated_at = timezone.now()
+            to_update.append(rollup)
+
+    to_create = [
+        ActivityRollup(
+            user_id=user_id, activity_type=activity_type, day=day,
+            **dict(zip(ROLLUP_FIELDS, totals))
+        )
+        for (user_id, activity_type, day), totals in expected.items()
+    ]
+
+    if not dry_run:
+        ActivityRollup.objects.bulk_create(assign_object_ids(to_create), batch_size=1000)
+        bulk_set(ActivityRollup, to_update, ROLLUP_FIELDS + ('updated_at',))
+        ActivityRollup.objects.filter(pk__in=stale_ids).delete()
+
+    return {'created': len(to_create), 'updated': len(to_update), 'deleted': len(stale_ids)}
+
+
+def totals_match(current, expected):
+    """Compare rollup totals, tolerating float rounding in distances"""
+    return all(
+        abs(a - b) < 1e-6 if isinstance(a, float) or isinstance(b, float) else a == b
+        for a, b in zip(current, expected)
+    )
@@ -0,0 +1,266 @@
+"""Batched generation of synthetic users, teams, activities and workouts
+
+Used by generate_load_data to build production-sized datasets. Rows are
+written with bulk_create in fixed-size batches and activities are streamed a
+chunk of users at a time, so memory stays flat however many rows are made.
+Activities bypass the save signals, so their rollups are built here from the
+same generated values.
+"""
+import random
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+from .models import Activity, ActivityRollup, Leaderboard, Team, UserProfile, Workout
+from .mongo import assign_object_ids
+from .rollups import ROLLUP_FIELDS, collect_deltas, snapshot
+from .suggestions import EXERCISES, WORKOUT_TYPES
+
+# Relative frequency, duration range (minutes), speed range (km/h, None for no distance) and kcal/minute
+ACTIVITY_PROFILES = {
+    'running': (25, (20, 75), (8, 13), 11),
+    'walking': (20, (15, 90), (4, 6), 5),
+    'cycling': (15, (30, 150), (15, 28), 9),
+    'swimming': (6, (20, 60), (2, 4), 10),
+    'gym': (14, (30, 90), None, 7),
+    'yoga': (10, (20, 75), None, 4),
+    'sports': (6, (45, 120), None, 9),
+    'other': (4, (10, 60), None, 5),
+}
+ACTIVITY_TYPES = list(ACTIVITY_PROFILES)
+ACTIVITY_WEIGHTS = [profile[0] for profile in ACTIVITY_PROFILES.values()]
+
+FITNESS_LEVELS = ['beginner', 'intermediate', 'advanced']
+FITNESS_WEIGHTS = [50, 35, 15]
+
+# Hours of the day people log activities at, weighted towards mornings and evenings
+ACTIVITY_HOURS = list(range(5, 23))
+HOUR_WEIGHTS = [2, 6, 8, 6, 3, 2, 3, 5, 3, 2, 2, 3, 6, 8, 7, 5, 3, 1]
+
+
+def raw_delete(queryset):
+    """Delete matching rows in one statement, without loading them or sending signals"""
+    return queryset._raw_delete(queryset.db)
+
+
+def chunks(items, size):
+    """Consecutive slices of a list of at most `size` items"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def user_references():
+    """(model, field name) of every table with rows pointing at a user"""
+    references = [(field.remote_field.through, field.m2m_field_name()) for field in User._meta.many_to_many]
+    for relation in User._meta.related_objects:
+        if relation.many_to_many:
+            references.append((relation.through, relation.field.m2m_reverse_field_name()))
+        else:
+            references.append((relation.related_model, relation.field.name))
+    return references
+
+
+def delete_users(user_ids, batch_size=5000):
+    """Raw-delete users and every row referencing them directly, a batch of ids at a time
+
+    Rows that only reference those rows (a deleted team's leaderboard, say)
+    are left alone, so clear those tables first.
+    """
+    references = user_references()
+    deleted = 0
+    for chunk in chunks(user_ids, batch_size):
+        for model, field_name in references:
+            deleted += raw_delete(model.objects.filter(**{f'{field_name}__in': chunk}))
+        deleted += raw_delete(User.objects.filter(pk__in=chunk))
+    return deleted
+
+
+def create_rollups(deltas, now, batch_size=5000):
+    """Insert rollups for the increments of activities that were bulk-created"""
+    ActivityRollup.objects.bulk_create(assign_object_ids([
+        ActivityRollup(user_id=user_id, activity_type=activity_type, day=day,
+                       updated_at=now, **dict(zip(ROLLUP_FIELDS, increments)))
+        for (user_id, activity_type, day), increments in deltas.items()
+    ]), batch_size=batch_size)
+
+
+class Seeder:
+    """Generate related rows in batches from one seeded random source
+
+    Generated usernames and team names start with `prefix`, which is how a
+    dataset is found again for clearing or benchmarking.
+    """
+
+    def __init__(self, prefix='load', seed=None, batch_size=5000, now=None, log=None):
+        self.prefix = prefix
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.now = now or timezone.now()
+        self.log = log or (lambda message: None)
+
+    def username(self, index):
+        return f'{self.prefix}-user-{index:08d}'
+
+    def team_name(self, index):
+        return f'{self.prefix}-team-{index:06d}'
+
+    def user_ids(self):
+        """Ids of this dataset's users in creation order"""
+        return list(User.objects.filter(username__startswith=f'{self.prefix}-user-')
+                    .order_by('id').values_list('id', flat=True))
+
+    def team_ids(self):
+        """Primary keys of this dataset's teams in creation order"""
+        return list(Team.objects.filter(name__startswith=f'{self.prefix}-team-')
+                    .order_by('name').values_list('pk', flat=True))
+
+    def clear(self):
+        """Remove every row belonging to this dataset"""
+        user_ids = self.user_ids()
+        team_ids = self.team_ids()
+        deleted = 0
+        for chunk in chunks(team_ids, self.batch_size):
+            deleted += raw_delete(Team.members.through.objects.filter(team_id__in=chunk))
+            deleted += raw_delete(Leaderboard.objects.filter(team_id__in=chunk))
+            deleted += raw_delete(Team.objects.filter(pk__in=chunk))
+        return deleted + delete_users(user_ids, self.batch_size)
+
+    def create_users(self, count, start=0):
+        """Create users with profiles; one shared password hash keeps this fast"""
+        password = make_password(self.prefix)
+        for chunk in chunks(range(start, start + count), self.batch_size):
+            User.objects.bulk_create([
+                User(
+                    username=self.username(index),
+                    email=f'{self.username(index)}@example.com',
+                    first_name='Load',
+                    last_name=f'User {index}',
+                    password=password,
+                    date_joined=self.now,
+                )
+                for index in chunk
+            ], batch_size=self.batch_size)
+        user_ids = self.user_ids()
+        for chunk in chunks(user_ids[start:start + count], self.batch_size):
+            UserProfile.objects.bulk_create([
+                UserProfile(user_id=user_id, fitness_level=self.random.choices(FITNESS_LEVELS, FITNESS_WEIGHTS)[0])
+                for user_id in chunk
+            ], batch_size=self.batch_size)
+        self.log(f'{count} users and profiles')
+        return user_ids
+
+    def create_teams(self, count, user_ids, extra_team_share=0.2):
+        """Create teams and give every user one team, some a second; team sizes follow a power law"""
+        Team.objects.bulk_create(assign_object_ids([
+            Team(
+                name=self.team_name(index),
+                description=f'Synthetic team {index}',
+                owner_id=self.random.choice(user_ids),
+            )
+            for index in range(count)
+        ]), batch_size=self.batch_size)
+        team_ids = self.team_ids()
+        popularity = [1 / (rank + 1) ** 0.8 for rank in range(len(team_ids))]
+
+        memberships = set()
+        for user_id in user_ids:
+            teams = 2 if self.random.random() < extra_team_share else 1
+            for team_id in self.random.choices(team_ids, popularity, k=teams):
+                memberships.add((team_id, user_id))
+        through = Team.members.through
+        for chunk in chunks(sorted(memberships, key=lambda pair: (str(pair[0]), pair[1])), self.batch_size):
+            through.objects.bulk_create(
+                [through(team_id=team_id, user_id=user_id) for team_id, user_id in chunk],
+                batch_size=self.batch_size
+            )
+        self.log(f'{count} teams with {len(memberships)} memberships')
+        return team_ids
+
+    def activity_counts(self, user_ids, total):
+        """Split `total` activities across users with a heavy tail: most log a few, some log a lot"""
+        if not user_ids:
+            return []
+        weights = [self.random.paretovariate(1.5) for _ in user_ids]
+        scale = total / sum(weights)
+        counts = [int(weight * scale) for weight in weights]
+        for index in self.random.sample(range(len(counts)), min(len(counts), total - sum(counts))):
+            counts[index] += 1
+        return counts
+
+    def activity(self, user_id, days):
+        """One activity with a plausible type, duration, distance, calories and time"""
+        activity_type = self.random.choices(ACTIVITY_TYPES, ACTIVITY_WEIGHTS)[0]
+        _, (low, high), speed, kcal_per_minute = ACTIVITY_PROFILES[activity_type]
+        duration = self.random.randint(low, high)
+        distance = round(duration / 60 * self.random.uniform(*speed), 2) if speed else None
+        # Recent days are busier than older ones
+        day = int(self.random.random() ** 1.5 * days)
+        moment = (self.now - timedelta(days=day)).replace(
+            hour=self.random.choices(ACTIVITY_HOURS, HOUR_WEIGHTS)[0],
+            minute=self.random.randrange(60), second=0, microsecond=0
+        )
+        return Activity(
+            user_id=user_id,
+            activity_type=activity_type,
+            duration_minutes=duration,
+            distance_km=distance,
+            calories_burned=int(duration * kcal_per_minute * self.random.uniform(0.8, 1.2)),
+            description=f'{activity_type.title()} session',
+            activity_date=min(moment, self.now),
+        )
+
+    def create_activities(self, user_ids, total, days=365, users_per_chunk=1000):
+        """Create activities and their daily rollups, one chunk of users at a time"""
+        counts = self.activity_counts(user_ids, total)
+        created = 0
+        batch = []
+        for chunk_start in range(0, len(user_ids), users_per_chunk):
+            deltas = None
+            for user_id, count in zip(user_ids[chunk_start:chunk_start + users_per_chunk],
+                                      counts[chunk_start:chunk_start + users_per_chunk]):
+                for _ in range(count):
+                    batch.append(self.activity(user_id, days))
+                    if len(batch) >= self.batch_size:
+                        deltas = self.flush_activities(batch, deltas)
+                        created += len(batch)
+                        batch = []
+            if batch:
+                deltas = self.flush_activities(batch, deltas)
+                created += len(batch)
+                batch = []
+            # Every user in the chunk is complete, so their rollups can be written once
+            if deltas:
+                create_rollups(deltas, self.now, self.batch_size)
+            self.log(f'{created} of {total} activities')
+        return created
+
+    def flush_activities(self, batch, deltas):
+        """Insert a batch of activities and fold it into the chunk's rollup increments"""
+        Activity.objects.bulk_create(assign_object_ids(batch), batch_size=self.batch_size)
+        return collect_deltas(map(snapshot, batch), deltas=deltas)
+
+    def create_workouts(self, user_ids, per_user=3, days=30):
+        """Create suggested workouts spread over the coming days, a quarter already completed"""
+        levels = dict(UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', 'fitness_level'))
+        created = 0
+        for chunk in chunks(user_ids, max(1, self.batch_size // max(per_user, 1))):
+            workouts = []
+            for user_id in chunk:
+                for _ in range(per_user):
+                    workout_type = self.random.choice(WORKOUT_TYPES)
+                    workouts.append(Workout(
+                        user_id=user_id,
+                        fitness_level=levels.get(user_id, 'beginner'),
+                        workout_type=workout_type,
+                        title=f'{workout_type.title()} session',
+                        description=f'Suggested {workout_type} workout',
+                        duration_minutes=self.random.choice([20, 30, 45, 60]),
+                        exercises=self.random.sample(EXERCISES[workout_type], 2),
+                        difficulty_rating=self.random.randint(1, 10),
+                        suggested_date=self.now + timedelta(days=self.random.randrange(days)),
+                        is_completed=self.random.random() < 0.25,
+                    ))
+            Workout.objects.bulk_create(assign_object_ids(workouts), batch_size=self.batch_size)
+            created += len(workouts)
+        self.log(f'{created} workouts')
+        return created
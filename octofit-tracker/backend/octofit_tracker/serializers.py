@@ -1,71 +1,231 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from django.contrib.auth.models import User
+from .metrics import timed_serialization
 from .models import UserProfile, Team, Activity, Leaderboard, Workout
-
-
-class UserSerializer(serializers.ModelSerializer):
+from .pagination import ordering_fields
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    """ListSerializer that records the time spent producing .data"""
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class TimedSerializerMixin:
+    """Record the time spent producing .data as the request's serializer time
+
+    Pair with Meta.list_serializer_class = TimedListSerializer so many=True
+    serializers are timed too. Nested serializers never produce .data, so
+    they are counted once as part of their parent.
+    """
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+def field_tree(value):
+    """Parse a comma-separated list of dotted paths, e.g. 'team.members,user', into nested dicts"""
+    tree = {}
+    for path in value.split(',') if value else ():
+        node = tree
+        for name in filter(None, (part.strip() for part in path.split('.'))):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def fieldset_params(params):
+    """Normalized `fields` and `expand` query params, stable for use in cache keys"""
+    return tuple(
+        ','.join(sorted({path.strip() for path in params.get(name, '').split(',') if path.strip()}))
+        for name in ('fields', 'expand')
+    )
+
+
+def fieldset_key(params):
+    """Cache key fragment identifying a request's fieldset"""
+    fields, expand = fieldset_params(params)
+    return f'fields={fields}&expand={expand}'
+
+
+class FieldsetMixin:
+    """Sparse fieldsets and opt-in expansion of related objects
+
+    Relations are rendered as ids unless expanded, e.g. ?expand=team.members,user
+    swaps the ids for nested objects. ?fields=_id,rank,team.name keeps only the
+    listed fields; a dotted name limits an expanded object's fields. The root
+    serializer reads both from the request on safe methods; expanded ones get
+    their part of the tree from their parent.
+    """
+    # Field name -> (serializer class, extra kwargs) it is replaced with when expanded
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fieldset = None if fields is None and expand is None else (fields or {}, expand or {})
+
+    def requested_fieldset(self):
+        """(fields, expand) trees for this serializer"""
+        if self.fieldset is not None:
+            return self.fieldset
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return {}, {}
+        fields, expand = fieldset_params(request.query_params)
+        return field_tree(fields), field_tree(expand)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        only, expand = self.requested_fieldset()
+        for name, subtree in expand.items():
+            if name in self.expandable_fields and name in fields:
+                serializer_class, options = self.expandable_fields[name]
+                fields[name] = serializer_class(read_only=True, fields=only.get(name), expand=subtree, **options)
+        if only:
+            fields = type(fields)((name, field) for name, field in fields.items() if name in only)
+        return fields
+
+
+def eager_loading(serializer, prefix=''):
+    """select_related paths, Prefetch objects and .only() columns that serve exactly a serializer's fields
+
+    Columns are None when a field does not map onto a model field, in which
+    case nothing is deferred.
+    """
+    model = serializer.Meta.model
+    select, prefetch, columns = [], [], [f'{prefix}{model._meta.pk.name}']
+    for name, field in serializer.fields.items():
+        source = field.source if field.source != '*' else None
+        try:
+            model_field = model._meta.get_field(source or name)
+        except FieldDoesNotExist:
+            columns = None
+            continue
+        path = f'{prefix}{model_field.name}'
+        if isinstance(field, serializers.ListSerializer):
+            child_select, child_prefetch, child_columns = eager_loading(field.child)
+            related = model_field.related_model.objects.select_related(*child_select).prefetch_related(*child_prefetch)
+            prefetch.append(Prefetch(path, related.only(*child_columns) if child_columns else related))
+        elif isinstance(field, serializers.ManyRelatedField):
+            prefetch.append(Prefetch(path, model_field.related_model.objects.only('pk')))
+        elif isinstance(field, serializers.BaseSerializer):
+            child_select, child_prefetch, child_columns = eager_loading(field, f'{path}__')
+            select += [path, *child_select]
+            prefetch += child_prefetch
+            if columns is not None:
+                columns = None if child_columns is None else columns + [path, *child_columns]
+        elif columns is not None and model_field.concrete:
+            columns.append(path)
+    return select, prefetch, columns
+
+
+def optimize_queryset(queryset, serializer, extra_columns=()):
+    """Load only what a serializer renders: joins for expanded objects, prefetches for lists, no other columns
+
+    `extra_columns` are loaded too, e.g. the fields a paginator orders by.
+    """
+    select, prefetch, columns = eager_loading(serializer)
+    queryset = queryset.select_related(*select) if select else queryset.select_related(None)
+    queryset = queryset.prefetch_related(None).prefetch_related(*prefetch)
+    return queryset.only(*columns, *extra_columns) if columns else queryset
+
+
+class FieldsetViewMixin:
+    """Shape querysets to the serializer's requested fieldset on safe methods"""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return self.optimize(queryset)
+
+    def optimize(self, queryset):
+        """Queryset loading exactly what this view's serializer renders for the request"""
+        return optimize_queryset(queryset, self.get_serializer(), ordering_fields(self))
+
+
+class UserSerializer(FieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for User model"""
     class Meta:
         model = User
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
         read_only_fields = ['id']
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(FieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for UserProfile model"""
-    user = UserSerializer(read_only=True)
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    expandable_fields = {'user': (UserSerializer, {})}
 
     class Meta:
         model = UserProfile
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'user', 'bio', 'profile_picture', 'fitness_level', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at', 'user']
 
 
-class TeamSerializer(serializers.ModelSerializer):
+class TeamSerializer(FieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Team model"""
-    _id = serializers.CharField(source='_id', read_only=True)
-    owner = UserSerializer(read_only=True)
-    members = UserSerializer(many=True, read_only=True)
+    _id = serializers.CharField(read_only=True)
+    owner = serializers.PrimaryKeyRelatedField(read_only=True)
+    members = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    expandable_fields = {'owner': (UserSerializer, {}), 'members': (UserSerializer, {'many': True})}
 
     class Meta:
         model = Team
+        list_serializer_class = TimedListSerializer
         fields = ['_id', 'name', 'description', 'owner', 'members', 'created_at', 'updated_at']
         read_only_fields = ['_id', 'created_at', 'updated_at', 'owner']
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(FieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Activity model"""
-    _id = serializers.CharField(source='_id', read_only=True)
-    user = UserSerializer(read_only=True)
+    _id = serializers.CharField(read_only=True)
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    expandable_fields = {'user': (UserSerializer, {})}
 
     class Meta:
         model = Activity
+        list_serializer_class = TimedListSerializer
         fields = ['_id', 'user', 'activity_type', 'duration_minutes', 'distance_km', 
-                  'calories_burned', 'description', 'activity_date', 'created_at', 'updated_at']
+                  'calories_burned', 'description', 'activity_date', 'idempotency_key',
+                  'created_at', 'updated_at']
         read_only_fields = ['_id', 'created_at', 'updated_at', 'user']
 
 
-class LeaderboardSerializer(serializers.ModelSerializer):
+class LeaderboardSerializer(FieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Leaderboard model"""
-    _id = serializers.CharField(source='_id', read_only=True)
-    user = UserSerializer(read_only=True)
-    team = TeamSerializer(read_only=True)
+    _id = serializers.CharField(read_only=True)
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    team = serializers.PrimaryKeyRelatedField(read_only=True, pk_field=serializers.CharField())
+    expandable_fields = {'user': (UserSerializer, {}), 'team': (TeamSerializer, {})}
 
     class Meta:
         model = Leaderboard
+        list_serializer_class = TimedListSerializer
         fields = ['_id', 'team', 'user', 'total_activities', 'total_calories', 
-                  'total_distance', 'total_duration_minutes', 'rank', 'points', 'updated_at']
+                  'total_distance', 'total_duration_minutes', 'rank', 'team_rank', 'points', 'updated_at']
         read_only_fields = ['_id', 'updated_at']
 
 
-class WorkoutSerializer(serializers.ModelSerializer):
+class WorkoutSerializer(FieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Workout model"""
-    _id = serializers.CharField(source='_id', read_only=True)
-    user = UserSerializer(read_only=True)
+    _id = serializers.CharField(read_only=True)
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    expandable_fields = {'user': (UserSerializer, {})}
 
     class Meta:
         model = Workout
+        list_serializer_class = TimedListSerializer
         fields = ['_id', 'user', 'fitness_level', 'workout_type', 'title', 'description',
                   'duration_minutes', 'exercises', 'difficulty_rating', 'suggested_date',
-                  'is_completed', 'created_at', 'updated_at']
-        read_only_fields = ['_id', 'created_at', 'updated_at', 'user']
+                  'is_completed', 'suggestion_rank', 'created_at', 'updated_at']
+        read_only_fields = ['_id', 'suggestion_rank', 'created_at', 'updated_at', 'user']
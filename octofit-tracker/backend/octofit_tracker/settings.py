@@ -58,6 +58,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost so it times everything below it; removes itself unless METRICS_ENABLED
+    'octofit_tracker.middleware.MetricsMiddleware',
+    'octofit_tracker.slow_queries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -91,18 +94,132 @@ WSGI_APPLICATION = 'octofit_tracker.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
+# CLIENT is passed to pymongo's MongoClient; pool and timeout options are env-driven so
+# worker counts can be sized against Mongo (see /api/health/db/ for live pool usage)
 DATABASES = {
     'default': {
         'ENGINE': 'djongo',
         'NAME': 'octofit_db',
         'ENFORCE_SCHEMA': False,
+        # Keep the MongoClient, and with it the connection pool, across requests;
+        # 0 would close the client after every request
+        'CONN_MAX_AGE': int(os.environ.get('MONGO_CONN_MAX_AGE', 600)),
         'CLIENT': {
-            'host': 'mongodb://localhost:27017',
+            'host': os.environ.get('MONGO_URL', 'mongodb://localhost:27017'),
+            'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)),
+            'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)),
+            'maxIdleTimeMS': int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 300000)),
+            'waitQueueTimeoutMS': int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000)),
+            'serverSelectionTimeoutMS': int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+            'connectTimeoutMS': int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+            'socketTimeoutMS': int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 30000)),
         }
     }
 }
 
 
+# Django REST framework
+# Pagination is configured per ViewSet (see pagination.py); PAGE_SIZE is the shared default
+REST_FRAMEWORK = {
+    'PAGE_SIZE': 50,
+}
+SILENCED_SYSTEM_CHECKS = ['rest_framework.W001']
+
+# Bulk activity ingestion (POST /api/activities/bulk/)
+ACTIVITY_BULK_MAX_ITEMS = int(os.environ.get('ACTIVITY_BULK_MAX_ITEMS', 10000))
+# Bulk workout completion (POST /api/workouts/complete/)
+WORKOUT_BULK_MAX_ITEMS = int(os.environ.get('WORKOUT_BULK_MAX_ITEMS', 500))
+# Bulk team membership changes (POST /api/teams/<id>/add_members/, remove_members/, set_members/)
+TEAM_BULK_MAX_MEMBERS = int(os.environ.get('TEAM_BULK_MAX_MEMBERS', 5000))
+ACTIVITY_BULK_CHUNK_SIZE = int(os.environ.get('ACTIVITY_BULK_CHUNK_SIZE', 1000))
+
+# Serve activity, workout and leaderboard lists from .values() rows (see fast_serializers.py)
+FAST_LIST_SERIALIZATION = os.environ.get('FAST_LIST_SERIALIZATION', 'false').lower() == 'true'
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Local memory by default; set REDIS_URL (e.g. redis://localhost:6379/0) to share across workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'octofit-tracker',
+    }
+}
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL'),
+    }
+
+# Seconds a cached leaderboard response stays valid without an invalidating write
+LEADERBOARD_CACHE_TIMEOUT = int(os.environ.get('LEADERBOARD_CACHE_TIMEOUT', 300))
+
+
+# Background jobs (see jobs.py and the run_jobs worker command)
+# Failed jobs are retried after JOB_BACKOFF_SECONDS * 2**(attempts - 1), capped at JOB_BACKOFF_MAX_SECONDS
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+JOB_BACKOFF_SECONDS = int(os.environ.get('JOB_BACKOFF_SECONDS', 5))
+JOB_BACKOFF_MAX_SECONDS = int(os.environ.get('JOB_BACKOFF_MAX_SECONDS', 300))
+# Running jobs whose worker has been silent this long are handed back to the queue
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 600))
+# Seconds a team recompute waits before running, so bursts of writes share one job
+JOB_COALESCE_SECONDS = int(os.environ.get('JOB_COALESCE_SECONDS', 2))
+
+
+# Workout suggestions (see suggestions.py and the build_suggestions command)
+# Length of each user's materialized suggestion list
+SUGGESTION_COUNT = int(os.environ.get('SUGGESTION_COUNT', 5))
+# Days of recent activity whose mix decides the workout types suggested
+SUGGESTION_MIX_DAYS = int(os.environ.get('SUGGESTION_MIX_DAYS', 28))
+
+
+# Columnar activity analytics (see analytics.py and /api/analytics/)
+# Seconds between checks for new activities to append to the in-memory columns
+ANALYTICS_SYNC_SECONDS = int(os.environ.get('ANALYTICS_SYNC_SECONDS', 5))
+
+
+# Request metrics (see metrics.py), served in Prometheus text format at /api/metrics/
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'false').lower() == 'true'
+# Add a Server-Timing header (app, db and serializer time) to every measured response
+METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', 'false').lower() == 'true'
+
+
+# Slow-query log (see slow_queries.py and the slow_queries command)
+# MongoDB commands slower than this are logged with their view, SQL, query and an explain; 0 disables
+SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true'
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', str(BASE_DIR / 'slow_queries.log'))
+SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get('SLOW_QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024))
+SLOW_QUERY_LOG_BACKUP_COUNT = int(os.environ.get('SLOW_QUERY_LOG_BACKUP_COUNT', 5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'maxBytes': SLOW_QUERY_LOG_MAX_BYTES,
+            'backupCount': SLOW_QUERY_LOG_BACKUP_COUNT,
+            'formatter': 'message',
+            # Only create the file once something is logged
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'octofit_tracker.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -0,0 +1,80 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .analytics import mark_stale as mark_analytics_stale
+from .caching import invalidate_teams, invalidate_user_teams
+from .models import Activity, Leaderboard, Team
+from .rollups import record_activities, record_activity_change, snapshot
+
+
+@receiver(pre_save, sender=Activity)
+def remember_activity_rollup_values(sender, instance, raw=False, **kwargs):
+    """Capture an existing activity's stored values before it is overwritten"""
+    instance._rollup_previous = None
+    if raw or instance.pk is None:
+        return
+    previous = Activity.objects.filter(pk=instance.pk).first()
+    if previous is not None:
+        instance._rollup_previous = snapshot(previous)
+
+
+@receiver(post_save, sender=Activity)
+def update_rollups_on_save(sender, instance, created, raw=False, **kwargs):
+    """Keep activity rollups in step with created and updated activities"""
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is None:
+        record_activities([instance])
+    else:
+        record_activity_change(previous, instance)
+
+
+@receiver(post_delete, sender=Activity)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    """Remove a deleted activity's contribution from the rollups"""
+    record_activities([instance], sign=-1)
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+def invalidate_leaderboard_on_activity(sender, instance, raw=False, **kwargs):
+    """Drop cached leaderboards for every team the activity's user belongs to"""
+    if not raw:
+        invalidate_user_teams([instance.user_id])
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+def reload_analytics_on_activity_change(sender, instance, created=False, raw=False, **kwargs):
+    """Edited and deleted activities cannot be appended, so have the analytics columns reload"""
+    if not raw and not created:
+        mark_analytics_stale()
+
+
+@receiver(post_save, sender=Leaderboard)
+@receiver(post_delete, sender=Leaderboard)
+def invalidate_leaderboard_on_entry(sender, instance, raw=False, **kwargs):
+    """Drop cached leaderboards for the entry's team"""
+    if not raw:
+        invalidate_teams([instance.team_id])
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def invalidate_leaderboard_on_team(sender, instance, raw=False, **kwargs):
+    """Drop cached leaderboards embedding the team"""
+    if not raw:
+        invalidate_teams([instance.pk])
+
+
+@receiver(m2m_changed, sender=Team.members.through)
+def invalidate_leaderboard_on_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drop cached leaderboards embedding a team whose members changed"""
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # instance is a user; pk_set holds team ids (None when clearing)
+        team_ids = pk_set or Team.members.through.objects.filter(user_id=instance.pk).values_list('team_id', flat=True)
+        invalidate_teams(team_ids)
+    else:
+        invalidate_teams([instance.pk])
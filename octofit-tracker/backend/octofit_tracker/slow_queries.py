@@ -0,0 +1,248 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from bson import json_util
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+from .mongo import get_database, summarize_explain, winning_plan
+
+logger = logging.getLogger(__name__)
+
+# Commands MongoDB can explain; anything else is logged without a plan
+EXPLAINABLE = ('find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'findAndModify')
+# Driver bookkeeping that is not part of the query and cannot be sent to explain
+SESSION_FIELDS = ('lsid', 'txnNumber', '$clusterTime', '$readPreference', '$db', 'signature')
+# A query shape is explained at most once per interval, however often it is slow
+EXPLAIN_INTERVAL_SECONDS = 300
+
+# The request and ORM statement that issued the current command, for attribution
+current_request = ContextVar('octofit_slow_query_request', default=None)
+current_sql = ContextVar('octofit_slow_query_sql', default=None)
+
+
+def remember_sql(execute, sql, params, many, context):
+    """Execute wrapper exposing the SQL djongo is translating to its commands"""
+    token = current_sql.set(sql)
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current_sql.reset(token)
+
+
+def install_sql_capture(sender, connection, **kwargs):
+    """connection_created receiver adding remember_sql to every new djongo connection"""
+    if connection.vendor == 'djongo' and remember_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(remember_sql)
+
+
+def shape(value):
+    """Replace literal values with '?' so queries differing only in values match"""
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in map(shape, value):
+            if item not in shapes:
+                shapes.append(item)
+        return shapes
+    return '?'
+
+
+def fingerprint(command_name, command):
+    """Stable identifier for a command's query shape"""
+    collection = command.get(command_name)
+    parts = {key: shape(value) for key, value in command.items() if key in ('filter', 'pipeline', 'query', 'sort')}
+    if command_name in ('update', 'delete'):
+        statements = command.get('updates') or command.get('deletes') or []
+        parts['q'] = shape([statement.get('q', {}) for statement in statements])
+    return f'{command_name}:{collection}:{json.dumps(parts, sort_keys=True, default=str)}'
+
+
+def loggable(command_name, command):
+    """The command as logged, without session fields or inserted document bodies"""
+    cleaned = {key: value for key, value in command.items() if key not in SESSION_FIELDS}
+    if command_name == 'insert' and 'documents' in cleaned:
+        cleaned['documents'] = f"<{len(cleaned['documents'])} documents>"
+    return json.loads(json_util.dumps(cleaned))
+
+
+def explain(database_name, command):
+    """queryPlanner explain of a command, summarized alongside its winning plan"""
+    cleaned = {key: value for key, value in command.items() if key not in SESSION_FIELDS}
+    result = get_database().client[database_name].command({'explain': cleaned, 'verbosity': 'queryPlanner'})
+    return {**summarize_explain(result), 'winning_plan': json.loads(json_util.dumps(winning_plan(result)))}
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Log every MongoDB command slower than a threshold, with its origin and plan
+
+    Command documents are only held while a command is in flight. Slow ones
+    are handed to a single background thread that runs explain and writes the
+    log, so the request that issued the command is not slowed further.
+    """
+
+    def __init__(self, threshold_ms, capture_explain=True, background=True):
+        self.threshold_ms = threshold_ms
+        self.capture_explain = capture_explain
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.explained = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query') if background else None
+
+    def started(self, event):
+        if event.command_name == 'explain':
+            return
+        with self.lock:
+            self.in_flight[(event.request_id, event.connection_id)] = (
+                event.command, event.database_name, current_request.get(), current_sql.get()
+            )
+
+    def succeeded(self, event):
+        self.finish(event, failure=None)
+
+    def failed(self, event):
+        self.finish(event, failure=event.failure)
+
+    def finish(self, event, failure):
+        with self.lock:
+            started = self.in_flight.pop((event.request_id, event.connection_id), None)
+        duration_ms = event.duration_micros / 1000
+        if started is None or duration_ms < self.threshold_ms:
+            return
+        command, database_name, request, sql = started
+        entry = {
+            'timestamp': timezone.now().isoformat(),
+            'command': event.command_name,
+            'collection': command.get(event.command_name),
+            'database': database_name,
+            'duration_ms': round(duration_ms, 3),
+            'fingerprint': fingerprint(event.command_name, command),
+            'method': request[0] if request else None,
+            'path': request[1] if request else None,
+            'sql': sql,
+            'query': loggable(event.command_name, command),
+            'failure': json.loads(json_util.dumps(failure)) if failure else None,
+        }
+        if self.executor is None:
+            self.capture(entry, command)
+        else:
+            self.executor.submit(self.capture, entry, command)
+
+    def should_explain(self, entry):
+        """Whether this query shape is due for a fresh explain"""
+        if not self.capture_explain or entry['command'] not in EXPLAINABLE:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            last = self.explained.get(entry['fingerprint'])
+            if last is not None and now - last < EXPLAIN_INTERVAL_SECONDS:
+                return False
+            self.explained[entry['fingerprint']] = now
+        return True
+
+    def capture(self, entry, command):
+        """Resolve the originating view, attach an explain snapshot and write the entry"""
+        entry['view'] = view_name(entry['path'])
+        entry['explain'] = None
+        if self.should_explain(entry):
+            try:
+                entry['explain'] = explain(entry['database'], command)
+            except PyMongoError as exc:
+                entry['explain'] = {'error': str(exc)}
+        logger.info(json.dumps(entry, default=str))
+
+
+def view_name(path):
+    """URL name of the view serving a path, or None outside a request"""
+    if not path:
+        return None
+    try:
+        return resolve(path).view_name
+    except Resolver404:
+        return None
+
+
+class SlowQueryMiddleware:
+    """Remember the current request so slow commands can be traced back to their view"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.SLOW_QUERY_THRESHOLD_MS <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = current_request.set((request.method, request.path_info))
+        try:
+            return self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+    async def __acall__(self, request):
+        token = current_request.set((request.method, request.path_info))
+        try:
+            return await self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+
+def read_entries(path):
+    """Entries from a slow-query log and its rotated backups, oldest file first"""
+    paths = [f'{path}.{index}' for index in range(settings.SLOW_QUERY_LOG_BACKUP_COUNT, 0, -1)] + [str(path)]
+    for log_path in paths:
+        try:
+            with open(log_path) as log:
+                for line in log:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            continue
+
+
+def rank_offenders(entries, sort='total'):
+    """Group slow commands by query shape and order the groups worst first"""
+    groups = {}
+    for entry in entries:
+        group = groups.get(entry['fingerprint'])
+        if group is None:
+            group = groups[entry['fingerprint']] = {
+                'fingerprint': entry['fingerprint'],
+                'command': entry['command'],
+                'collection': entry['collection'],
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'views': {},
+                'sample': entry,
+                'explain': None,
+            }
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        if entry['duration_ms'] >= group['max_ms']:
+            group['max_ms'] = entry['duration_ms']
+            group['sample'] = entry
+        if entry.get('explain'):
+            group['explain'] = entry['explain']
+        view = entry.get('view') or entry.get('path') or '-'
+        group['views'][view] = group['views'].get(view, 0) + 1
+
+    for group in groups.values():
+        group['total_ms'] = round(group['total_ms'], 3)
+        group['mean_ms'] = round(group['total_ms'] / group['count'], 3)
+    key = {'total': 'total_ms', 'count': 'count', 'max': 'max_ms', 'mean': 'mean_ms'}[sort]
+    return sorted(groups.values(), key=lambda group: group[key], reverse=True)
@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta
+from django.db.models import Sum
+from django.utils.dateparse import parse_date
+
+GROUP_BY_CHOICES = ('activity_type', 'day', 'week', 'month')
+
+TOTAL_FIELDS = ('total_activities', 'total_calories', 'total_distance', 'total_duration_minutes')
+
+
+def parse_date_window(params):
+    """Read optional inclusive `from`/`to` dates (YYYY-MM-DD) from query params"""
+    window = []
+    for name in ('from', 'to'):
+        value = params.get(name)
+        if not value:
+            window.append(None)
+            continue
+        parsed = parse_date(value)
+        if parsed is None:
+            raise ValueError(f"Invalid '{name}' date, expected YYYY-MM-DD")
+        window.append(parsed)
+    start, end = window
+    if start and end and start > end:
+        raise ValueError("'from' must not be after 'to'")
+    return start, end
+
+
+def parse_group_by(params):
+    """Read the optional `group_by` query param"""
+    group_by = params.get('group_by')
+    if group_by and group_by not in GROUP_BY_CHOICES:
+        raise ValueError(f"Invalid 'group_by', expected one of: {', '.join(GROUP_BY_CHOICES)}")
+    return group_by or None
+
+
+def filter_date_window(queryset, start=None, end=None):
+    """Restrict a rollup queryset to an inclusive window of days"""
+    if start:
+        queryset = queryset.filter(day__gte=start)
+    if end:
+        queryset = queryset.filter(day__lte=end)
+    return queryset
+
+
+def total_aggregates():
+    """Aggregate expressions summing rollup totals"""
+    return {field: Sum(field) for field in TOTAL_FIELDS}
+
+
+def clean_totals(row):
+    """Replace empty sums with zeros"""
+    return {
+        'total_activities': row['total_activities'] or 0,
+        'total_calories': row['total_calories'] or 0,
+        'total_distance': row['total_distance'] or 0,
+        'total_duration_minutes': row['total_duration_minutes'] or 0,
+    }
+
+
+def activity_totals(rollups):
+    """Compute activity totals from rollups with a single aggregate query"""
+    return clean_totals(rollups.aggregate(**total_aggregates()))
+
+
+async def aactivity_totals(rollups):
+    """Async version of activity_totals()"""
+    return clean_totals(await rollups.aaggregate(**total_aggregates()))
+
+
+def member_totals(rollups):
+    """Compute activity totals per user from rollups with a single grouped query"""
+    rows = rollups.values('user_id').annotate(**total_aggregates()).order_by()
+    return {row['user_id']: clean_totals(row) for row in rows}
+
+
+def period_start(day, period):
+    """First day of the period containing `day`; weeks start on Monday"""
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def grouped_rows(rollups, group_by):
+    """Grouped aggregate query over rollups, one row per activity type or per day
+
+    Weeks and months are folded from the daily rows by fold_periods(), as
+    djongo cannot translate TruncWeek and TruncMonth.
+    """
+    if group_by == 'activity_type':
+        return rollups.values('activity_type').annotate(**total_aggregates()).order_by('activity_type')
+    return rollups.values('day').annotate(**total_aggregates()).order_by('day')
+
+
+def fold_periods(rows, period):
+    """Fold daily rows, in day order, into one row per period"""
+    groups = []
+    for row in rows:
+        start = period_start(row['day'], period)
+        if not groups or groups[-1]['period'] != start:
+            groups.append({'period': start, **dict.fromkeys(TOTAL_FIELDS, 0)})
+        for field, value in clean_totals(row).items():
+            groups[-1][field] += value
+    return groups
+
+
+def format_group(row, group_by):
+    """Render one grouped row with its group label and cleaned totals"""
+    if group_by == 'activity_type':
+        return {'activity_type': row['activity_type'], **clean_totals(row)}
+    return {'period': format_period(row['period']), **clean_totals(row)}
+
+
+def format_groups(rows, group_by):
+    """Render grouped rows, folding daily rows into their periods first"""
+    if group_by != 'activity_type':
+        rows = fold_periods(rows, group_by)
+    return [format_group(row, group_by) for row in rows]
+
+
+def grouped_activity_totals(rollups, group_by):
+    """Compute activity totals per group from rollups with a single grouped query"""
+    return format_groups(grouped_rows(rollups, group_by), group_by)
+
+
+async def agrouped_activity_totals(rollups, group_by):
+    """Async version of grouped_activity_totals()"""
+    return format_groups([row async for row in grouped_rows(rollups, group_by)], group_by)
+
+
+def format_period(value):
+    """Render a period start as an ISO date"""
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.isoformat()
+
+
+def sum_totals(groups):
+    """Combine grouped totals into overall totals"""
+    totals = dict.fromkeys(TOTAL_FIELDS, 0)
+    for group in groups:
+        for field in TOTAL_FIELDS:
+            totals[field] += group[field]
+    return totals
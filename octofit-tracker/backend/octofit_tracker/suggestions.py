@@ -0,0 +1,150 @@
+"""Materialized per-user workout suggestion lists
+
+A user's current suggestions are the Workout rows with a positive
+`suggestion_rank`, their position in the list, so the suggestions endpoint is
+a single read on the (user, suggestion_rank) index. refresh_suggestions()
+rebuilds the lists of a batch of users with a fixed number of queries: pending
+workouts that still match the user's fitness level are kept, soonest first,
+and the list is topped up with workouts generated for that level, their types
+apportioned by the user's recent activity mix. Only rows whose rank changes
+are written.
+"""
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q, Sum
+from django.utils import timezone
+from .models import ActivityRollup, UserProfile, Workout
+from .mongo import assign_object_ids
+
+WORKOUT_TYPES = ['cardio', 'strength', 'flexibility', 'balance', 'endurance']
+EXERCISES = {
+    'cardio': ['Warm-up', 'Intervals', 'Steady state', 'Cool-down'],
+    'strength': ['Squat', 'Deadlift', 'Bench press', 'Row', 'Plank'],
+    'flexibility': ['Hamstring stretch', 'Hip opener', 'Shoulder stretch'],
+    'balance': ['Single-leg stand', 'Bosu squat', 'Tree pose'],
+    'endurance': ['Tempo', 'Long steady', 'Hill repeats'],
+}
+# Workout type each activity type trains; other activities do not count towards the mix
+ACTIVITY_WORKOUT_TYPES = {
+    'running': 'cardio',
+    'walking': 'cardio',
+    'cycling': 'endurance',
+    'swimming': 'endurance',
+    'gym': 'strength',
+    'yoga': 'flexibility',
+    'sports': 'balance',
+}
+# Minutes credited to every workout type, so types the user has not tried still come up
+BASE_MINUTES = 30
+# Duration (minutes) and difficulty rating of generated workouts per fitness level
+LEVEL_PLANS = {'beginner': (20, 3), 'intermediate': (35, 6), 'advanced': (50, 8)}
+
+
+def activity_mix(user_ids, since):
+    """Minutes trained per workout type since a day, for each user, from the daily rollups"""
+    rows = (
+        ActivityRollup.objects.filter(user_id__in=user_ids, day__gte=since)
+        .values('user_id', 'activity_type')
+        .annotate(minutes=Sum('total_duration_minutes'))
+        .order_by()
+    )
+    mix = {}
+    for row in rows:
+        workout_type = ACTIVITY_WORKOUT_TYPES.get(row['activity_type'])
+        if workout_type:
+            minutes = mix.setdefault(row['user_id'], Counter())
+            minutes[workout_type] += row['minutes']
+    return mix
+
+
+def plan_workout_types(minutes, taken, slots):
+    """Workout types for `slots` new suggestions, apportioned by minutes trained
+
+    Each slot goes to the type with the most minutes per suggestion it already
+    has, counting the `taken` types of kept suggestions; ties go to the first
+    type in WORKOUT_TYPES.
+    """
+    counts = Counter(taken)
+    plan = []
+    for _ in range(slots):
+        workout_type = max(
+            WORKOUT_TYPES, key=lambda name: (minutes.get(name, 0) + BASE_MINUTES) / (counts[name] + 1)
+        )
+        counts[workout_type] += 1
+        plan.append(workout_type)
+    return plan
+
+
+def generated_workout(user_id, fitness_level, workout_type, suggested_date, rank):
+    """Unsaved suggestion of a workout type at a fitness level"""
+    duration_minutes, difficulty_rating = LEVEL_PLANS[fitness_level]
+    return Workout(
+        user_id=user_id,
+        fitness_level=fitness_level,
+        workout_type=workout_type,
+        title=f'{fitness_level.title()} {workout_type} session',
+        description=f'Suggested {workout_type} workout for {fitness_level} level',
+        duration_minutes=duration_minutes,
+        exercises=EXERCISES[workout_type],
+        difficulty_rating=difficulty_rating,
+        suggested_date=suggested_date,
+        suggestion_rank=rank,
+    )
+
+
+def refresh_suggestions(user_ids, count=None, now=None):
+    """Rebuild the suggestion lists of the given users; users without a profile get none"""
+    user_ids = list(set(user_ids))
+    count = settings.SUGGESTION_COUNT if count is None else count
+    now = now or timezone.now()
+    levels = dict(UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', 'fitness_level'))
+    mix = activity_mix(list(levels), timezone.localdate() - timedelta(days=settings.SUGGESTION_MIX_DAYS - 1))
+
+    # Pending workouts are candidates; ranked ones may need their rank cleared. djongo
+    # cannot translate a bare boolean column in WHERE, so is_completed is matched with __in
+    rows = (
+        Workout.objects.filter(user_id__in=user_ids)
+        .filter(Q(is_completed__in=[False]) | Q(suggestion_rank__gt=0))
+        .values('pk', 'user_id', 'fitness_level', 'workout_type', 'suggested_date', 'is_completed', 'suggestion_rank')
+        .order_by('suggested_date', '_id')
+    )
+    current, pending = {}, {}
+    for row in rows:
+        current[row['pk']] = row['suggestion_rank']
+        if not row['is_completed'] and levels.get(row['user_id']) == row['fitness_level']:
+            pending.setdefault(row['user_id'], []).append(row)
+
+    ranks, created = {}, []
+    for user_id, fitness_level in levels.items():
+        kept = pending.get(user_id, [])[:count]
+        for rank, row in enumerate(kept, 1):
+            ranks[row['pk']] = rank
+        last_date = max([now] + [row['suggested_date'] for row in kept])
+        plan = plan_workout_types(mix.get(user_id, {}), [row['workout_type'] for row in kept], count - len(kept))
+        for offset, workout_type in enumerate(plan, 1):
+            created.append(generated_workout(
+                user_id, fitness_level, workout_type, last_date + timedelta(days=offset), len(kept) + offset
+            ))
+
+    changes = {}
+    for pk, rank in current.items():
+        if ranks.get(pk, 0) != rank:
+            changes.setdefault(ranks.get(pk, 0), []).append(pk)
+    # updated_at moves with the rank so suggestion ETags change
+    for rank, pks in changes.items():
+        Workout.objects.filter(pk__in=pks).update(suggestion_rank=rank, updated_at=now)
+    Workout.objects.bulk_create(assign_object_ids(created))
+    return {'users': len(levels), 'created': len(created), 'reranked': sum(map(len, changes.values()))}
+
+
+def refresh_all_suggestions(user_ids=None, batch_size=1000, count=None, log=None):
+    """Rebuild suggestion lists a batch of users at a time, for every user with a profile by default"""
+    if user_ids is None:
+        user_ids = list(UserProfile.objects.order_by('user_id').values_list('user_id', flat=True))
+    totals = Counter()
+    for start in range(0, len(user_ids), batch_size):
+        totals.update(refresh_suggestions(user_ids[start:start + batch_size], count=count))
+        if log:
+            log(f"suggestions for {min(start + batch_size, len(user_ids))} of {len(user_ids)} users")
+    return {'users': totals['users'], 'created': totals['created'], 'reranked': totals['reranked']}
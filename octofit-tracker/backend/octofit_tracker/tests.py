@@ -2,8 +2,35 @@ from django.test import TestCase
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
-from .models import UserProfile, Team, Activity, Leaderboard, Workout
+from .models import UserProfile, Team, Activity, ActivityRollup, Leaderboard, Workout, Job
+from .fast_serializers import fast_activity_serializer, fast_leaderboard_serializer, fast_workout_serializer
+from .serializers import ActivitySerializer, LeaderboardSerializer, WorkoutSerializer, field_tree
+from .caching import cache_stats, cached_response_data, invalidate_teams, team_scope
+from .leaderboard import recompute_leaderboard, rerank_leaderboard
+from . import ingest, jobs, metrics
+from .mongo import assign_object_ids, get_collection, summarize_explain
+from .monitoring import PoolMonitor
+from .seeding import Seeder
+from .benchmarking import benchmark_endpoints, compare
+from .slow_queries import SlowQueryListener, current_request as slow_query_request, fingerprint, rank_offenders
+from bson import ObjectId
+from pymongo import monitoring
+from .rollups import apply_deltas, reconcile_rollups
+from .suggestions import plan_workout_types, refresh_suggestions
+from .analytics import activity_columns
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from django.utils import timezone
 from datetime import datetime, timedelta
+import json
+import os
+import tempfile
+from io import StringIO
+from django.core.management import call_command
+from asgiref.sync import sync_to_async
 
 
 class UserProfileTestCase(TestCase):
@@ -182,3 +209,1641 @@ class APITestCase(APITestCase):
         }
         response = self.client.post('/api/activities/', data, format='json')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def create_budget_fixtures(self, count=5):
+        """Create enough related rows that an N+1 query pattern would exceed its budget"""
+        cache.clear()
+        members = [self.user] + [
+            User.objects.create_user(username=f'budget{idx}', password='testpass123')
+            for idx in range(count)
+        ]
+        for idx in range(2):
+            team = Team.objects.create(name=f'Budget Team {idx}', owner=self.user)
+            team.members.set(members)
+        for member in members:
+            UserProfile.objects.get_or_create(user=member)
+            for day in range(2):
+                Activity.objects.create(
+                    user=member,
+                    activity_type='running',
+                    duration_minutes=30,
+                    activity_date=timezone.now() - timedelta(days=day)
+                )
+                Workout.objects.create(
+                    user=member,
+                    fitness_level='beginner',
+                    workout_type='cardio',
+                    title='Budget Workout',
+                    description='Query budget workout',
+                    duration_minutes=30,
+                    suggested_date=timezone.now() + timedelta(days=day)
+                )
+        recompute_leaderboard()
+        refresh_suggestions(User.objects.values_list('id', flat=True))
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+
+    def assertQueryBudget(self, url, budget):
+        """Assert an endpoint responds successfully within a fixed number of queries"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(
+            len(queries), budget,
+            f"{url} ran {len(queries)} queries (budget {budget}):\n"
+            + '\n'.join(query['sql'] for query in queries.captured_queries)
+        )
+        return response
+
+    def test_list_endpoints_query_budget(self):
+        """Test list endpoints eager-load relations instead of querying per row"""
+        self.create_budget_fixtures()
+        self.assertQueryBudget('/api/users/', 1)
+        # ETag endpoints add one aggregate per table their response is built from
+        self.assertQueryBudget('/api/profiles/', 2)
+        self.assertQueryBudget('/api/teams/', 2)
+        self.assertQueryBudget('/api/activities/', 1)
+        self.assertQueryBudget('/api/workouts/', 2)
+        self.assertQueryBudget('/api/workouts/suggestions/', 2)
+        response = self.assertQueryBudget('/api/leaderboard/', 5)
+        self.assertEqual(len(response.data['results']), 12)
+        self.assertQueryBudget('/api/leaderboard/top_performers/', 5)
+
+
+class ActivityStatisticsAPITestCase(TestCase):
+    """API test cases for aggregated activity statistics"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='statsuser',
+            email='stats@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        base = timezone.make_aware(datetime(2024, 3, 4, 8, 0))
+        for offset, activity_type, duration, distance, calories in [
+            (0, 'running', 30, 5.0, 300),
+            (1, 'running', 40, 7.5, None),
+            (8, 'cycling', 60, 20.0, 500),
+        ]:
+            Activity.objects.create(
+                user=self.user,
+                activity_type=activity_type,
+                duration_minutes=duration,
+                distance_km=distance,
+                calories_burned=calories,
+                activity_date=base + timedelta(days=offset)
+            )
+
+    def test_statistics_totals(self):
+        """Test totals are aggregated across all activities"""
+        response = self.client.get('/api/activities/statistics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_activities'], 3)
+        self.assertEqual(response.data['total_calories'], 800)
+        self.assertAlmostEqual(response.data['total_distance'], 32.5)
+        self.assertEqual(response.data['total_duration_minutes'], 130)
+
+    def test_statistics_date_window(self):
+        """Test from/to restrict totals to an inclusive date window"""
+        response = self.client.get('/api/activities/statistics/', {'from': '2024-03-05', 'to': '2024-03-12'})
+        self.assertEqual(response.data['total_activities'], 2)
+        self.assertEqual(response.data['total_duration_minutes'], 100)
+
+    def test_statistics_group_by_activity_type(self):
+        """Test grouping totals by activity type"""
+        response = self.client.get('/api/activities/statistics/', {'group_by': 'activity_type'})
+        groups = {group['activity_type']: group for group in response.data['groups']}
+        self.assertEqual(groups['running']['total_activities'], 2)
+        self.assertEqual(groups['cycling']['total_calories'], 500)
+        self.assertEqual(response.data['total_activities'], 3)
+
+    def test_statistics_group_by_week(self):
+        """Test grouping totals by week"""
+        response = self.client.get('/api/activities/statistics/', {'group_by': 'week'})
+        periods = [group['period'] for group in response.data['groups']]
+        self.assertEqual(periods, ['2024-03-04', '2024-03-11'])
+        self.assertEqual(response.data['groups'][0]['total_duration_minutes'], 70)
+
+    def test_statistics_group_by_day_and_month(self):
+        """Test daily groups are folded into months"""
+        response = self.client.get('/api/activities/statistics/', {'group_by': 'day'})
+        periods = [group['period'] for group in response.data['groups']]
+        self.assertEqual(periods, ['2024-03-04', '2024-03-05', '2024-03-12'])
+        response = self.client.get('/api/activities/statistics/', {'group_by': 'month'})
+        self.assertEqual(len(response.data['groups']), 1)
+        self.assertEqual(response.data['groups'][0]['period'], '2024-03-01')
+        self.assertEqual(response.data['groups'][0]['total_calories'], 800)
+        self.assertEqual(response.data['total_duration_minutes'], 130)
+
+    def test_statistics_invalid_params(self):
+        """Test invalid group_by and dates are rejected"""
+        response = self.client.get('/api/activities/statistics/', {'group_by': 'year'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/activities/statistics/', {'from': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ActivityRollupTestCase(TestCase):
+    """Test cases for incrementally maintained activity rollups"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='rollupuser',
+            email='rollup@example.com',
+            password='testpass123'
+        )
+        self.activity_date = timezone.make_aware(datetime(2024, 3, 4, 8, 0))
+        self.activity = Activity.objects.create(
+            user=self.user,
+            activity_type='running',
+            duration_minutes=30,
+            distance_km=5.0,
+            calories_burned=300,
+            activity_date=self.activity_date
+        )
+
+    def test_rollup_created_with_activity(self):
+        """Test creating an activity adds it to its daily rollup"""
+        Activity.objects.create(
+            user=self.user,
+            activity_type='running',
+            duration_minutes=20,
+            activity_date=self.activity_date + timedelta(hours=2)
+        )
+        rollup = ActivityRollup.objects.get(user=self.user, activity_type='running')
+        self.assertEqual(rollup.day, self.activity_date.date())
+        self.assertEqual(rollup.total_activities, 2)
+        self.assertEqual(rollup.total_duration_minutes, 50)
+        self.assertEqual(rollup.total_calories, 300)
+
+    def test_rollup_moves_with_updated_activity(self):
+        """Test updating an activity moves its contribution to the new rollup"""
+        self.activity.activity_type = 'cycling'
+        self.activity.duration_minutes = 45
+        self.activity.save()
+        self.assertFalse(ActivityRollup.objects.filter(activity_type='running').exists())
+        rollup = ActivityRollup.objects.get(user=self.user, activity_type='cycling')
+        self.assertEqual(rollup.total_duration_minutes, 45)
+
+    def test_rollup_removed_with_activity(self):
+        """Test deleting the last activity of a day removes its rollup"""
+        self.activity.delete()
+        self.assertFalse(ActivityRollup.objects.exists())
+
+    def test_reconcile_rollups(self):
+        """Test reconciling repairs drifted and missing rollups"""
+        ActivityRollup.objects.filter(user=self.user).update(total_duration_minutes=999)
+        Activity.objects.bulk_create(assign_object_ids([Activity(
+            user=self.user,
+            activity_type='yoga',
+            duration_minutes=60,
+            activity_date=self.activity_date
+        )]))
+        result = reconcile_rollups()
+        self.assertEqual(result, {'created': 1, 'updated': 1, 'deleted': 0})
+        self.assertEqual(ActivityRollup.objects.get(activity_type='running').total_duration_minutes, 30)
+        self.assertEqual(ActivityRollup.objects.get(activity_type='yoga').total_activities, 1)
+
+    def test_apply_deltas_increments_in_place(self):
+        """Test increments are $inc upserts on the rollup collection and removals never create rows"""
+        day = self.activity_date.date()
+        key = (self.user.pk, 'running', day)
+        apply_deltas({key: [1, 100, 2.5, 10]})
+        apply_deltas({(self.user.pk, 'swimming', day): [1, 0, 1.0, 20]})
+        rollup = ActivityRollup.objects.get(user=self.user, activity_type='running')
+        self.assertEqual((rollup.total_activities, rollup.total_calories, rollup.total_duration_minutes), (2, 400, 40))
+        self.assertAlmostEqual(rollup.total_distance, 7.5)
+        self.assertEqual(ActivityRollup.objects.get(activity_type='swimming').day, day)
+        self.assertEqual(get_collection(ActivityRollup).count_documents({'user_id': self.user.pk}), 2)
+        apply_deltas({key: [-2, -400, -7.5, -40]})
+        self.assertFalse(ActivityRollup.objects.filter(activity_type='running').exists())
+        apply_deltas({(self.user.pk, 'yoga', day): [-1, 0, 0.0, -5]})
+        self.assertFalse(ActivityRollup.objects.filter(activity_type='yoga').exists())
+
+
+class LeaderboardEngineTestCase(TestCase):
+    """Test cases for leaderboard recomputation"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'runner{idx}', password='testpass123')
+            for idx in range(4)
+        ]
+        self.red = Team.objects.create(name='Red', owner=self.users[0])
+        self.blue = Team.objects.create(name='Blue', owner=self.users[2])
+        self.red.members.set(self.users[:3])
+        self.blue.members.set(self.users[2:])
+        activity_date = timezone.make_aware(datetime(2024, 3, 4, 8, 0))
+        for user, minutes in zip(self.users, [60, 30, 60, 10]):
+            Activity.objects.create(
+                user=user,
+                activity_type='running',
+                duration_minutes=minutes,
+                activity_date=activity_date
+            )
+
+    def entry(self, team, user):
+        return Leaderboard.objects.get(team=team, user=user)
+
+    def test_competition_ranks(self):
+        """Test tied users share a rank and the next rank is skipped"""
+        result = recompute_leaderboard()
+        self.assertEqual(result['created'], 5)
+        self.assertEqual(self.entry(self.red, self.users[0]).rank, 1)
+        self.assertEqual(self.entry(self.red, self.users[2]).rank, 1)
+        self.assertEqual(self.entry(self.blue, self.users[2]).rank, 1)
+        self.assertEqual(self.entry(self.red, self.users[1]).rank, 3)
+        self.assertEqual(self.entry(self.blue, self.users[3]).rank, 4)
+        self.assertEqual(self.entry(self.red, self.users[1]).points, 30)
+
+    def test_dense_ranks(self):
+        """Test dense ranking does not skip ranks after ties"""
+        recompute_leaderboard(method='dense')
+        self.assertEqual(self.entry(self.red, self.users[1]).rank, 2)
+        self.assertEqual(self.entry(self.blue, self.users[3]).rank, 3)
+
+    def test_team_ranks(self):
+        """Test ranks are also assigned within each team"""
+        recompute_leaderboard()
+        self.assertEqual(self.entry(self.blue, self.users[2]).team_rank, 1)
+        self.assertEqual(self.entry(self.blue, self.users[3]).team_rank, 2)
+        self.assertEqual(self.entry(self.red, self.users[1]).team_rank, 3)
+
+    def test_recompute_updates_and_removes_entries(self):
+        """Test recomputing updates totals and drops former members"""
+        recompute_leaderboard()
+        self.blue.members.remove(self.users[3])
+        Activity.objects.create(
+            user=self.users[1],
+            activity_type='cycling',
+            duration_minutes=100,
+            distance_km=10.0,
+            activity_date=timezone.now()
+        )
+        result = recompute_leaderboard()
+        self.assertEqual(result, {'updated': 4, 'created': 0, 'deleted': 1})
+        entry = self.entry(self.red, self.users[1])
+        self.assertEqual(entry.rank, 1)
+        self.assertEqual(entry.total_activities, 2)
+        self.assertEqual(entry.points, 230)
+
+
+class LeaderboardCacheTestCase(TestCase):
+    """Test cases for cached leaderboard responses and their invalidation"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cacheuser', password='testpass123')
+        self.team = Team.objects.create(name='Cache Team', owner=self.user)
+        self.team.members.add(self.user)
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return [{'build': self.builds}]
+
+    def cached(self, team_id=None, params=''):
+        return cached_response_data(team_scope(team_id), 'list', params, self.build)
+
+    def test_cache_hit_and_miss_counters(self):
+        """Test repeated lookups are served from cache and counted"""
+        self.assertEqual(self.cached(self.team.pk), [{'build': 1}])
+        self.assertEqual(self.cached(self.team.pk), [{'build': 1}])
+        self.assertEqual(self.cached(self.team.pk, 'page=2'), [{'build': 2}])
+        stats = cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_activity_write_invalidates_team_and_global(self):
+        """Test an activity write drops its user's team and global leaderboards"""
+        other_team = Team.objects.create(name='Other Team', owner=self.user)
+        self.cached(self.team.pk)
+        self.cached(other_team.pk)
+        self.cached()
+        Activity.objects.create(
+            user=self.user,
+            activity_type='running',
+            duration_minutes=30,
+            activity_date=timezone.now()
+        )
+        self.assertEqual(self.cached(self.team.pk), [{'build': 4}])
+        self.assertEqual(self.cached(other_team.pk), [{'build': 2}])
+        self.assertEqual(self.cached(), [{'build': 5}])
+
+    def test_recompute_invalidates_everything(self):
+        """Test a leaderboard recompute drops every cached response"""
+        self.cached(self.team.pk)
+        recompute_leaderboard()
+        self.assertEqual(self.cached(self.team.pk), [{'build': 2}])
+
+    def test_team_list_is_cached_under_canonical_id(self):
+        """Test a differently spelled team_id shares the cache scope that invalidation drops"""
+        recompute_leaderboard()
+        client = APIClient()
+        for points, path in enumerate(('/api/leaderboard/', '/api/async/leaderboard/'), 100):
+            with self.subTest(path=path):
+                url = f'{path}?team_id={str(self.team.pk).upper()}'
+                self.assertEqual(len(client.get(url).json()['results']), 1)
+                Leaderboard.objects.filter(team=self.team).update(points=points)
+                invalidate_teams([self.team.pk])
+                self.assertEqual(client.get(url).json()['results'][0]['points'], points)
+
+
+class CursorPaginationTestCase(TestCase):
+    """Test cases for keyset cursor pagination"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='pageuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        # Pairs of activities share a timestamp so pages must break ties on _id
+        base = timezone.make_aware(datetime(2024, 3, 4, 8, 0))
+        for idx in range(7):
+            Activity.objects.create(
+                user=self.user,
+                activity_type='running',
+                duration_minutes=10 + idx,
+                activity_date=base + timedelta(hours=idx // 2)
+            )
+
+    def walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data)
+            url = response.data['next']
+        return pages
+
+    def test_pages_cover_every_row_once(self):
+        """Test following next links returns every activity once, newest first"""
+        pages = self.walk('/api/activities/?page_size=2')
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 2, 1])
+        durations = [row['duration_minutes'] for page in pages for row in page['results']]
+        self.assertEqual(durations, [16, 15, 14, 13, 12, 11, 10])
+        self.assertIsNone(pages[0]['previous'])
+
+    def test_previous_link_returns_prior_page(self):
+        """Test previous links walk back to the page before"""
+        pages = self.walk('/api/activities/?page_size=3')
+        response = self.client.get(pages[2]['previous'])
+        self.assertEqual(response.data['results'], pages[1]['results'])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_invalid_cursor(self):
+        """Test a malformed cursor is rejected"""
+        response = self.client.get('/api/activities/', {'cursor': 'cD1nYXJiYWdl'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ExplainSummaryTestCase(TestCase):
+    """Test cases for summarizing MongoDB explain output"""
+
+    def test_index_scan(self):
+        """Test an index-backed plan is reported with its index"""
+        explain = {
+            'queryPlanner': {'winningPlan': {
+                'stage': 'LIMIT',
+                'inputStage': {'stage': 'FETCH', 'inputStage': {
+                    'stage': 'IXSCAN', 'indexName': 'activity_user_date_idx',
+                }},
+            }},
+            'executionStats': {'totalKeysExamined': 5, 'totalDocsExamined': 5, 'nReturned': 5},
+        }
+        summary = summarize_explain(explain)
+        self.assertFalse(summary['collection_scan'])
+        self.assertEqual(summary['indexes'], ['activity_user_date_idx'])
+        self.assertEqual(summary['stages'], ['LIMIT', 'FETCH', 'IXSCAN'])
+
+    def test_collection_scan_with_sort(self):
+        """Test collection scans and in-memory sorts are flagged"""
+        explain = {'queryPlanner': {'winningPlan': {
+            'stage': 'SORT', 'inputStage': {'stage': 'COLLSCAN'},
+        }}}
+        summary = summarize_explain(explain)
+        self.assertTrue(summary['collection_scan'])
+        self.assertTrue(summary['in_memory_sort'])
+
+
+class BulkActivityIngestTestCase(TestCase):
+    """Test cases for bulk activity ingestion"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='deviceuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+    def activity(self, key, minutes=30):
+        return {
+            'activity_type': 'running',
+            'duration_minutes': minutes,
+            'distance_km': 5.0,
+            'activity_date': '2024-03-04T08:00:00Z',
+            'idempotency_key': key,
+        }
+
+    def test_bulk_json_with_invalid_item(self):
+        """Test a JSON batch is created with per-item results"""
+        items = [self.activity('a'), {'activity_type': 'running'}, self.activity('b', 45)]
+        response = self.client.post('/api/activities/bulk/', items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['created'], response.data['invalid']), (2, 1))
+        self.assertEqual([r['status'] for r in response.data['results']], ['created', 'invalid', 'created'])
+        self.assertIn('duration_minutes', response.data['results'][1]['errors'])
+        rollup = ActivityRollup.objects.get(user=self.user)
+        self.assertEqual(rollup.total_activities, 2)
+        self.assertEqual(rollup.total_duration_minutes, 75)
+
+    def test_bulk_retry_is_deduplicated(self):
+        """Test retried uploads with the same idempotency keys are not stored twice"""
+        self.client.post('/api/activities/bulk/', [self.activity('a')], format='json')
+        items = [self.activity('a'), self.activity('c'), self.activity('c')]
+        response = self.client.post('/api/activities/bulk/', items, format='json')
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], ['duplicate', 'created', 'duplicate'])
+        self.assertEqual(results[2]['_id'], results[1]['_id'])
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), 2)
+
+    def test_concurrently_stored_key_is_duplicate(self):
+        """Test a key stored after the lookup is caught by the unique index and reported as a duplicate"""
+        activity_date = timezone.make_aware(datetime(2024, 3, 4, 8, 0))
+        raced = Activity.objects.create(
+            user=self.user, activity_type='running', duration_minutes=30, activity_date=activity_date,
+            idempotency_key='raced'
+        )
+        with self.assertRaises(DatabaseError):
+            Activity.objects.create(
+                user=self.user, activity_type='running', duration_minutes=30, activity_date=activity_date,
+                idempotency_key='raced'
+            )
+        lookup, calls = ingest.existing_keys, []
+
+        def first_lookup_misses(user, keys, chunk_size):
+            calls.append(keys)
+            return lookup(user, keys - {'raced'} if len(calls) == 1 else keys, chunk_size)
+
+        ingest.existing_keys = first_lookup_misses
+        try:
+            results = ingest.ingest_activities(self.user, [self.activity('raced'), self.activity('d')])
+        finally:
+            ingest.existing_keys = lookup
+        self.assertEqual([r['status'] for r in results], ['duplicate', 'created'])
+        self.assertEqual(results[0]['_id'], str(raced.pk))
+        self.assertEqual(ActivityRollup.objects.get(user=self.user).total_activities, 2)
+
+    def test_single_row_writes_respect_keys(self):
+        """Test a repeated key on POST returns the stored activity and a PATCH onto a used key is rejected"""
+        created = self.client.post('/api/activities/', self.activity('single'), format='json')
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        repeated = self.client.post('/api/activities/', self.activity('single', 45), format='json')
+        self.assertEqual(repeated.status_code, status.HTTP_200_OK)
+        self.assertEqual(repeated.data['_id'], created.data['_id'])
+        self.assertEqual(repeated.data['duration_minutes'], 30)
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), 1)
+
+        other = self.client.post('/api/activities/', self.activity('other'), format='json')
+        path = f"/api/activities/{other.data['_id']}/"
+        response = self.client.patch(path, {'idempotency_key': 'single'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('idempotency_key', response.data)
+        self.assertEqual(Activity.objects.get(pk=ObjectId(other.data['_id'])).idempotency_key, 'other')
+        self.assertEqual(ActivityRollup.objects.get(user=self.user).total_activities, 2)
+
+    @override_settings(ACTIVITY_BULK_MAX_ITEMS=2)
+    def test_ndjson_stops_past_the_limit(self):
+        """Test an oversized NDJSON body is rejected without parsing past the limit"""
+        body = '\n'.join(json.dumps(self.activity(key)) for key in 'xyz') + '\nnot json\n'
+        response = self.client.post('/api/activities/bulk/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'At most 2 activities per request')
+
+    def test_bulk_ndjson(self):
+        """Test a newline-delimited JSON stream is accepted"""
+        body = '\n'.join(json.dumps(self.activity(key)) for key in 'xyz') + '\n'
+        response = self.client.post('/api/activities/bulk/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.data['created'], 3)
+
+    def test_bulk_rejects_non_list(self):
+        """Test a single object is rejected"""
+        response = self.client.post('/api/activities/bulk/', self.activity('a'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ActivityExportTestCase(TestCase):
+    """Test cases for streaming activity exports"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='exportuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        base = timezone.make_aware(datetime(2024, 3, 4, 8, 0))
+        for idx in range(3):
+            Activity.objects.create(
+                user=self.user,
+                activity_type='running',
+                duration_minutes=10 * (idx + 1),
+                activity_date=base + timedelta(days=idx)
+            )
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        """Test the default export streams one JSON document per activity, oldest first"""
+        response = self.client.get('/api/activities/export/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['duration_minutes'] for row in rows], [10, 20, 30])
+        self.assertEqual(rows[0]['activity_date'], '2024-03-04T08:00:00+00:00')
+        self.assertEqual(rows[0]['user_id'], self.user.pk)
+
+    def test_export_csv(self):
+        """Test CSV export streams a header and one line per activity"""
+        response = self.client.get('/api/activities/export/', {'output': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = self.content(response).splitlines()
+        self.assertTrue(lines[0].startswith('_id,user_id,activity_type'))
+        self.assertEqual(len(lines), 4)
+
+    def test_export_invalid_output(self):
+        """Test an unknown export format is rejected"""
+        response = self.client.get('/api/activities/export/', {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FastSerializerParityTestCase(TestCase):
+    """Test cases checking fast serializers match the DRF serializers"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'parity{idx}', email=f'p{idx}@example.com', password='testpass123')
+            for idx in range(3)
+        ]
+        team = Team.objects.create(name='Parity Team', description='Same output', owner=self.users[0])
+        team.members.set(self.users)
+        Team.objects.create(name='Empty Team', owner=self.users[1])
+        for idx, user in enumerate(self.users):
+            Activity.objects.create(
+                user=user,
+                activity_type='cycling',
+                duration_minutes=20 + idx,
+                distance_km=None if idx else 12.5,
+                calories_burned=200,
+                description='Parity ride',
+                activity_date=timezone.now() - timedelta(days=idx)
+            )
+            Workout.objects.create(
+                user=user,
+                fitness_level='advanced',
+                workout_type='strength',
+                title='Parity Lift',
+                description='Heavy day',
+                duration_minutes=45,
+                exercises=['Squat', {'name': 'Bench', 'sets': 5}],
+                suggested_date=timezone.now() + timedelta(days=idx)
+            )
+        recompute_leaderboard()
+
+    def assertParity(self, queryset, serializer_class, fast_serializer):
+        expected = json.loads(JSONRenderer().render(serializer_class(queryset, many=True).data))
+        actual = json.loads(json.dumps(fast_serializer.serialize(fast_serializer.values(queryset))))
+        self.assertEqual(actual, expected)
+
+    def test_activity_parity(self):
+        """Test fast activity rows match ActivitySerializer"""
+        queryset = Activity.objects.select_related('user').order_by('activity_date')
+        self.assertParity(queryset, ActivitySerializer, fast_activity_serializer)
+
+    def test_workout_parity(self):
+        """Test fast workout rows match WorkoutSerializer"""
+        queryset = Workout.objects.select_related('user').order_by('suggested_date')
+        self.assertParity(queryset, WorkoutSerializer, fast_workout_serializer)
+
+    def test_leaderboard_parity(self):
+        """Test fast leaderboard rows, including nested team members, match LeaderboardSerializer"""
+        queryset = Leaderboard.objects.select_related('user', 'team__owner').order_by('rank', '_id')
+        self.assertParity(queryset, LeaderboardSerializer, fast_leaderboard_serializer)
+
+    @override_settings(FAST_LIST_SERIALIZATION=True)
+    def test_fast_list_sparse_fields_paginate(self):
+        """Test the fast path still pages when the ordering fields are not requested"""
+        client = APIClient()
+        client.force_authenticate(user=self.users[0])
+        response = client.get('/api/leaderboard/', {'page_size': 2, 'fields': 'points'})
+        self.assertEqual(response.data['results'][0], {'points': response.data['results'][0]['points']})
+        response = client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+
+    @override_settings(FAST_LIST_SERIALIZATION=True)
+    def test_fast_list_endpoint(self):
+        """Test list endpoints use the fast path with pagination when enabled"""
+        client = APIClient()
+        client.force_authenticate(user=self.users[0])
+        response = client.get('/api/leaderboard/', {'page_size': 2, 'expand': 'team.members'})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(len(response.data['results'][0]['team']['members']), 3)
+        response = client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_fieldset_parity(self):
+        """Test fast rows match the DRF serializers for sparse and expanded fieldsets"""
+        cases = [
+            (Leaderboard.objects.order_by('rank', '_id'), LeaderboardSerializer, fast_leaderboard_serializer,
+             {'expand': 'team.members,team.owner,user'}),
+            (Leaderboard.objects.order_by('rank', '_id'), LeaderboardSerializer, fast_leaderboard_serializer,
+             {'fields': 'rank,points,team.name,team.members', 'expand': 'team'}),
+            (Activity.objects.order_by('activity_date'), ActivitySerializer, fast_activity_serializer,
+             {'fields': '_id,user.username,distance_km', 'expand': 'user'}),
+            (Workout.objects.order_by('suggested_date'), WorkoutSerializer, fast_workout_serializer,
+             {'fields': 'title,exercises,suggested_date'}),
+        ]
+        for queryset, serializer_class, fast_serializer, params in cases:
+            with self.subTest(serializer=serializer_class.__name__, **params):
+                fieldset = {name: field_tree(params.get(name, '')) for name in ('fields', 'expand')}
+                drf = serializer_class(queryset, many=True, **fieldset)
+                fast = fast_serializer.for_params(params)
+                expected = json.loads(JSONRenderer().render(drf.data))
+                self.assertEqual(json.loads(json.dumps(fast.serialize(fast.values(queryset)))), expected)
+                if 'fields' in params:
+                    self.assertEqual(set(expected[0]), {path.split('.')[0] for path in params['fields'].split(',')})
+        self.assertIs(fast_leaderboard_serializer.for_params({}), fast_leaderboard_serializer)
+        self.assertIs(
+            fast_leaderboard_serializer.for_params({'expand': 'user,team'}),
+            fast_leaderboard_serializer.for_params({'expand': 'team, user'})
+        )
+
+
+class DatabaseHealthTestCase(TestCase):
+    """Test cases for connection pool monitoring and the database health endpoint"""
+
+    def test_pool_monitor_tracks_checkouts(self):
+        """Test pool events are turned into utilization and wait statistics"""
+        monitor = PoolMonitor()
+        address = ('localhost', 27017)
+        for connection_id in (1, 2):
+            monitor.connection_created(monitoring.ConnectionCreatedEvent(address, connection_id))
+            monitor.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(address))
+            monitor.connection_checked_out(monitoring.ConnectionCheckedOutEvent(address, connection_id))
+        monitor.connection_checked_in(monitoring.ConnectionCheckedInEvent(address, 1))
+        monitor.connection_check_out_failed(monitoring.ConnectionCheckOutFailedEvent(address, 'timeout'))
+
+        snapshot = monitor.snapshot(max_pool_size=4)
+        pool = snapshot['pools']['localhost:27017']
+        self.assertEqual(pool['open'], 2)
+        self.assertEqual(pool['checked_out'], 1)
+        self.assertEqual(pool['max_checked_out'], 2)
+        self.assertEqual(pool['utilization'], 0.25)
+        self.assertEqual(snapshot['checkouts'], 2)
+        self.assertEqual(snapshot['checkout_failures'], {'timeout': 1})
+        self.assertEqual(snapshot['checkout_wait_ms']['samples'], 2)
+
+    def test_health_endpoint(self):
+        """Test the health endpoint reports round-trip latency and pool statistics"""
+        response = APIClient().get('/api/health/db/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'ok')
+        self.assertGreaterEqual(response.data['round_trip_ms'], 0)
+        self.assertIn('checkout_wait_ms', response.data)
+        self.assertIn('pools', response.data)
+
+
+class AsyncReadPathTestCase(TestCase):
+    """Test cases for the async read endpoints under /api/async/"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='asyncuser', email='async@example.com', password='testpass123')
+        UserProfile.objects.create(user=self.user, fitness_level='beginner')
+        team = Team.objects.create(name='Async Team', owner=self.user)
+        team.members.add(self.user)
+        for days_ago in range(3):
+            Activity.objects.create(
+                user=self.user,
+                activity_type='running',
+                duration_minutes=30,
+                distance_km=5.0,
+                calories_burned=300,
+                activity_date=timezone.now() - timedelta(days=days_ago)
+            )
+        Workout.objects.create(
+            user=self.user,
+            fitness_level='beginner',
+            workout_type='cardio',
+            title='Easy Jog',
+            description='Light run',
+            duration_minutes=20,
+            suggested_date=timezone.now()
+        )
+        recompute_leaderboard()
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.async_client = AsyncClient()
+        self.async_client.force_login(self.user)
+
+    async def test_requires_authentication(self):
+        """Test anonymous requests to user-scoped async endpoints are rejected"""
+        response = await AsyncClient().get('/api/async/activities/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_activity_list(self):
+        """Test async activity list returns newest first, limited by page_size"""
+        response = await self.async_client.get('/api/async/activities/', {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual(len(results), 2)
+        self.assertGreater(results[0]['activity_date'], results[1]['activity_date'])
+
+    async def test_statistics_match_sync(self):
+        """Test async statistics match the sync endpoint, including errors"""
+        for params in ({}, {'group_by': 'activity_type'}, {'group_by': 'day'}, {'group_by': 'bogus'}):
+            sync_response = await sync_to_async(self.client.get)('/api/activities/statistics/', params)
+            async_response = await self.async_client.get('/api/async/activities/statistics/', params)
+            self.assertEqual(async_response.status_code, sync_response.status_code)
+            self.assertEqual(async_response.json(), json.loads(sync_response.content))
+
+    async def test_leaderboard_matches_sync(self):
+        """Test async leaderboard rows and top performers match the sync endpoints"""
+        sync_response = await sync_to_async(self.client.get)('/api/leaderboard/')
+        async_response = await self.async_client.get('/api/async/leaderboard/')
+        self.assertEqual(async_response.json()['results'], json.loads(sync_response.content)['results'])
+
+        async_response = await self.async_client.get('/api/async/leaderboard/top_performers/')
+        sync_response = await sync_to_async(self.client.get)('/api/leaderboard/top_performers/')
+        self.assertEqual(async_response.json(), json.loads(sync_response.content))
+        self.assertEqual((await sync_to_async(cache_stats)())['hits'], 1)
+
+    async def test_workout_suggestions(self):
+        """Test async suggestions match the sync endpoint"""
+        await sync_to_async(refresh_suggestions)([self.user.pk], count=3)
+        sync_response = await sync_to_async(self.client.get)('/api/workouts/suggestions/')
+        async_response = await self.async_client.get('/api/async/workouts/suggestions/')
+        self.assertEqual(async_response.json(), json.loads(sync_response.content))
+        self.assertEqual([row['suggestion_rank'] for row in async_response.json()], [1, 2, 3])
+        self.assertEqual(async_response.json()[0]['title'], 'Easy Jog')
+
+
+@override_settings(JOB_COALESCE_SECONDS=0, JOB_BACKOFF_SECONDS=10, JOB_MAX_ATTEMPTS=2)
+class JobQueueTestCase(TestCase):
+    """Test cases for the background job queue and leaderboard recompute jobs"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='queueuser', email='queue@example.com', password='testpass123')
+        self.other = User.objects.create_user(username='queueother', email='other@example.com', password='testpass123')
+        self.team = Team.objects.create(name='Queue Team', owner=self.user)
+        self.team.members.set([self.user, self.other])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def log_activity(self, minutes):
+        return self.client.post('/api/activities/', {
+            'activity_type': 'running',
+            'duration_minutes': minutes,
+            'distance_km': 1.0,
+            'calories_burned': 100,
+            'activity_date': timezone.now().isoformat()
+        }, format='json')
+
+    def test_activity_writes_enqueue_coalesced_team_job(self):
+        """Test repeated activity writes leave a single pending recompute per team"""
+        for minutes in (10, 20, 30):
+            self.assertEqual(self.log_activity(minutes).status_code, status.HTTP_201_CREATED)
+        pending = Job.objects.filter(status=jobs.PENDING)
+        self.assertEqual(pending.count(), 1)
+        self.assertEqual(pending.get().key, f'recompute_team:{self.team.pk}')
+
+    def test_worker_recomputes_team_then_reranks(self):
+        """Test a team job refreshes totals and queues a rerank that assigns global ranks"""
+        self.log_activity(30)
+        result = jobs.run_batch('test-worker')
+        self.assertEqual(result['succeeded'], 1)
+        entry = Leaderboard.objects.get(team=self.team, user=self.user)
+        self.assertEqual(entry.total_duration_minutes, 30)
+        self.assertEqual(entry.team_rank, 1)
+        self.assertEqual(list(Job.objects.values_list('kind', flat=True)), [jobs.RERANK])
+
+        jobs.run_batch('test-worker')
+        self.assertFalse(Job.objects.exists())
+        ranks = dict(Leaderboard.objects.values_list('user__username', 'rank'))
+        self.assertEqual(ranks, {'queueuser': 1, 'queueother': 2})
+
+    def test_failed_job_backs_off_then_fails(self):
+        """Test a failing job is retried with backoff and parked after its last attempt"""
+        jobs.enqueue('explode', 'explode')
+
+        def explode(payload):
+            raise RuntimeError('boom')
+
+        jobs.HANDLERS['explode'] = explode
+        try:
+            with self.assertLogs('octofit_tracker.jobs', 'ERROR'):
+                result = jobs.run_batch('test-worker')
+            self.assertEqual(result['retried'], 1)
+            job = Job.objects.get()
+            self.assertEqual((job.status, job.attempts), (jobs.PENDING, 1))
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=5))
+            self.assertEqual(jobs.run_batch('test-worker')['claimed'], 0)
+
+            Job.objects.filter(key='explode').update(run_after=timezone.now())
+            with self.assertLogs('octofit_tracker.jobs', 'ERROR'):
+                result = jobs.run_batch('test-worker')
+            self.assertEqual(result['failed'], 1)
+            job = Job.objects.get()
+            self.assertEqual(job.status, jobs.FAILED)
+            self.assertEqual(job.last_error, 'RuntimeError: boom')
+        finally:
+            del jobs.HANDLERS['explode']
+
+    def test_stale_jobs_requeued_and_depth_reported(self):
+        """Test jobs abandoned by a worker are requeued and queue depth is reported"""
+        jobs.enqueue_team_recomputes([self.team.pk])
+        Job.objects.filter(status=jobs.PENDING).update(
+            status=jobs.RUNNING, locked_at=timezone.now() - timedelta(days=1)
+        )
+        self.assertEqual(jobs.requeue_stale(), 1)
+
+        response = self.client.get('/api/health/jobs/')
+        self.assertEqual(response.data['pending'], 1)
+        self.assertEqual(response.data['due'], 1)
+        self.assertEqual(response.data['by_kind'], {jobs.RECOMPUTE_TEAM: {jobs.PENDING: 1}})
+
+    def test_one_pending_job_per_key(self):
+        """Test the pending-key index rejects a second pending job and requeues coalesce into it"""
+        self.assertTrue(jobs.enqueue(jobs.RERANK, jobs.RERANK))
+        with self.assertRaises(DatabaseError):
+            Job.objects.create(kind=jobs.RERANK, key=jobs.RERANK, run_after=timezone.now())
+        [running] = jobs.claim('test-worker', 10)
+        self.assertEqual((running.status, running.attempts), (jobs.RUNNING, 1))
+        self.assertTrue(jobs.enqueue(jobs.RERANK, jobs.RERANK))
+        self.assertFalse(jobs.enqueue(jobs.RERANK, jobs.RERANK))
+        self.assertEqual(jobs.retry_or_fail(running, 'lost'), jobs.PENDING)
+        self.assertEqual(list(Job.objects.values_list('status', flat=True)), [jobs.PENDING])
+
+
+class RequestMetricsTestCase(TestCase):
+    """Test cases for the metrics middleware and Prometheus endpoint"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='metricsuser', email='metrics@example.com', password='testpass123')
+        Activity.objects.create(
+            user=self.user,
+            activity_type='yoga',
+            duration_minutes=40,
+            activity_date=timezone.now()
+        )
+        metrics.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def sample(self, text, prefix):
+        lines = [line for line in text.splitlines() if line.startswith(prefix)]
+        self.assertEqual(len(lines), 1, prefix)
+        return float(lines[0].rsplit(' ', 1)[1])
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test histogram samples render cumulative buckets, sum and count"""
+        histogram = metrics.Histogram('test_seconds', 'Test', ('view',), (0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(('a',), value)
+        self.assertEqual(list(histogram.samples()), [
+            'test_seconds_bucket{view="a",le="0.1"} 1',
+            'test_seconds_bucket{view="a",le="1.0"} 2',
+            'test_seconds_bucket{view="a",le="+Inf"} 3',
+            'test_seconds_sum{view="a"} 5.55',
+            'test_seconds_count{view="a"} 3',
+        ])
+
+    @override_settings(METRICS_ENABLED=True, METRICS_SERVER_TIMING=True)
+    def test_requests_recorded_and_exposed(self):
+        """Test requests are recorded per view with database, serializer and size metrics"""
+        response = self.client.get('/api/activities/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertRegex(response['Server-Timing'], r'app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", serialize;dur=')
+
+        text = self.client.get('/api/metrics/').content.decode()
+        labels = '{view="activity-list",method="GET"'
+        self.assertEqual(self.sample(text, 'octofit_requests_total' + labels + ',status="200"}'), 1)
+        self.assertEqual(self.sample(text, 'octofit_request_duration_seconds_count' + labels + '}'), 1)
+        self.assertGreater(self.sample(text, 'octofit_db_queries_sum' + labels + '}'), 0)
+        self.assertGreater(self.sample(text, 'octofit_serializer_duration_seconds_sum' + labels + '}'), 0)
+        self.assertEqual(self.sample(text, 'octofit_response_size_bytes_sum' + labels + '}'), len(response.content))
+
+    def test_disabled_by_default(self):
+        """Test nothing is recorded and no header is added when metrics are disabled"""
+        response = self.client.get('/api/activities/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('activity-list', self.client.get('/api/metrics/').content.decode())
+
+
+class SlowQueryLogTestCase(TestCase):
+    """Test cases for the slow-query listener and ranking"""
+
+    def command_events(self, command, duration_ms, request_id=1):
+        started = monitoring.CommandStartedEvent(command, 'octofit_db', request_id, ('localhost', 27017), request_id)
+        succeeded = monitoring.CommandSucceededEvent(
+            timedelta(milliseconds=duration_ms), {'ok': 1}, next(iter(command)), request_id, ('localhost', 27017), request_id
+        )
+        return started, succeeded
+
+    def test_fingerprint_ignores_values(self):
+        """Test queries differing only in values share a fingerprint"""
+        first = fingerprint('find', {'find': 'activities', 'filter': {'user_id': 1, 'day': {'$gte': 'a'}}})
+        second = fingerprint('find', {'find': 'activities', 'filter': {'user_id': 7, 'day': {'$gte': 'b'}}})
+        other = fingerprint('find', {'find': 'activities', 'filter': {'activity_type': 'yoga'}})
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def test_listener_logs_only_slow_commands(self):
+        """Test slow commands are logged with their view and query, fast ones are not"""
+        listener = SlowQueryListener(threshold_ms=50, capture_explain=False, background=False)
+        token = slow_query_request.set(('GET', '/api/activities/'))
+        try:
+            fast = self.command_events({'find': 'activities', 'filter': {'user_id': 1}, 'lsid': {}}, 5, 1)
+            with self.assertNoLogs('octofit_tracker.slow_queries'):
+                listener.started(fast[0])
+                listener.succeeded(fast[1])
+            slow = self.command_events({'find': 'activities', 'filter': {'user_id': 1}, 'lsid': {}}, 120, 2)
+            with self.assertLogs('octofit_tracker.slow_queries') as logs:
+                listener.started(slow[0])
+                listener.succeeded(slow[1])
+        finally:
+            slow_query_request.reset(token)
+
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['view'], 'activity-list')
+        self.assertEqual(entry['collection'], 'activities')
+        self.assertEqual(entry['duration_ms'], 120)
+        self.assertEqual(entry['query'], {'find': 'activities', 'filter': {'user_id': 1}})
+        self.assertEqual(listener.in_flight, {})
+
+    def test_command_ranks_worst_offenders(self):
+        """Test the slow_queries command groups by query shape and ranks by total time"""
+        def entry(collection, duration_ms):
+            return {
+                'timestamp': '2024-01-01T00:00:00+00:00', 'command': 'find', 'collection': collection,
+                'duration_ms': duration_ms, 'fingerprint': f'find:{collection}:{{}}', 'view': 'activity-list',
+                'query': {'find': collection}, 'explain': {'collection_scan': True, 'indexes': [], 'stages': ['COLLSCAN']},
+            }
+
+        entries = [entry('activities', 300), entry('activities', 300), entry('workouts', 500)]
+        ranking = rank_offenders(entries)
+        self.assertEqual([group['collection'] for group in ranking], ['activities', 'workouts'])
+        self.assertEqual(ranking[0]['count'], 2)
+        self.assertEqual(rank_offenders(entries, sort='max')[0]['collection'], 'workouts')
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'slow.log')
+            with open(path, 'w') as log:
+                log.writelines(json.dumps(item) + '\n' for item in entries)
+            output = StringIO()
+            call_command('slow_queries', log=path, stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertIn('COLLSCAN', lines[1])
+        self.assertIn('activities', lines[1])
+        self.assertIn('workouts', lines[2])
+
+
+class LoadDataTestCase(TestCase):
+    """Test cases for synthetic data generation and endpoint benchmarking"""
+
+    def setUp(self):
+        self.seeder = Seeder(prefix='t', seed=7, batch_size=50)
+        self.user_ids = self.seeder.create_users(20)
+        self.seeder.create_teams(3, self.user_ids)
+        self.seeder.create_activities(self.user_ids, 300, days=30, users_per_chunk=8)
+        self.seeder.create_workouts(self.user_ids, per_user=2)
+
+    def test_seeder_creates_consistent_dataset(self):
+        """Test seeded rows are related and the bulk-built rollups match the activities"""
+        self.assertEqual(UserProfile.objects.count(), 20)
+        self.assertEqual(Activity.objects.count(), 300)
+        self.assertEqual(Workout.objects.count(), 40)
+        self.assertEqual(set(Team.members.through.objects.values_list('user_id', flat=True)), set(self.user_ids))
+        self.assertFalse(Activity.objects.filter(activity_date__gt=self.seeder.now).exists())
+        counts = reconcile_rollups(dry_run=True)
+        self.assertEqual((counts['created'], counts['updated'], counts['deleted']), (0, 0, 0))
+
+    def test_seeder_clear_removes_only_its_dataset(self):
+        """Test clearing a dataset leaves other users untouched"""
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.seeder.clear()
+        self.assertEqual(list(User.objects.values_list('id', flat=True)), [other.id])
+        self.assertEqual(Activity.objects.count(), 0)
+        self.assertEqual(ActivityRollup.objects.count(), 0)
+        self.assertEqual(Team.objects.count(), 0)
+
+    def test_benchmark_and_compare(self):
+        """Test endpoints are timed with query counts and regressions are detected"""
+        recompute_leaderboard()
+        user = User.objects.get(pk=self.user_ids[0])
+        results = benchmark_endpoints(user, repeat=2, warmup=0, names=['activities', 'statistics'])
+        self.assertEqual(set(results), {'activities', 'statistics'})
+        self.assertEqual(results['activities']['status'], 200)
+        self.assertGreater(results['activities']['queries'], 0)
+
+        baseline = {'results': {'activities': {'median_ms': 10.0, 'queries': 3}, 'users': {'median_ms': 5.0, 'queries': 2}}}
+        current = {'results': {'activities': {'median_ms': 10.5, 'queries': 3}, 'users': {'median_ms': 5.0, 'queries': 3}}}
+        self.assertEqual([item['name'] for item in compare(baseline, current, threshold=0.1)], ['users'])
+        self.assertEqual([item['name'] for item in compare(baseline, current, threshold=0.01)], ['activities', 'users'])
+
+    def test_populate_db_resets_to_fixtures(self):
+        """Test populate_db replaces all data but superusers with the hero fixtures"""
+        admin = User.objects.create_superuser(username='admin', password='testpass123')
+        call_command('populate_db', stdout=StringIO())
+        self.assertEqual(User.objects.filter(is_superuser__in=[False]).count(), 6)
+        self.assertEqual(User.objects.filter(pk=admin.pk).count(), 1)
+        self.assertEqual(set(Team.objects.values_list('name', flat=True)), {'Team Marvel', 'Team DC'})
+        self.assertEqual(Team.members.through.objects.count(), 6)
+        self.assertEqual(Activity.objects.count(), 6)
+        self.assertEqual(Leaderboard.objects.count(), 6)
+        counts = reconcile_rollups(dry_run=True)
+        self.assertEqual((counts['created'], counts['updated'], counts['deleted']), (0, 0, 0))
+
+
+class ConditionalGetTestCase(TestCase):
+    """Test cases for ETag-based conditional GETs"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='etaguser', email='etag@example.com', password='testpass123')
+        self.profile = UserProfile.objects.create(user=self.user, fitness_level='beginner')
+        self.team = Team.objects.create(name='ETag Team', owner=self.user)
+        self.team.members.add(self.user)
+        Activity.objects.create(
+            user=self.user, activity_type='running', duration_minutes=30, distance_km=5.0,
+            calories_burned=300, activity_date=timezone.now()
+        )
+        self.workout = Workout.objects.create(
+            user=self.user, fitness_level='beginner', workout_type='cardio', title='Easy Jog',
+            description='Light run', duration_minutes=20, suggested_date=timezone.now()
+        )
+        recompute_leaderboard()
+        refresh_suggestions([self.user.pk])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def revalidate(self, path):
+        """Fetch a path, then fetch it again with the ETag it returned"""
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['ETag'].startswith('"'))
+        return response['ETag'], self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_leaderboard_is_not_modified(self):
+        """Test a matching ETag gets 304 without loading leaderboard rows"""
+        etag, response = self.revalidate('/api/leaderboard/')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/leaderboard/', HTTP_IF_NONE_MATCH=etag)
+        self.assertFalse(any('SELECT' in query['sql'] and 'COUNT' not in query['sql'] for query in queries))
+
+    def test_changes_produce_new_etag(self):
+        """Test writes to the rows or embedded teams change the ETag"""
+        etag, _ = self.revalidate('/api/leaderboard/')
+        self.team.members.add(User.objects.create_user(username='newmember', password='testpass123'))
+        self.assertEqual(self.client.get('/api/leaderboard/', HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+        etag, _ = self.revalidate(f'/api/leaderboard/?team_id={self.team.pk}')
+        Team.objects.filter(pk=self.team.pk).update(description='Renamed', updated_at=timezone.now())
+        response = self.client.get(f'/api/leaderboard/?team_id={self.team.pk}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_team_filter(self):
+        """Test the team_id filter matches the team's entries and a malformed id matches none"""
+        for path in ('/api/leaderboard/', '/api/async/leaderboard/'):
+            response = self.client.get(f'{path}?team_id={self.team.pk}')
+            self.assertEqual([row['user'] for row in response.json()['results']], [self.user.pk])
+            for team_id in (ObjectId(), 'not-an-id'):
+                response = self.client.get(f'{path}?team_id={team_id}')
+                self.assertEqual(response.json()['results'], [])
+
+    def test_rerank_produces_new_etag(self):
+        """Test ranks moved by a rerank change the ETag"""
+        other = User.objects.create_user(username='rerankuser', password='testpass123')
+        self.team.members.add(other)
+        recompute_leaderboard()
+        etag, response = self.revalidate('/api/leaderboard/')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Leaderboard.objects.filter(user=other).update(points=10000)
+        self.assertEqual(rerank_leaderboard(), {'updated': 2})
+        response = self.client.get('/api/leaderboard/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['user'] for row in response.data['results']], [other.pk, self.user.pk])
+
+    def test_suggestions_and_details(self):
+        """Test suggestions, workout detail and profile detail revalidate until they change"""
+        etag, response = self.revalidate('/api/workouts/suggestions/')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.client.post(f'/api/workouts/{self.workout.pk}/mark_complete/')
+        response = self.client.get('/api/workouts/suggestions/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn(str(self.workout.pk), [row['_id'] for row in response.data])
+
+        _, response = self.revalidate(f'/api/workouts/{self.workout.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        _, response = self.revalidate(f'/api/profiles/{self.profile.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_malformed_pk_is_not_found(self):
+        """Test a detail URL whose id cannot be converted answers 404 before the ETag check"""
+        for path in ('/api/profiles/', '/api/leaderboard/', '/api/workouts/'):
+            for pk in ('abc', '1.5', '0' * 25):
+                with self.subTest(path=path, pk=pk):
+                    self.assertEqual(self.client.get(f'{path}{pk}/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_etag_is_per_user(self):
+        """Test another user's ETag for the same URL does not match"""
+        etag, _ = self.revalidate('/api/workouts/')
+        other = User.objects.create_user(username='otheretag', password='testpass123')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get('/api/workouts/', HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    async def test_async_leaderboard_is_not_modified(self):
+        """Test the async leaderboard honours If-None-Match too"""
+        client = AsyncClient()
+        response = await client.get('/api/async/leaderboard/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Django 4.1's AsyncClient sends extra kwargs as raw header names
+        response = await client.get('/api/async/leaderboard/', **{'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class FieldsetAPITestCase(TestCase):
+    """Test cases for ?fields= and ?expand= on the API"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='fielduser', email='field@example.com', password='testpass123')
+        self.other = User.objects.create_user(username='fieldother', email='other@example.com', password='testpass123')
+        UserProfile.objects.create(user=self.user, fitness_level='beginner')
+        self.team = Team.objects.create(name='Field Team', owner=self.user)
+        self.team.members.set([self.user, self.other])
+        for user in (self.user, self.other):
+            Activity.objects.create(
+                user=user, activity_type='running', duration_minutes=30, distance_km=5.0,
+                calories_burned=300, activity_date=timezone.now()
+            )
+        recompute_leaderboard()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_relations_are_ids_by_default(self):
+        """Test related objects render as ids unless expanded"""
+        entry = self.client.get('/api/leaderboard/').data['results'][0]
+        self.assertEqual(entry['team'], str(self.team.pk))
+        self.assertIn(entry['user'], (self.user.pk, self.other.pk))
+        team = self.client.get(f'/api/teams/{self.team.pk}/').data
+        self.assertEqual(team['owner'], self.user.pk)
+        self.assertEqual(sorted(team['members']), sorted([self.user.pk, self.other.pk]))
+
+    def test_expand_and_fields(self):
+        """Test expansion nests objects and fields narrows output at every level"""
+        entry = self.client.get('/api/leaderboard/', {'expand': 'team.members,user'}).data['results'][0]
+        self.assertEqual(entry['team']['name'], 'Field Team')
+        self.assertEqual(entry['team']['owner'], self.user.pk)
+        self.assertEqual({member['username'] for member in entry['team']['members']}, {'fielduser', 'fieldother'})
+        self.assertIn('username', entry['user'])
+
+        entry = self.client.get(
+            '/api/leaderboard/', {'fields': 'rank,team.name', 'expand': 'team'}
+        ).data['results'][0]
+        self.assertEqual(entry, {'rank': entry['rank'], 'team': {'name': 'Field Team'}})
+        activity = self.client.get('/api/activities/', {'fields': 'activity_type'}).data['results'][0]
+        self.assertEqual(activity, {'activity_type': 'running'})
+
+    def test_unexpanded_relations_are_not_fetched(self):
+        """Test ids come from foreign key columns and expansions join or prefetch once"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/activities/', {'fields': '_id,activity_type'})
+        listing = [query['sql'] for query in queries if 'activities' in query['sql']]
+        self.assertEqual(len(listing), 1)
+        self.assertNotIn('auth_user', listing[0])
+        self.assertNotIn('description', listing[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/teams/', {'expand': 'members'})
+        self.assertEqual(len(response.data[0]['members']), 2)
+        self.assertEqual(len(queries), 2)
+
+    def test_top_performers_cached_per_fieldset(self):
+        """Test cached top performers are kept apart by fieldset"""
+        cache.clear()
+        ids = self.client.get('/api/leaderboard/top_performers/').data
+        expanded = self.client.get('/api/leaderboard/top_performers/', {'expand': 'user'}).data
+        self.assertIsInstance(ids[0]['user'], int)
+        self.assertIsInstance(expanded[0]['user'], dict)
+
+    def test_writes_ignore_fieldsets(self):
+        """Test ?fields= does not drop input fields on writes"""
+        response = self.client.post('/api/activities/?fields=_id', {
+            'activity_type': 'yoga', 'duration_minutes': 20, 'calories_burned': 80,
+            'activity_date': timezone.now().isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['activity_type'], 'yoga')
+
+    async def test_async_views_share_fieldsets(self):
+        """Test the async views honour fields and expand like the sync ones"""
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.user)
+        response = await client.get('/api/async/leaderboard/', {'expand': 'team', 'fields': 'rank,team.name'})
+        self.assertEqual(set(json.loads(response.content)['results'][0]), {'rank', 'team'})
+        response = await client.get('/api/async/activities/')
+        self.assertEqual(json.loads(response.content)['results'][0]['user'], self.user.pk)
+
+
+class ActivityTrendsTestCase(TestCase):
+    """API test cases for activity trend series served from the daily rollups"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='trenduser', email='trend@example.com', password='testpass123')
+        self.teammate = User.objects.create_user(username='trendmate', email='mate@example.com', password='testpass123')
+        self.team = Team.objects.create(name='Trend Team', owner=self.user)
+        self.team.members.add(self.user, self.teammate)
+        self.client.force_authenticate(user=self.user)
+        self.now = timezone.now()
+        for user, days_ago, activity_type, duration, distance, calories in [
+            (self.user, 0, 'running', 30, 5.0, 300),
+            (self.user, 3, 'cycling', 60, 20.0, 500),
+            (self.user, 20, 'running', 40, 7.5, 350),
+            (self.user, 100, 'swimming', 45, 1.5, 400),
+            (self.teammate, 1, 'running', 25, 4.0, 250),
+        ]:
+            Activity.objects.create(
+                user=user,
+                activity_type=activity_type,
+                duration_minutes=duration,
+                distance_km=distance,
+                calories_burned=calories,
+                activity_date=self.now - timedelta(days=days_ago)
+            )
+
+    def test_daily_series_and_windows(self):
+        """Test the daily series is zero-filled and windows sum the buckets by activity type"""
+        response = self.client.get('/api/activities/trends/', {'days': 7})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        series = response.data['series']
+        self.assertEqual(len(series), 7)
+        self.assertEqual(series[-1]['period'], timezone.localdate().isoformat())
+        self.assertEqual(series[-1]['total_duration_minutes'], 30)
+        self.assertEqual(sum(bucket['total_activities'] for bucket in series), 2)
+        windows = response.data['windows']
+        self.assertEqual(windows['7d']['total_activities'], 2)
+        self.assertEqual(windows['30d']['total_distance'], 32.5)
+        self.assertEqual(windows['30d']['by_type']['running']['total_calories'], 650)
+        self.assertEqual(windows['365d']['total_activities'], 4)
+        self.assertEqual(set(windows['365d']['by_type']), {'cycling', 'running', 'swimming'})
+
+    def test_monthly_series_covers_every_activity(self):
+        """Test monthly buckets add up to the yearly window"""
+        response = self.client.get('/api/activities/trends/', {'period': 'month'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(all(bucket['period'].endswith('-01') for bucket in response.data['series']))
+        self.assertEqual(sum(bucket['total_calories'] for bucket in response.data['series']), 1550)
+
+    def test_team_trends_sum_members(self):
+        """Test team trends include every member and use a bounded number of queries"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/activities/trends/', {'team_id': self.team.pk, 'period': 'week'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['windows']['7d']['total_activities'], 3)
+        self.assertEqual(response.data['windows']['7d']['by_type']['running']['total_activities'], 2)
+        self.assertLessEqual(len(queries), 3)
+        for team_id in (str(ObjectId()), 'not-an-id', 999999):
+            response = self.client.get('/api/activities/trends/', {'team_id': team_id})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_trends_invalid_params(self):
+        """Test invalid period and span are rejected"""
+        for params in ({'period': 'year'}, {'days': 'many'}, {'days': 0}, {'days': 1000}):
+            response = self.client.get('/api/activities/trends/', params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(SUGGESTION_COUNT=4)
+class WorkoutSuggestionTestCase(TestCase):
+    """Test cases for the materialized workout suggestion lists"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='suggestuser', email='suggest@example.com', password='testpass123')
+        self.profile = UserProfile.objects.create(user=self.user, fitness_level='intermediate')
+        for days_ago, activity_type, duration in [(1, 'gym', 60), (2, 'gym', 90), (3, 'running', 30)]:
+            Activity.objects.create(
+                user=self.user, activity_type=activity_type, duration_minutes=duration,
+                activity_date=timezone.now() - timedelta(days=days_ago)
+            )
+        self.pending = Workout.objects.create(
+            user=self.user, fitness_level='intermediate', workout_type='balance', title='Balance Basics',
+            description='Stability work', duration_minutes=25, suggested_date=timezone.now() + timedelta(days=1)
+        )
+        Workout.objects.create(
+            user=self.user, fitness_level='advanced', workout_type='cardio', title='Too Hard',
+            description='Wrong level', duration_minutes=60, suggested_date=timezone.now()
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def suggestions(self):
+        return list(Workout.objects.filter(user=self.user, suggestion_rank__gt=0).order_by('suggestion_rank'))
+
+    def test_plan_follows_activity_mix(self):
+        """Test new suggestion types are apportioned by minutes trained, counting kept ones"""
+        self.assertEqual(plan_workout_types({'strength': 150, 'cardio': 30}, ['balance'], 3),
+                         ['strength', 'strength', 'cardio'])
+        self.assertEqual(plan_workout_types({}, [], 2), ['cardio', 'strength'])
+
+    def test_refresh_keeps_pending_and_tops_up(self):
+        """Test a refresh keeps matching pending workouts first and generates the rest for the level"""
+        result = refresh_suggestions([self.user.pk])
+        self.assertEqual(result['created'], 3)
+        suggestions = self.suggestions()
+        self.assertEqual(suggestions[0].pk, self.pending.pk)
+        self.assertEqual([workout.workout_type for workout in suggestions[1:]], ['strength', 'strength', 'cardio'])
+        self.assertTrue(all(workout.fitness_level == 'intermediate' for workout in suggestions))
+        self.assertEqual(sorted(workout.suggested_date for workout in suggestions),
+                         [workout.suggested_date for workout in suggestions])
+        self.assertEqual(refresh_suggestions([self.user.pk]), {'users': 1, 'created': 0, 'reranked': 0})
+
+    def test_endpoint_is_single_indexed_read(self):
+        """Test the suggestions endpoint reads the ranked list without touching the profile"""
+        refresh_suggestions([self.user.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/workouts/suggestions/')
+        self.assertEqual([row['suggestion_rank'] for row in response.data], [1, 2, 3, 4])
+        # One ETag aggregate plus the read itself
+        self.assertEqual(len(queries), 2)
+        self.assertFalse(any('users' in query['sql'] for query in queries))
+
+    def test_mark_complete_and_level_change_refresh(self):
+        """Test completing a suggestion replaces it and a new fitness level rebuilds the list"""
+        refresh_suggestions([self.user.pk])
+        response = self.client.post(f'/api/workouts/{self.pending.pk}/mark_complete/')
+        self.assertEqual(response.data['suggestion_rank'], 0)
+        suggestions = self.suggestions()
+        self.assertEqual(len(suggestions), 4)
+        self.assertNotIn(self.pending.pk, [workout.pk for workout in suggestions])
+
+        response = self.client.patch(f'/api/profiles/{self.profile.pk}/', {'fitness_level': 'advanced'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        suggestions = self.suggestions()
+        self.assertEqual(suggestions[0].title, 'Too Hard')
+        self.assertTrue(all(workout.fitness_level == 'advanced' for workout in suggestions))
+
+    @override_settings(JOB_COALESCE_SECONDS=0)
+    def test_activity_writes_queue_refresh(self):
+        """Test logging an activity queues one coalesced suggestion refresh for the user"""
+        for minutes in (20, 40):
+            self.client.post('/api/activities/', {
+                'activity_type': 'yoga', 'duration_minutes': minutes, 'activity_date': timezone.now().isoformat()
+            }, format='json')
+        pending = Job.objects.filter(kind=jobs.REFRESH_SUGGESTIONS)
+        self.assertEqual(list(pending.values_list('key', flat=True)), [f'refresh_suggestions:{self.user.pk}'])
+        jobs.run_batch('test-worker')
+        self.assertEqual(len(self.suggestions()), 4)
+        self.assertFalse(Job.objects.filter(kind=jobs.REFRESH_SUGGESTIONS).exists())
+
+
+class WorkoutCompletionTestCase(TestCase):
+    """Test cases for single and bulk workout completion"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='completer', email='complete@example.com', password='testpass123')
+        self.other = User.objects.create_user(username='bystander', email='by@example.com', password='testpass123')
+        self.workouts = [
+            Workout.objects.create(
+                user=user, fitness_level='beginner', workout_type='cardio', title=f'Day {day}',
+                description='Weekly plan', duration_minutes=30, exercises=['Warm-up', 'Run'],
+                suggested_date=timezone.now() + timedelta(days=day)
+            )
+            for day, user in enumerate([self.user, self.user, self.user, self.other])
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_mark_complete_writes_changed_fields_only(self):
+        """Test the single-item action saves only the completion fields"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/api/workouts/{self.workouts[0].pk}/mark_complete/')
+        self.assertTrue(response.data['is_completed'])
+        update = next(query['sql'] for query in queries if 'UPDATE "workouts"' in query['sql'])
+        self.assertIn('is_completed', update)
+        self.assertNotIn('exercises', update)
+
+    def test_bulk_complete_only_touches_own_workouts(self):
+        """Test bulk completion updates the caller's workouts in one statement and reports the rest"""
+        mine, other = [str(workout.pk) for workout in self.workouts[:2]], str(self.workouts[3].pk)
+        Workout.objects.filter(pk=self.workouts[1].pk).update(is_completed=True)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/workouts/complete/', {'ids': mine + [other, 'bogus']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'completed': 1, 'already_completed': 1, 'not_found': ['bogus', other]})
+        self.assertEqual(sum('UPDATE "workouts"' in query['sql'] for query in queries), 1)
+        self.assertTrue(Workout.objects.get(pk=self.workouts[0].pk).is_completed)
+        self.assertFalse(Workout.objects.get(pk=self.workouts[3].pk).is_completed)
+
+    def test_bulk_complete_reports_non_string_ids(self):
+        """Test ids that are not strings are reported as not found next to valid ones"""
+        mine = str(self.workouts[0].pk)
+        ids = [mine, {'x': 1}, [mine], 42, None]
+        response = self.client.post('/api/workouts/complete/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'completed': 1, 'already_completed': 0, 'not_found': ids[1:]})
+
+    @override_settings(WORKOUT_BULK_MAX_ITEMS=2)
+    def test_bulk_complete_validates_ids(self):
+        """Test missing, empty and oversized id lists are rejected"""
+        for data in ({}, {'ids': []}, {'ids': 'all'}, {'ids': ['a', 'b', 'c']}):
+            response = self.client.post('/api/workouts/complete/', data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TeamMembershipBulkTestCase(TestCase):
+    """Test cases for bulk team membership actions"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='teamowner', email='owner@example.com', password='testpass123')
+        self.users = [User.objects.create_user(username=f'member{idx}', password='testpass123') for idx in range(5)]
+        self.ids = [user.pk for user in self.users]
+        self.team = Team.objects.create(name='Bulk Team', owner=self.owner)
+        self.team.members.add(*self.users[:2])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.owner)
+
+    def post(self, action, user_ids):
+        return self.client.post(f'/api/teams/{self.team.pk}/{action}/', {'user_ids': user_ids}, format='json')
+
+    def members(self):
+        return set(self.team.members.values_list('id', flat=True))
+
+    def test_add_members_in_bounded_queries(self):
+        """Test adding many members validates, diffs and writes with a fixed number of queries"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post('add_members', self.ids)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'added': self.ids[2:], 'removed': []})
+        self.assertEqual(self.members(), set(self.ids))
+        self.assertEqual(sum('INSERT INTO "teams_members"' in query['sql'] for query in queries), 1)
+        self.assertLessEqual(len(queries), 8)
+        self.assertEqual(Job.objects.filter(key=f'recompute_team:{self.team.pk}').count(), 1)
+
+    def test_remove_and_set_members(self):
+        """Test removal ignores non-members and set applies the full diff"""
+        response = self.post('remove_members', [self.ids[0], self.ids[4]])
+        self.assertEqual(response.data, {'added': [], 'removed': [self.ids[0]]})
+        response = self.post('set_members', self.ids[2:4])
+        self.assertEqual(response.data, {'added': self.ids[2:4], 'removed': [self.ids[1]]})
+        self.assertEqual(self.members(), set(self.ids[2:4]))
+
+    def test_membership_changes_invalidate_leaderboard(self):
+        """Test swapping members changes the leaderboard ETag even though the count is unchanged"""
+        response = self.client.get('/api/leaderboard/', {'team_id': self.team.pk})
+        self.post('set_members', [self.ids[0], self.ids[3]])
+        response = self.client.get('/api/leaderboard/', {'team_id': self.team.pk},
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_invalid_ids_rejected_without_changes(self):
+        """Test unknown or malformed ids reject the whole request"""
+        response = self.post('add_members', [self.ids[2], 999999])
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['user_ids'], [999999])
+        for user_ids in (['abc'], [1.5], 'all'):
+            self.assertEqual(self.post('set_members', user_ids).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.members(), set(self.ids[:2]))
+
+
+class TeamStatisticsTestCase(TestCase):
+    """Test cases for team-level activity statistics"""
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(username=name, password='testpass123') for name in ('anna', 'ben', 'cleo')]
+        self.outsider = User.objects.create_user(username='outsider', password='testpass123')
+        self.team = Team.objects.create(name='Stats Team', owner=self.users[0])
+        self.team.members.add(*self.users)
+        base = timezone.make_aware(datetime(2024, 5, 6, 9, 0))
+        for user, offset, duration, distance, calories in [
+            (self.users[0], 0, 30, 5.0, 300),
+            (self.users[0], 10, 20, 3.0, 200),
+            (self.users[1], 1, 60, 20.0, 500),
+            (self.outsider, 0, 90, 30.0, 900),
+        ]:
+            Activity.objects.create(
+                user=user, activity_type='running', duration_minutes=duration, distance_km=distance,
+                calories_burned=calories, activity_date=base + timedelta(days=offset)
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+        self.url = f'/api/teams/{self.team.pk}/statistics/'
+
+    def test_team_totals_and_member_breakdown(self):
+        """Test totals cover members only and every member is listed, busiest first"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_activities'], 3)
+        self.assertEqual(response.data['total_duration_minutes'], 110)
+        self.assertEqual(response.data['member_count'], 3)
+        self.assertEqual([member['username'] for member in response.data['members']], ['ben', 'anna', 'cleo'])
+        self.assertEqual(response.data['members'][2]['total_activities'], 0)
+
+    def test_date_window(self):
+        """Test from/to restrict the days aggregated"""
+        response = self.client.get(self.url, {'from': '2024-05-06', 'to': '2024-05-07'})
+        self.assertEqual(response.data['total_duration_minutes'], 90)
+        self.assertEqual(self.client.get(self.url, {'from': 'soon'}).status_code, status.HTTP_400_BAD_REQUEST)
+        for team_id in (ObjectId(), 'not-an-id', 999999):
+            response = self.client.get(f'/api/teams/{team_id}/statistics/')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cached_until_activity_or_membership_changes(self):
+        """Test repeat requests are served from cache and writes refresh the numbers"""
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(cache_stats()['hits'], 1)
+
+        Activity.objects.create(user=self.users[2], activity_type='yoga', duration_minutes=45,
+                                activity_date=timezone.now())
+        self.assertEqual(self.client.get(self.url).data['total_duration_minutes'], 155)
+        self.client.post(f'/api/teams/{self.team.pk}/add_members/', {'user_ids': [self.outsider.pk]}, format='json')
+        self.assertEqual(self.client.get(self.url).data['total_duration_minutes'], 245)
+
+        # An id spelled in uppercase shares the scope that writes invalidate
+        upper_url = f'/api/teams/{str(self.team.pk).upper()}/statistics/'
+        self.assertEqual(self.client.get(upper_url).data['total_duration_minutes'], 245)
+        self.client.post(f'/api/teams/{self.team.pk}/remove_members/', {'user_ids': [self.outsider.pk]}, format='json')
+        self.assertEqual(self.client.get(upper_url).data['total_duration_minutes'], 155)
+
+
+@override_settings(ANALYTICS_SYNC_SECONDS=0)
+class ActivityAnalyticsTestCase(TestCase):
+    """Test cases for the columnar activity analytics endpoints"""
+
+    def setUp(self):
+        activity_columns.reset()
+        self.users = [User.objects.create_user(username=f'runner{idx}', password='testpass123') for idx in range(4)]
+        now = timezone.now()
+        for user, days_ago, activity_type, distance in [
+            (self.users[0], 0, 'running', 5.0),
+            (self.users[0], 2, 'running', 5.0),
+            (self.users[1], 1, 'cycling', 30.0),
+            (self.users[2], 3, 'running', 2.0),
+            (self.users[3], 40, 'running', 50.0),
+        ]:
+            Activity.objects.create(
+                user=user, activity_type=activity_type, duration_minutes=30, distance_km=distance,
+                calories_burned=200, activity_date=now - timedelta(days=days_ago)
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def test_percentile_of_weekly_distance(self):
+        """Test a user's weekly total is placed among the users active that week"""
+        response = self.client.get('/api/analytics/percentile/', {'metric': 'distance'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['value'], response.data['population'], response.data['rank']), (10.0, 3, 2))
+        self.assertEqual(response.data['percentile'], 50.0)
+        response = self.client.get('/api/analytics/percentile/', {'days': 0, 'user_id': self.users[3].pk})
+        self.assertEqual((response.data['rank'], response.data['percentile']), (1, 87.5))
+
+    def test_top_and_histogram(self):
+        """Test top-K ranks users by total and histograms count users or single activities"""
+        response = self.client.get('/api/analytics/top/', {'metric': 'activities', 'days': 0, 'k': 2})
+        self.assertEqual([row['username'] for row in response.data['results']], ['runner0', 'runner1'])
+        self.assertEqual(response.data['results'][0]['value'], 2)
+        response = self.client.get('/api/analytics/top/', {'activity_type': 'running', 'k': 5})
+        self.assertEqual([row['user_id'] for row in response.data['results']], [self.users[0].pk, self.users[2].pk])
+
+        response = self.client.get('/api/analytics/histogram/', {'days': 0, 'bins': 5})
+        self.assertEqual((response.data['count'], sum(response.data['counts'])), (4, 4))
+        response = self.client.get('/api/analytics/histogram/', {'days': 0, 'per': 'activity', 'bins': 5})
+        self.assertEqual(response.data['count'], 5)
+        for params in ({'metric': 'steps'}, {'bins': 0}, {'per': 'activity', 'metric': 'activities'}):
+            response = self.client.get('/api/analytics/histogram/', params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_columns_append_and_reload(self):
+        """Test new activities are appended and edits or deletes force a reload"""
+        self.assertEqual(self.client.get('/api/analytics/footprint/').data['rows'], 5)
+        activity = Activity.objects.create(user=self.users[2], activity_type='running', duration_minutes=10,
+                                           distance_km=20.0, activity_date=timezone.now())
+        with CaptureQueriesContext(connection) as queries:
+            activity_columns.sync()
+        self.assertEqual(activity_columns.size, 6)
+        self.assertEqual(len(queries), 2)
+
+        activity.distance_km = 1.0
+        activity.save()
+        Activity.objects.filter(user=self.users[3]).delete()
+        response = self.client.get('/api/analytics/top/', {'days': 0, 'k': 1})
+        self.assertEqual(response.data['results'][0], {'rank': 1, 'user_id': self.users[1].pk, 'value': 30.0,
+                                                       'username': 'runner1'})
+        footprint = self.client.get('/api/analytics/footprint/').data
+        self.assertEqual((footprint['rows'], footprint['bytes_per_row']), (5, 25))
+        self.assertAlmostEqual(footprint['mb_per_million_rows'], 23.84)
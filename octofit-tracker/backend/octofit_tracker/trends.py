@@ -0,0 +1,106 @@
+"""Activity trend series and rolling windows built from the daily rollups
+
+The daily ActivityRollup rows are the precomputed buckets: the activity save
+and delete signals keep them current, so a trend never reads activities. One
+grouped query fetches a user's or team's (day, activity_type) buckets for the
+longest span needed; weekly and monthly series and the rolling 7/30/365-day
+windows are folded from those rows in a single pass.
+"""
+from datetime import timedelta
+from django.utils import timezone
+from .stats import TOTAL_FIELDS, clean_totals, filter_date_window, period_start, total_aggregates
+
+PERIODS = ('day', 'week', 'month')
+WINDOWS = (7, 30, 365)
+# Default series length per period, and the longest series that may be requested
+DEFAULT_DAYS = {'day': 30, 'week': 91, 'month': 365}
+MAX_DAYS = 730
+
+
+def parse_trend_params(params):
+    """Read the `period` and `days` query params"""
+    period = params.get('period', 'day')
+    if period not in PERIODS:
+        raise ValueError(f"Invalid 'period', expected one of: {', '.join(PERIODS)}")
+    try:
+        days = int(params.get('days', DEFAULT_DAYS[period]))
+    except ValueError:
+        raise ValueError("Invalid 'days', expected an integer")
+    if not 1 <= days <= MAX_DAYS:
+        raise ValueError(f"Invalid 'days', expected 1 to {MAX_DAYS}")
+    return period, days
+
+
+def next_period(start, period):
+    """First day of the period after the one starting on `start`"""
+    if period == 'week':
+        return start + timedelta(days=7)
+    if period == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def daily_buckets(rollups, start, end):
+    """(day, activity_type) totals between two days, summed over every user in the queryset"""
+    return (
+        filter_date_window(rollups, start, end)
+        .values('day', 'activity_type')
+        .annotate(**total_aggregates())
+        .order_by('day')
+    )
+
+
+def empty_totals():
+    return dict.fromkeys(TOTAL_FIELDS, 0)
+
+
+def add_totals(totals, row):
+    for field in TOTAL_FIELDS:
+        totals[field] += row[field]
+
+
+def finish_totals(totals):
+    """Round away float noise from summing distances"""
+    return {**totals, 'total_distance': round(totals['total_distance'], 3)}
+
+
+def activity_trends(rollups, period='day', days=None, today=None):
+    """Series of `period` buckets covering the last `days` days, plus rolling windows ending today
+
+    Each bucket and window carries the totals and a per-activity_type breakdown.
+    """
+    today = today or timezone.localdate()
+    days = days or DEFAULT_DAYS[period]
+    start = period_start(today - timedelta(days=days - 1), period)
+    window_starts = {window: today - timedelta(days=window - 1) for window in WINDOWS}
+    fetch_start = min(start, *window_starts.values())
+
+    buckets = {}
+    bucket = start
+    while bucket <= today:
+        buckets[bucket] = (empty_totals(), {})
+        bucket = next_period(bucket, period)
+    windows = {window: (empty_totals(), {}) for window in WINDOWS}
+
+    for row in daily_buckets(rollups, fetch_start, today):
+        row = {'day': row['day'], 'activity_type': row['activity_type'], **clean_totals(row)}
+        targets = [windows[window] for window, first_day in window_starts.items() if row['day'] >= first_day]
+        if row['day'] >= start:
+            targets.append(buckets[period_start(row['day'], period)])
+        for totals, by_type in targets:
+            add_totals(totals, row)
+            add_totals(by_type.setdefault(row['activity_type'], empty_totals()), row)
+
+    def render(totals, by_type):
+        return {
+            **finish_totals(totals),
+            'by_type': {name: finish_totals(by_type[name]) for name in sorted(by_type)},
+        }
+
+    return {
+        'period': period,
+        'from': start.isoformat(),
+        'to': today.isoformat(),
+        'series': [{'period': bucket.isoformat(), **render(*values)} for bucket, values in buckets.items()],
+        'windows': {f'{window}d': render(*windows[window]) for window in WINDOWS},
+    }
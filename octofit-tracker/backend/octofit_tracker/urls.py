@@ -19,9 +19,11 @@ from django.urls import path, include
 from rest_framework import routers
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from . import async_views
 from .views import (
     UserViewSet, UserProfileViewSet, TeamViewSet, ActivityViewSet,
-    LeaderboardViewSet, WorkoutViewSet
+    LeaderboardViewSet, WorkoutViewSet, AnalyticsViewSet, database_health, job_queue_health,
+    prometheus_metrics
 )
 
 # Use environment variable for codespace name
@@ -37,6 +39,7 @@ router.register(r'teams', TeamViewSet, basename='team')
 router.register(r'activities', ActivityViewSet, basename='activity')
 router.register(r'leaderboard', LeaderboardViewSet, basename='leaderboard')
 router.register(r'workouts', WorkoutViewSet, basename='workout')
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
 
 # API root view
 @api_view(['GET'])
@@ -61,6 +64,15 @@ base_url = api_base_url
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', api_root, name='api-root'),
+    path('api/health/db/', database_health, name='health-db'),
+    path('api/health/jobs/', job_queue_health, name='health-jobs'),
+    path('api/metrics/', prometheus_metrics, name='metrics'),
+    # Async read path (asgi.py); the async ORM still runs each query on a thread via sync_to_async
+    path('api/async/activities/', async_views.activity_list, name='async-activity-list'),
+    path('api/async/activities/statistics/', async_views.activity_statistics, name='async-activity-statistics'),
+    path('api/async/leaderboard/', async_views.leaderboard_list, name='async-leaderboard-list'),
+    path('api/async/leaderboard/top_performers/', async_views.top_performers, name='async-top-performers'),
+    path('api/async/workouts/suggestions/', async_views.workout_suggestions, name='async-workout-suggestions'),
     path('api/', include(router.urls)),
     path('api-auth/', include('rest_framework.urls')),
 ]
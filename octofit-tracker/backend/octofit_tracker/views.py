@@ -1,16 +1,62 @@
+from collections import Counter
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from django.contrib.auth.models import User
-from .models import UserProfile, Team, Activity, Leaderboard, Workout
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from pymongo.errors import PyMongoError
+from .models import UserProfile, Team, Activity, ActivityRollup, Leaderboard, Workout
+from .mongo import is_duplicate_key_error, parse_pk
 from .serializers import (
     UserSerializer, UserProfileSerializer, TeamSerializer,
-    ActivitySerializer, LeaderboardSerializer, WorkoutSerializer
+    ActivitySerializer, LeaderboardSerializer, WorkoutSerializer,
+    FieldsetViewMixin, fieldset_key
 )
+from .fast_serializers import (
+    FastListMixin, fast_activity_serializer, fast_leaderboard_serializer, fast_workout_serializer
+)
+from .exports import CONTENT_TYPES, export_lines
+from .ingest import ingest_activities
+from .parsers import NDJSONParser
+from .pagination import ActivityCursorPagination, LeaderboardCursorPagination, WorkoutCursorPagination
+from .membership import ADD, REMOVE, SET, change_members, parse_user_ids, unknown_users
+from .jobs import enqueue_suggestion_refreshes, enqueue_team_recomputes, enqueue_user_teams, queue_depth
+from .monitoring import pool_monitor, round_trip_ms
+from . import metrics
+from .conditional import ConditionalGetMixin, leaderboard_querysets
+from .analytics import (
+    activity_columns, histogram, parse_analytics_params, percentile_rank, top_users, window_mask
+)
+from .caching import GLOBAL_SCOPE, cache_stats, cached_response_data, team_scope
+from .stats import (
+    activity_totals, filter_date_window, grouped_activity_totals, member_totals,
+    parse_date_window, parse_group_by, sum_totals
+)
+from .suggestions import refresh_suggestions
+from .trends import activity_trends, parse_trend_params
+
+
+class ObjectIdLookupMixin:
+    """Convert the URL id of detail routes with parse_pk(), answering 404 when it is malformed"""
 
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in self.kwargs:
+            pk = parse_pk(self.get_queryset().model, self.kwargs[lookup_url_kwarg])
+            if pk is None:
+                raise Http404
+            self.kwargs[lookup_url_kwarg] = pk
 
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
+
+class UserViewSet(FieldsetViewMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for User model"""
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -23,7 +69,7 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
 
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(ConditionalGetMixin, FieldsetViewMixin, viewsets.ModelViewSet):
     """ViewSet for UserProfile model"""
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
@@ -31,16 +77,23 @@ class UserProfileViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """Filter profiles based on user"""
+        profiles = UserProfile.objects.all()
         if self.request.user.is_staff:
-            return UserProfile.objects.all()
-        return UserProfile.objects.filter(user=self.request.user)
+            return profiles
+        return profiles.filter(user=self.request.user)
 
     def perform_create(self, serializer):
-        """Assign current user to profile"""
-        serializer.save(user=self.request.user)
+        """Assign current user to profile and build their workout suggestions"""
+        profile = serializer.save(user=self.request.user)
+        refresh_suggestions([profile.user_id])
+
+    def perform_update(self, serializer):
+        """Save the profile and rebuild suggestions for its fitness level"""
+        profile = serializer.save()
+        refresh_suggestions([profile.user_id])
 
 
-class TeamViewSet(viewsets.ModelViewSet):
+class TeamViewSet(ObjectIdLookupMixin, FieldsetViewMixin, viewsets.ModelViewSet):
     """ViewSet for Team model"""
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
@@ -58,6 +111,7 @@ class TeamViewSet(viewsets.ModelViewSet):
         try:
             user = User.objects.get(id=user_id)
             team.members.add(user)
+            enqueue_team_recomputes([team.pk])
             return Response({'status': 'member added'}, status=status.HTTP_200_OK)
         except User.DoesNotExist:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -70,106 +124,448 @@ class TeamViewSet(viewsets.ModelViewSet):
         try:
             user = User.objects.get(id=user_id)
             team.members.remove(user)
+            enqueue_team_recomputes([team.pk])
             return Response({'status': 'member removed'}, status=status.HTTP_200_OK)
         except User.DoesNotExist:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
+    def change_members(self, request, mode):
+        """Validate a list of user ids and apply it to the team's membership as one diff"""
+        team = self.get_object()
+        try:
+            user_ids = parse_user_ids(request.data)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        missing = unknown_users(user_ids) if mode != REMOVE else []
+        if missing:
+            return Response({'error': 'User not found', 'user_ids': missing}, status=status.HTTP_404_NOT_FOUND)
+        result = change_members(team, user_ids, mode)
+        if result['added'] or result['removed']:
+            enqueue_team_recomputes([team.pk])
+        return Response(result, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def add_members(self, request, pk=None):
+        """Add a list of users to the team"""
+        return self.change_members(request, ADD)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def remove_members(self, request, pk=None):
+        """Remove a list of users from the team"""
+        return self.change_members(request, REMOVE)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def set_members(self, request, pk=None):
+        """Replace the team's members with exactly the given users"""
+        return self.change_members(request, SET)
+
+    @action(detail=True, methods=['get'])
+    def statistics(self, request, pk=None):
+        """Get the team's combined activity totals with a per-member breakdown, optionally windowed"""
+        try:
+            start, end = parse_date_window(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        team_pk = parse_pk(Team, pk)
+        if team_pk is None:
+            raise Http404
 
-class ActivityViewSet(viewsets.ModelViewSet):
+        def build():
+            team = get_object_or_404(Team.objects.only('pk'), pk=team_pk)
+            # One grouped query over the rollups, joined through the membership table
+            rollups = filter_date_window(ActivityRollup.objects.filter(user__teams=team.pk), start, end)
+            totals = member_totals(rollups)
+            members = [
+                {'user_id': user_id, 'username': username, **totals.get(user_id, sum_totals([]))}
+                for user_id, username in team.members.values_list('id', 'username')
+            ]
+            members.sort(key=lambda member: (-member['total_duration_minutes'], member['username']))
+            return {
+                'team_id': str(team.pk),
+                'from': start.isoformat() if start else None,
+                'to': end.isoformat() if end else None,
+                'member_count': len(members),
+                **sum_totals(members),
+                'members': members,
+            }
+
+        # Cache hits skip the database entirely; activity and membership writes bump the team's scope
+        return Response(cached_response_data(
+            team_scope(team_pk), 'statistics', request.query_params.urlencode(), build
+        ))
+
+
+class ActivityViewSet(ObjectIdLookupMixin, FieldsetViewMixin, FastListMixin, viewsets.ModelViewSet):
     """ViewSet for Activity model"""
     queryset = Activity.objects.all()
     serializer_class = ActivitySerializer
+    fast_serializer = fast_activity_serializer
+    pagination_class = ActivityCursorPagination
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         """Filter activities for current user"""
         user = self.request.user
+        activities = Activity.objects.all()
         if self.request.query_params.get('user_id'):
             user_id = self.request.query_params.get('user_id')
-            return Activity.objects.filter(user_id=user_id)
-        return Activity.objects.filter(user=user)
+            return activities.filter(user_id=user_id)
+        return activities.filter(user=user)
+
+    def get_rollup_queryset(self):
+        """Daily rollups for the user whose activities are being viewed"""
+        user_id = self.request.query_params.get('user_id') or self.request.user.pk
+        return ActivityRollup.objects.filter(user_id=user_id)
+
+    def create(self, request, *args, **kwargs):
+        """Create an activity, or return the stored one with 200 when its idempotency key was used before"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            self.perform_create(serializer)
+        except DatabaseError as exc:
+            if not is_duplicate_key_error(exc):
+                raise
+            key = serializer.validated_data['idempotency_key']
+            existing = Activity.objects.filter(user=request.user, idempotency_key=key).first()
+            return Response(self.get_serializer(existing).data, status=status.HTTP_200_OK)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
     def perform_create(self, serializer):
-        """Assign current user to activity"""
-        serializer.save(user=self.request.user)
+        """Assign current user to activity; rollups are updated by the save signal"""
+        activity = serializer.save(user=self.request.user)
+        enqueue_user_teams([activity.user_id])
+        enqueue_suggestion_refreshes([activity.user_id])
+
+    def perform_update(self, serializer):
+        """Save the activity and queue leaderboard recomputes and a suggestion refresh"""
+        try:
+            activity = serializer.save()
+        except DatabaseError as exc:
+            if not is_duplicate_key_error(exc):
+                raise
+            raise ValidationError({'idempotency_key': ['Another activity already uses this idempotency key.']})
+        enqueue_user_teams([activity.user_id])
+        enqueue_suggestion_refreshes([activity.user_id])
+
+    def perform_destroy(self, instance):
+        """Delete the activity and queue leaderboard recomputes and a suggestion refresh"""
+        instance.delete()
+        enqueue_user_teams([instance.user_id])
+        enqueue_suggestion_refreshes([instance.user_id])
+
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """Create a batch of activities from a JSON array or NDJSON stream"""
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'error': 'Expected a list of activities'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.ACTIVITY_BULK_MAX_ITEMS:
+            return Response(
+                {'error': f'At most {settings.ACTIVITY_BULK_MAX_ITEMS} activities per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = ingest_activities(request.user, items)
+        counts = Counter(result['status'] for result in results)
+        if counts['created']:
+            enqueue_user_teams([request.user.pk])
+            enqueue_suggestion_refreshes([request.user.pk])
+        return Response({
+            'created': counts['created'],
+            'duplicates': counts['duplicate'],
+            'invalid': counts['invalid'],
+            'results': results,
+        }, status=status.HTTP_201_CREATED if counts['created'] else status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the full activity history as NDJSON or CSV with constant memory"""
+        output = request.query_params.get('output', 'ndjson')
+        if output not in CONTENT_TYPES:
+            return Response(
+                {'error': f"Invalid 'output', expected one of: {', '.join(CONTENT_TYPES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        response = StreamingHttpResponse(
+            export_lines(self.get_queryset(), output),
+            content_type=CONTENT_TYPES[output]
+        )
+        response['Content-Disposition'] = f'attachment; filename="activities.{output}"'
+        return response
 
     @action(detail=False, methods=['get'])
     def statistics(self, request):
-        """Get activity statistics for current user"""
-        activities = self.get_queryset()
-        total_activities = activities.count()
-        total_calories = sum(a.calories_burned or 0 for a in activities)
-        total_distance = sum(a.distance_km or 0 for a in activities)
-        total_duration = sum(a.duration_minutes for a in activities)
+        """Get activity statistics for current user, optionally grouped and windowed"""
+        try:
+            start, end = parse_date_window(request.query_params)
+            group_by = parse_group_by(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({
-            'total_activities': total_activities,
-            'total_calories': total_calories,
-            'total_distance': total_distance,
-            'total_duration_minutes': total_duration,
-        })
+        rollups = filter_date_window(self.get_rollup_queryset(), start, end)
+        if not group_by:
+            return Response(activity_totals(rollups))
+
+        groups = grouped_activity_totals(rollups, group_by)
+        return Response({**sum_totals(groups), 'group_by': group_by, 'groups': groups})
+
+    @action(detail=False, methods=['get'])
+    def trends(self, request):
+        """Daily, weekly or monthly activity series with rolling 7/30/365-day windows, for a user or team"""
+        try:
+            period, days = parse_trend_params(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        team_id = request.query_params.get('team_id')
+        if not team_id:
+            return Response(activity_trends(self.get_rollup_queryset(), period, days))
+        team_pk = parse_pk(Team, team_id)
+        # exists() selects a constant, which djongo cannot translate; count() it can
+        if team_pk is None or not Team.objects.filter(pk=team_pk).count():
+            return Response({'error': 'Team not found'}, status=status.HTTP_404_NOT_FOUND)
+        member_ids = list(Team.members.through.objects.filter(team_id=team_pk).values_list('user_id', flat=True))
+        rollups = ActivityRollup.objects.filter(user_id__in=member_ids)
+        return Response({'team_id': team_id, **activity_trends(rollups, period, days)})
 
 
-class LeaderboardViewSet(viewsets.ReadOnlyModelViewSet):
+class LeaderboardViewSet(
+    ObjectIdLookupMixin, ConditionalGetMixin, FieldsetViewMixin, FastListMixin, viewsets.ReadOnlyModelViewSet
+):
     """ViewSet for Leaderboard model"""
     queryset = Leaderboard.objects.all()
     serializer_class = LeaderboardSerializer
+    fast_serializer = fast_leaderboard_serializer
+    pagination_class = LeaderboardCursorPagination
     permission_classes = [IsAuthenticatedOrReadOnly]
 
     def get_queryset(self):
         """Filter leaderboard by team"""
         team_id = self.request.query_params.get('team_id')
+        leaderboard = Leaderboard.objects.all()
         if team_id:
-            return Leaderboard.objects.filter(team_id=team_id).order_by('rank')
-        return Leaderboard.objects.all().order_by('rank')
+            team_pk = parse_pk(Team, team_id)
+            if team_pk is None:
+                return leaderboard.none()
+            return leaderboard.filter(team_id=team_pk).order_by('rank')
+        return leaderboard.order_by('rank')
+
+    def etag_querysets(self):
+        """Leaderboard entries plus the teams and memberships embedded in them"""
+        return leaderboard_querysets(self.request.query_params.get('team_id'))
+
+    def list(self, request, *args, **kwargs):
+        """List leaderboard entries, served from cache until the team's data changes"""
+        team_id = request.query_params.get('team_id')
+        team_pk = parse_pk(Team, team_id) if team_id else None
+        if team_id and team_pk is None:
+            # A malformed team_id matches no entries, so there is nothing to cache
+            return super().list(request, *args, **kwargs)
+        # Scoped by the canonical id invalidation uses, not however the client spelled it
+        scope = team_scope(team_pk)
+        # Skips ConditionalGetMixin.list, which would check the ETag a second time
+        return self.conditional(lambda: Response(cached_response_data(
+            scope, 'list', request.query_params.urlencode(),
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs).data
+        )))
 
     @action(detail=False, methods=['get'])
     def top_performers(self, request):
         """Get top 10 performers"""
-        leaderboard = Leaderboard.objects.all().order_by('rank')[:10]
-        serializer = self.get_serializer(leaderboard, many=True)
-        return Response(serializer.data)
+        def build():
+            leaderboard = self.optimize(Leaderboard.objects.all()).order_by('rank')[:10]
+            return self.get_serializer(leaderboard, many=True).data
+
+        return self.conditional(
+            lambda: Response(cached_response_data(
+                GLOBAL_SCOPE, 'top_performers', fieldset_key(request.query_params), build
+            )),
+            leaderboard_querysets()
+        )
+
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """Get leaderboard cache hit and miss counters"""
+        return Response(cache_stats())
 
 
-class WorkoutViewSet(viewsets.ModelViewSet):
+class WorkoutViewSet(ObjectIdLookupMixin, ConditionalGetMixin, FieldsetViewMixin, FastListMixin, viewsets.ModelViewSet):
     """ViewSet for Workout model"""
     queryset = Workout.objects.all()
     serializer_class = WorkoutSerializer
+    fast_serializer = fast_workout_serializer
+    pagination_class = WorkoutCursorPagination
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         """Filter workouts for current user"""
         user = self.request.user
+        workouts = Workout.objects.all()
         if self.request.query_params.get('completed'):
             completed = self.request.query_params.get('completed').lower() == 'true'
-            return Workout.objects.filter(user=user, is_completed=completed)
-        return Workout.objects.filter(user=user)
+            return workouts.filter(user=user, is_completed=completed)
+        return workouts.filter(user=user)
 
     def perform_create(self, serializer):
-        """Assign current user to workout"""
-        serializer.save(user=self.request.user)
+        """Assign current user to workout and fit it into their suggestions"""
+        workout = serializer.save(user=self.request.user)
+        refresh_suggestions([workout.user_id])
+
+    def perform_update(self, serializer):
+        """Save the workout and rebuild the user's suggestions around it"""
+        workout = serializer.save()
+        refresh_suggestions([workout.user_id])
+
+    def perform_destroy(self, instance):
+        """Delete the workout and fill its place in the user's suggestions"""
+        instance.delete()
+        refresh_suggestions([instance.user_id])
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def mark_complete(self, request, pk=None):
-        """Mark a workout as completed"""
+        """Mark a workout as completed and replace it in the user's suggestions"""
         workout = self.get_object()
         workout.is_completed = True
-        workout.save()
+        workout.suggestion_rank = 0
+        workout.save(update_fields=['is_completed', 'suggestion_rank', 'updated_at'])
+        refresh_suggestions([workout.user_id])
         serializer = self.get_serializer(workout)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['post'])
+    def complete(self, request):
+        """Mark a batch of the current user's workouts completed with a single update"""
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not ids:
+            return Response({'error': "Expected a non-empty list of workout 'ids'"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > settings.WORKOUT_BULK_MAX_ITEMS:
+            return Response(
+                {'error': f'At most {settings.WORKOUT_BULK_MAX_ITEMS} workouts per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        requested, not_found = {}, []
+        for workout_id in ids:
+            # parse_pk() passes some non-string values through unchanged, and they may not be hashable
+            pk = parse_pk(Workout, workout_id) if isinstance(workout_id, str) else None
+            if pk is None:
+                not_found.append(workout_id)
+            else:
+                requested[pk] = workout_id
+        workouts = Workout.objects.filter(user=request.user, pk__in=list(requested))
+        # djongo cannot translate the bare NOT "is_completed" that is_completed=False renders to
+        completed = workouts.filter(is_completed__in=[False]).update(
+            is_completed=True, suggestion_rank=0, updated_at=timezone.now()
+        )
+        already_completed = 0
+        if completed < len(requested):
+            # Only look the ids up again when some were not updated
+            found = set(workouts.values_list('pk', flat=True))
+            already_completed = len(found) - completed
+            not_found += [workout_id for pk, workout_id in requested.items() if pk not in found]
+        if completed:
+            refresh_suggestions([request.user.pk])
+        return Response({'completed': completed, 'already_completed': already_completed, 'not_found': not_found})
+
     @action(detail=False, methods=['get'])
     def suggestions(self, request):
-        """Get personalized workout suggestions for current user"""
+        """Get the current user's materialized workout suggestions, in order"""
+        workouts = self.optimize(Workout.objects.all()).filter(
+            user=request.user, suggestion_rank__gt=0
+        ).order_by('suggestion_rank')
+        return self.conditional(lambda: Response(self.get_serializer(workouts, many=True).data), [workouts])
+
+
+class AnalyticsViewSet(viewsets.ViewSet):
+    """Percentile, histogram and top-K queries over in-memory activity columns"""
+    permission_classes = [IsAuthenticated]
+
+    def query(self, request, answer, default_days=7):
+        """Parse the shared params, then answer from a snapshot of the columns"""
+        try:
+            metric, days, activity_type = parse_analytics_params(request.query_params, default_days)
+            columns = activity_columns.snapshot()
+            mask = window_mask(columns, days, activity_type)
+            data = answer(columns, metric, mask)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'metric': metric, 'days': days, 'activity_type': activity_type, **data})
+
+    @action(detail=False, methods=['get'])
+    def percentile(self, request):
+        """Get the percentile of a user's total (the current user's by default) among active users"""
+        try:
+            user_id = int(request.query_params.get('user_id') or request.user.pk)
+        except ValueError:
+            return Response({'error': "Invalid 'user_id'"}, status=status.HTTP_400_BAD_REQUEST)
+        return self.query(request, lambda columns, metric, mask: percentile_rank(columns, user_id, metric, mask))
+
+    @action(detail=False, methods=['get'])
+    def histogram(self, request):
+        """Get the distribution of per-user totals, or of single activities with per=activity"""
+        per = request.query_params.get('per', 'user')
         try:
-            profile = request.user.profile
-            fitness_level = profile.fitness_level
-            workouts = Workout.objects.filter(
-                user=request.user,
-                fitness_level=fitness_level,
-                is_completed=False
-            ).order_by('suggested_date')
-            serializer = self.get_serializer(workouts, many=True)
-            return Response(serializer.data)
-        except UserProfile.DoesNotExist:
-            return Response({'error': 'User profile not found'}, status=status.HTTP_404_NOT_FOUND)
+            bins = int(request.query_params.get('bins', 20))
+        except ValueError:
+            bins = 0
+        if per not in ('user', 'activity') or not 1 <= bins <= 200:
+            return Response({'error': "Expected 'per' of user or activity and 'bins' from 1 to 200"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return self.query(request, lambda columns, metric, mask: histogram(columns, metric, mask, bins, per))
+
+    @action(detail=False, methods=['get'])
+    def top(self, request):
+        """Get the users with the highest totals, with usernames"""
+        try:
+            k = int(request.query_params.get('k', 10))
+        except ValueError:
+            k = 0
+        if not 1 <= k <= 100:
+            return Response({'error': "Invalid 'k', expected 1 to 100"}, status=status.HTTP_400_BAD_REQUEST)
+
+        def answer(columns, metric, mask):
+            results = top_users(columns, metric, mask, k)
+            usernames = dict(User.objects.filter(id__in=[row['user_id'] for row in results])
+                             .values_list('id', 'username'))
+            return {'results': [{**row, 'username': usernames.get(row['user_id'])} for row in results]}
+
+        return self.query(request, answer)
+
+    @action(detail=False, methods=['get'])
+    def footprint(self, request):
+        """Get the rows held in memory and their footprint per million rows"""
+        return Response(activity_columns.footprint())
+
+
+@api_view(['GET'])
+def database_health(request):
+    """Database round-trip latency and connection pool utilization"""
+    client_options = connection.settings_dict.get('CLIENT', {})
+    max_pool_size = client_options.get('maxPoolSize')
+    data = {
+        'status': 'ok',
+        'vendor': connection.vendor,
+        'conn_max_age': connection.settings_dict.get('CONN_MAX_AGE'),
+        'pool_options': {key: value for key, value in client_options.items() if key != 'host'},
+    }
+    try:
+        data['round_trip_ms'] = round_trip_ms()
+    except (DatabaseError, PyMongoError) as exc:
+        data.update(status='unavailable', error=str(exc))
+    data.update(pool_monitor.snapshot(max_pool_size))
+    return Response(data, status=status.HTTP_200_OK if data['status'] == 'ok' else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@api_view(['GET'])
+def job_queue_health(request):
+    """Background job queue depth by status and kind"""
+    return Response(queue_depth())
+
+
+def prometheus_metrics(request):
+    """Request metrics in the Prometheus text exposition format"""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')